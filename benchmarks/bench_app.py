@@ -0,0 +1,91 @@
+"""benchmarks for App serialisation and syncing
+
+run from the repository root:
+
+    python -m benchmarks.bench_app
+"""
+import copy
+import json
+import os
+import tempfile
+import time
+from neuromake.wildcard import Wildcard
+from neuromake.menu import Menu
+from neuromake.app import App
+from neuromake.app.app import _menu_from_dict
+
+N_SUBJECTS = 100000
+
+def _timed(func):
+    t0 = time.perf_counter()
+    func()
+    return time.perf_counter() - t0
+
+def _app(n):
+    subjects = [ f'{i:06d}' for i in range(n) ]
+    return App(name='bench',menu=[
+        Menu('bids',[Wildcard('subject',subjects,{'iterable':True}),Wildcard('session','pre')]),
+        Menu('settings',[ Wildcard(f'opt{i}',i) for i in range(1000) ])
+    ])
+
+def bench_patch():
+    '''sync one added subject: full json reload vs diff/apply_patch'''
+    login = _app(N_SUBJECTS)
+    node = _app(N_SUBJECTS)
+    login.get_menu('bids').get_wildcard('subject').append('new')
+
+    full = json.dumps(login.to_dict(metadata=True))
+    patch = json.dumps(node.diff(login))
+
+    def reload():
+        data = json.loads(full)['bench']
+        App(name='bench',menu=[ _menu_from_dict(name,menu_data) for name,menu_data in data.items() ])
+    reload_time = _timed(reload)
+    apply_time = _timed(lambda: node.apply_patch(json.loads(patch)))
+    print(f'sync     {N_SUBJECTS} subjects   full json {len(full)/1e6:.2f} MB reloaded in {reload_time*1e3:7.1f} ms   patch {len(patch)} B applied in {apply_time*1e3:6.2f} ms')
+
+def bench_snapshot():
+    '''undo point: deepcopy vs snapshot, before and after a one-value edit'''
+    app = _app(N_SUBJECTS)
+    app.snapshot()
+    deepcopy_time = _timed(lambda: copy.deepcopy(app))
+    unchanged = _timed(app.snapshot)
+    app.get_menu('settings').get_wildcard('opt0').value = -1
+    edited = _timed(app.snapshot)
+    print(f'snapshot {N_SUBJECTS} subjects   deepcopy {deepcopy_time*1e3:9.1f} ms   unchanged {unchanged*1e6:6.1f} us   1 edit {edited*1e3:6.2f} ms')
+
+def bench_load_cache():
+    '''load a saved config: json parsing and validation vs the binary cache'''
+    many_wildcards = App(name='bench',menu=[
+        Menu(f'menu{j}',[ Wildcard(f'var{i}',[i,i+1],{'iterable':True,'var_type':'int','min_val':-1}) for i in range(2000) ])
+        for j in range(10)
+    ])
+    for name,app in [('20000 wildcards',many_wildcards),(f'{N_SUBJECTS} subjects',_app(N_SUBJECTS))]:
+        with tempfile.TemporaryDirectory() as tmp:
+            cfg_path = os.path.join(tmp,'neuromake.json')
+            app.cache = True
+            app.save(cfg_path)
+            json_time = _timed(lambda: App(cfg_path=cfg_path,cache=False))
+            cache_time = _timed(lambda: App(cfg_path=cfg_path,cache=True))
+            print(f'load     {name:<16} json {json_time*1e3:9.1f} ms   cache {cache_time*1e3:7.1f} ms   ({json_time/cache_time:.1f}x)')
+
+def bench_lazy():
+    '''read one small menu from a large config: full load vs lazy load'''
+    app = App(name='bench',menu=[
+        Menu(f'menu{j}',[ Wildcard(f'var{i}',[i,i+1],{'iterable':True,'var_type':'int','min_val':-1}) for i in range(2000) ])
+        for j in range(10)
+    ] + [Menu('templates',Wildcard('bold','sub-{subject}_bold.nii.gz'))])
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg_path = os.path.join(tmp,'neuromake.json')
+        app.cache = True
+        app.save(cfg_path)
+        for cache in [False,True]:
+            full = _timed(lambda: App(cfg_path=cfg_path,cache=cache).get_menu('templates'))
+            lazy = _timed(lambda: App(cfg_path=cfg_path,cache=cache,lazy=True).get_menu('templates'))
+            print(f'lazy     cache={cache!s:<5}      full {full*1e3:9.1f} ms   lazy {lazy*1e3:7.1f} ms   ({full/lazy:.0f}x)')
+
+if __name__ == '__main__':
+    bench_patch()
+    bench_snapshot()
+    bench_load_cache()
+    bench_lazy()
@@ -0,0 +1,93 @@
+"""benchmarks for batch BIDS filename parsing
+
+run from the repository root:
+
+    python -m benchmarks.bench_bids
+"""
+import os
+import re
+import json
+import time
+import tempfile
+import importlib.resources
+from neuromake.bids import parse_bids_filenames, classify_bids_filenames
+from neuromake.bidsindex import BidsIndex
+
+N = 1000000
+
+with importlib.resources.open_text('neuromake.resources','keynames.json') as x:
+    KEYNAMES = json.load(x)
+
+def _filenames(n):
+    tasks = ['rest','mid','nback','sst']
+    names = []
+    for i in range(n):
+        sub = f'{i // 40:05d}'
+        names.append(f'sub-{sub}/ses-1/func/sub-{sub}_ses-1_task-{tasks[i % 4]}_acq-mb_run-{i % 10 + 1}_bold.nii.gz')
+    return names
+
+def _parse_one(bidsfile):
+    '''per-file parsing as in utils.get_bids_vars_dict(add_prefix=False)'''
+    b = re.split('-|_',os.path.basename(bidsfile))
+    b.insert(-1,'suffix')
+    b[-1],ext = b[-1].split('.',1)
+    d = { b[i]:b[i+1] for i in range(0,len(b),2) }
+    d['extension'] = ext
+    label2key = { v:k for k,v in KEYNAMES.items() }
+    kesc = [ re.escape(k) for k in label2key ]
+    pattern = re.compile('$|'.join(kesc)+'$')
+    return { pattern.sub(lambda m: label2key[m.group(0)],k):v for k,v in d.items() }
+
+def bench_parse():
+    '''parse 1M filenames: per-file dicts (on a sample) vs one columnar pass'''
+    names = _filenames(N)
+    sample = names[:20000]
+    t0 = time.perf_counter()
+    for name in sample:
+        _parse_one(name)
+    t = (time.perf_counter() - t0) * N / len(sample)
+    t0 = time.perf_counter()
+    table = parse_bids_filenames(names)
+    batch = time.perf_counter() - t0
+    assert table.row(123) == _parse_one(names[123])
+    print(f'parse    {N} names   per-file ~{t:6.2f} s (extrapolated)   batch {batch:6.2f} s   ({N/batch*60/1e6:5.1f}M names/min)')
+
+def bench_classify():
+    '''validate and classify 1M filenames against the bids_info.json grammars'''
+    names = _filenames(N)
+    names[::1000] = [ name.replace('_run-','_run-x') for name in names[::1000] ]
+    t0 = time.perf_counter()
+    n_invalid = 0
+    for result in classify_bids_filenames(names):
+        if result is None:
+            n_invalid += 1
+    t = time.perf_counter() - t0
+    assert n_invalid == N // 1000
+    print(f'classify {N} names   {t:6.2f} s   ({N/t*60/1e6:5.1f}M names/min, {n_invalid} invalid)')
+
+def bench_index():
+    '''build, save, load and query an index of 1M files (no filesystem crawl)'''
+    names = _filenames(N)
+    names += [ name.replace('.nii.gz','.json') for name in names[:N//2] ]
+    t0 = time.perf_counter()
+    index = BidsIndex.from_paths('/data/bids',names)
+    build = time.perf_counter() - t0
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d,'index.pkl')
+        index.save(path)
+        t0 = time.perf_counter()
+        index = BidsIndex.load(path)
+        load = time.perf_counter() - t0
+    query = {'subject':'01234','task':'mid','run':'2','extension':['nii.gz','nii']}
+    n_queries = 10000
+    t0 = time.perf_counter()
+    for _ in range(n_queries):
+        files = index.get(**query)
+    t = (time.perf_counter() - t0) / n_queries
+    assert len(files) == 2
+    print(f'index    {len(names)} files   build {build:6.2f} s   load {load:6.2f} s   query {t*1e6:6.1f} us')
+
+if __name__ == '__main__':
+    bench_parse()
+    bench_classify()
+    bench_index()
@@ -0,0 +1,62 @@
+"""benchmarks for streaming template expansion
+
+run from the repository root:
+
+    python -m benchmarks.bench_expand
+"""
+import itertools as it
+import os
+import tempfile
+import time
+import tracemalloc
+from neuromake.expand import Expansion
+from neuromake.manifest import write_manifest, read_manifest
+
+BIDS = {
+    'subject':[ f'{i:04d}' for i in range(3000) ],
+    'func_task':['rest','mid','nback','sst'],
+    'func_run':[ str(i) for i in range(1,6) ],
+    'func_echo':[ str(i) for i in range(1,5) ],
+}
+TEMPLATES = [
+    'sub-{subject}/func/sub-{subject}_task-{func_task}_run-{func_run}_echo-{func_echo}_bold.nii.gz',
+    'sub-{subject}/func/sub-{subject}_task-{func_task}_run-{func_run}_echo-{func_echo}_bold.json',
+    'sub-{subject}/func/sub-{subject}_task-{func_task}_run-{func_run}_desc-confounds.tsv',
+    'sub-{subject}/anat/sub-{subject}_T1w.nii.gz',
+]
+
+def _expand_list(templates,wildcards):
+    '''snakemake-style expand: the full product of every wildcard, as a list'''
+    keys = list(wildcards.keys())
+    return [ t.format(**dict(zip(keys,combo))) for t in templates for combo in it.product(*wildcards.values()) ]
+
+def _measure(name,func):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    n = func()
+    t = time.perf_counter() - t0
+    _,peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:<24} {n:>9} paths   {t:6.2f} s   peak {peak/1024**2:8.1f} MiB')
+
+def bench_expand():
+    '''expand TEMPLATES over BIDS as a materialised list vs a streaming Expansion'''
+    _measure('list (expand-style)',lambda: len(_expand_list(TEMPLATES,BIDS)))
+    _measure('Expansion (stream)',lambda: sum(1 for _ in Expansion(TEMPLATES,BIDS)))
+    _measure('Expansion (chunks)',lambda: sum(len(c) for c in Expansion(TEMPLATES,BIDS).chunks(10000)))
+    _measure('Expansion (len only)',lambda: len(Expansion(TEMPLATES,BIDS)))
+
+def bench_manifest():
+    '''targets for a DAG build: expand every time vs read a precompiled manifest'''
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp,'targets.txt')
+        t0 = time.perf_counter()
+        write_manifest(path,TEMPLATES,BIDS)
+        print(f'{"manifest (write)":<24} {time.perf_counter() - t0:6.2f} s')
+        _measure('manifest (up to date)',lambda: int(write_manifest(path,TEMPLATES,BIDS)))
+        _measure('manifest (read all)',lambda: len(read_manifest(path)))
+        _measure('manifest (one subject)',lambda: len(read_manifest(path,subject='0042')))
+
+if __name__ == '__main__':
+    bench_expand()
+    bench_manifest()
@@ -0,0 +1,39 @@
+"""tracemalloc memory benchmarks for generated Apps
+
+run from the repository root:
+
+    python -m benchmarks.bench_memory
+"""
+import gc
+import tracemalloc
+from neuromake.wildcard import Wildcard, PathWildcard, TemplateWildcard
+from neuromake.menu import Menu
+from neuromake.app import App
+
+N_MENUS = 20
+N_WILDCARDS = 500
+
+def _build_app():
+    '''build a large App of near-identical bids-style wildcards'''
+    menus = []
+    for i in range(N_MENUS):
+        wildcards = [
+            Wildcard(f'var{j}',None,{'var_type':'str','iterable':True,'required':j==0})
+            for j in range(N_WILDCARDS)
+        ]
+        menus.append(Menu(f'menu{i}',wildcard=wildcards,metadata={'required':True}))
+    return App(name='bench',menu=menus)
+
+def bench_app_memory():
+    '''peak and retained memory of an App with N_MENUS * N_WILDCARDS wildcards'''
+    gc.collect()
+    tracemalloc.start()
+    app = _build_app()
+    retained,peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n = N_MENUS * N_WILDCARDS
+    print(f'{n} wildcards: retained {retained/1024:9.1f} KiB ({retained/n:6.1f} B/wildcard)   peak {peak/1024:9.1f} KiB')
+    return app
+
+if __name__ == '__main__':
+    bench_app_memory()
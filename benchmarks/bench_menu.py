@@ -0,0 +1,114 @@
+"""benchmarks for Menu operations on large menus
+
+run from the repository root:
+
+    python -m benchmarks.bench_menu
+"""
+import time
+import neuromake.exceptions as err
+from neuromake.wildcard import Wildcard
+from neuromake.menu import Menu
+
+N_WILDCARDS = 10000
+
+def _timed(func):
+    t0 = time.perf_counter()
+    func()
+    return time.perf_counter() - t0
+
+def _wildcards(n):
+    return [ Wildcard(f'var{i}',None,{'iterable':True}) for i in range(n) ]
+
+def bench_label_index():
+    '''add, look up and remove wildcards: list scans vs the label index'''
+    wildcards = _wildcards(N_WILDCARDS)
+    labels = [ w.label for w in wildcards ]
+
+    legacy = []
+    def legacy_add():
+        for w in wildcards:
+            if w.label in [ x.label for x in legacy ]:
+                raise err.WildcardValueError(w.label)
+            legacy.append(w)
+    def legacy_get():
+        for label in labels:
+            [ x for x in legacy if x.label == label ][0]
+    def legacy_remove():
+        for label in labels:
+            legacy.remove([ x for x in legacy if x.label == label ][0])
+
+    menu = Menu('bench')
+    def indexed_add():
+        menu.add_wildcard(wildcards)
+    def indexed_get():
+        for label in labels:
+            menu.get_wildcard(label)
+    def indexed_remove():
+        for label in labels:
+            menu.remove_wildcard(label)
+
+    for name,before,after in [('add',legacy_add,indexed_add),('get',legacy_get,indexed_get),('remove',legacy_remove,indexed_remove)]:
+        before = _timed(before)
+        after = _timed(after)
+        print(f'{name:<8} {N_WILDCARDS} wildcards   list scan {before*1e3:9.1f} ms   index {after*1e3:7.1f} ms   ({before/after:.0f}x)')
+
+def bench_to_dict():
+    '''to_dict(metadata=True): merged metadata vs cached, after one edit'''
+    wildcards = [ Wildcard(f'var{i}',[i],{'iterable':True}) for i in range(N_WILDCARDS) ]
+    menu = Menu('bench',wildcards)
+
+    def legacy():
+        d = {'__metadata__':{menu.name:{}}}
+        for w in wildcards:
+            wildcard_dict = w.to_dict(metadata=True)
+            d['__metadata__'] = {**d['__metadata__'],**wildcard_dict.pop('__metadata__')}
+            d.update(wildcard_dict)
+    def full():
+        menu._mark_dirty(None)
+        menu.to_dict(metadata=True)
+    def incremental():
+        wildcards[N_WILDCARDS // 2].append(-1)
+        menu.to_dict(metadata=True)
+
+    legacy = _timed(legacy)
+    full = _timed(full)
+    incremental = _timed(incremental)
+    print(f'to_dict  {N_WILDCARDS} wildcards   merged {legacy*1e3:9.1f} ms   rebuilt {full*1e3:7.1f} ms   1 edit {incremental*1e3:7.2f} ms')
+
+def bench_factory_reset():
+    '''factory_reset and bulk removal on a menu of mostly optional wildcards'''
+    def make():
+        wildcards = [ Wildcard(f'var{i}',None,{'required':i % 100 == 0}) for i in range(N_WILDCARDS) ]
+        return wildcards,Menu('bench',wildcards)
+
+    wildcards,_ = make()
+    def legacy():
+        remaining = list(wildcards)
+        n_required = len([w for w in remaining if w._metadata['required']])
+        i = 0
+        while len(remaining) > n_required:
+            if remaining[i]._metadata['required']:
+                remaining[i].value = remaining[i]._metadata['default']
+                i += 1
+            else:
+                remaining.remove(remaining[i])
+
+    _,menu = make()
+    before = _timed(legacy)
+    after = _timed(menu.factory_reset)
+    print(f'factory_reset {N_WILDCARDS} wildcards   list remove {before*1e3:9.1f} ms   single pass {after*1e3:7.1f} ms   ({before/after:.0f}x)')
+
+    wildcards,menu = make()
+    labels = [ w.label for w in wildcards if not(w._metadata['required']) ]
+    def one_by_one():
+        for label in labels:
+            menu.remove_wildcard(label)
+    before = _timed(one_by_one)
+    _,menu = make()
+    after = _timed(lambda: menu.remove_wildcards(labels))
+    print(f'remove_wildcards {len(labels)} labels   one by one {before*1e3:9.1f} ms   bulk {after*1e3:7.1f} ms')
+
+if __name__ == '__main__':
+    bench_label_index()
+    bench_to_dict()
+    bench_factory_reset()
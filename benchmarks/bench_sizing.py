@@ -0,0 +1,32 @@
+"""benchmarks for closed-form job-space sizing
+
+run from the repository root:
+
+    python -m benchmarks.bench_sizing
+"""
+import itertools as it
+import time
+from neuromake import sizing
+
+BIDS = {
+    'subject':[ f'{i:05d}' for i in range(10000) ],
+    'session':['1','2','3','4'],
+    'func_task':[ f'task{i}' for i in range(25) ],
+    'func_run':range(1,11),
+    'func_echo':range(1,11),
+}
+
+def bench_count():
+    '''count 10^8 combinations: materialised product (on a sample) vs closed form'''
+    sample = dict(BIDS,subject=BIDS['subject'][:10])
+    t0 = time.perf_counter()
+    n_sample = len(list(it.product(*[ v if isinstance(v,(list,range)) else [v] for v in sample.values() ])))
+    t = time.perf_counter() - t0
+    estimate = t * len(BIDS['subject']) / 10
+    t0 = time.perf_counter()
+    n = sizing.count_combinations(BIDS)
+    closed = time.perf_counter() - t0
+    print(f'count    {n:.0e} combinations   product ~{estimate:7.1f} s (extrapolated from {n_sample})   closed form {closed*1e6:6.1f} us')
+
+if __name__ == '__main__':
+    bench_count()
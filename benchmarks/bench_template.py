@@ -0,0 +1,61 @@
+"""benchmarks for compiled template render plans
+
+run from the repository root:
+
+    python -m benchmarks.bench_template
+"""
+import itertools as it
+import time
+from neuromake.wildcard import TemplateWildcard
+
+TEMPLATE = 'sub-{subject}/ses-{session}/func/sub-{subject}_ses-{session}_task-{func_task}_run-{func_run}_bold.nii.gz'
+
+def _combos():
+    '''1M wildcard combinations: 12,500 subjects x 2 sessions x 4 tasks x 10 runs'''
+    subjects = [ f'{i:05d}' for i in range(12500) ]
+    for sub,ses,task,run in it.product(subjects,['pre','post'],['rest','mid','nback','sst'],[ str(i) for i in range(1,11) ]):
+        yield {'subject':sub,'session':ses,'func_task':task,'func_run':run}
+
+def bench_render():
+    '''render 1M paths with str.format vs a compiled render plan'''
+    combos = list(_combos())
+    n = len(combos)
+    w = TemplateWildcard('funcPath',TEMPLATE)
+    plan = w.plan
+    cases = [
+        ('str.format',lambda: [ TEMPLATE.format(**d) for d in combos ]),
+        ('TemplateWildcard.render',lambda: [ w.render(**d) for d in combos ]),
+        ('TemplateWildcard.plan.render',lambda: [ plan.render(d) for d in combos ]),
+    ]
+    for name,func in cases:
+        t0 = time.perf_counter()
+        func()
+        t = time.perf_counter() - t0
+        print(f'{name:<30} {n} paths in {t:6.2f} s ({t/n*1e9:6.1f} ns/path)')
+
+def _split_match(path):
+    '''per-file string splitting, as in utils.get_bids_vars_dict'''
+    parts = path.rsplit('/',1)[-1].split('_')
+    if len(parts) != 5 or not(parts[-1] == 'bold.nii.gz'):
+        return None
+    d = dict( p.split('-',1) for p in parts[:-1] )
+    return {'subject':d['sub'],'session':d['ses'],'func_task':d['task'],'func_run':d['run']}
+
+def bench_match():
+    '''parse 1M rendered paths back into wildcards'''
+    w = TemplateWildcard('funcPath',TEMPLATE)
+    paths = [ w.plan.render(d) for d in _combos() ]
+    n = len(paths)
+    cases = [
+        ('split per file',lambda: [ d for d in map(_split_match,paths) if d is not None ]),
+        ('TemplateWildcard.match_many',lambda: list(w.match_many(paths))),
+    ]
+    for name,func in cases:
+        t0 = time.perf_counter()
+        func()
+        t = time.perf_counter() - t0
+        print(f'{name:<30} {n} paths in {t:6.2f} s ({t/n*1e9:6.1f} ns/path)')
+
+if __name__ == '__main__':
+    bench_render()
+    bench_match()
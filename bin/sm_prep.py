@@ -3,7 +3,9 @@
 
 ######################### ARGPARSE/ARGCOMPLETE #################################
 import argparse, argcomplete
+import os
 import json
+from neuromake.bidsindex import BidsIndex
 
 def get_possible_bids_vars(config):
     '''
@@ -113,9 +115,21 @@ def string2datatype(s,data_type):
 def index_bids_db(config):
     print(f'[{time.strftime("%H:%M:%S")}]','Resetting indexed bids layout database...')
     layout = BIDSLayout(config['directories']['bids'],database_path=config['directories']['bidslayout'],reset_database=True)
+    # the neuromake index queried by the snakefile's getBIDS rules
+    BidsIndex.open(config['directories']['bids'],os.path.join(config['directories']['bidslayout'],'neuromake_bids_index.pkl'),reindex=True)
     print(f'[{time.strftime("%H:%M:%S")}]','Done.')
 
 
+def update_bids_index(config):
+    '''
+    rebuild the neuromake bids index if files were added to or removed from
+    the dataset since it was built. Snakemake jobs load the index without
+    this check, which stats every directory of the dataset.
+    '''
+    if os.path.isdir(config['directories']['bids']) and os.path.isdir(config['directories']['bidslayout']):
+        BidsIndex.open(config['directories']['bids'],os.path.join(config['directories']['bidslayout'],'neuromake_bids_index.pkl'))
+
+
 def unique(mylist):
     '''
     return unique elements of mylist as list, preserving order of first occurrence
@@ -136,6 +150,8 @@ if __name__ == '__main__':
     # reindex database if requested
     if args['reindex_db']:
         index_bids_db(config)
+    else:
+        update_bids_index(config)
 
     # resave config file
     with open('config/sm_config.json','w') as fp:
@@ -1,26 +1,65 @@
 """Config class to manage changes to config file"""
 import os
+import io
 import json
+import pickle
+import tempfile
+from functools import partial
+import hashlib
 from neuromake.menu import Menu
+from neuromake.menu.menu import _wildcard_from_dict
+from neuromake.snapshot import AppSnapshot
+import neuromake.sizing as sizing
+import neuromake.manifest as manifest
 from neuromake.wildcard import Wildcard, PathWildcard, TemplateWildcard
 import neuromake.exceptions as err
 
+# bump when the pickled layout of Menus or Wildcards changes, so that old
+# config caches are ignored
+_CACHE_FORMAT = 2
+
 class App:
     '''
     Neuromake.App controls menu initialization
     '''
-    def __init__(self,cfg_path=None,sm_cfg_path=None,name=None,menu=None,metadata=None):
+    def __init__(self,cfg_path=None,sm_cfg_path=None,name=None,menu=None,metadata=None,validation='eager',cache=False,lazy=False):
         '''
         cfg_path: (str,path) path for app configuration file
         sm_cfg_path: (str,path) path for snakemake configuration file
         name: (str) name of neuromake app
         menu: Menu or list of Menus [Default: None ]
+        validation: (str) path validation policy for PathWildcards loaded from
+        cfg_path. "eager" checks paths while loading, "lazy" checks each path
+        when its value is first read, and "trusted" skips the checks if the
+        config is unchanged since it was written by App.save() (otherwise
+        paths are checked eagerly). [Default: "eager"]
+        cache: (bool) keep a binary cache of the loaded App next to cfg_path
+        (<cfg_path>.cache), so later loads of the unchanged config skip json
+        parsing and wildcard validation. The cache is keyed on the config's
+        path, modification time, size and content hash, and is ignored when
+        stale. As it is a pickle, loading a cache runs any code in it: only
+        enable it for configs in directories that only you can write to.
+        [Default: False]
+        lazy: (bool) build each Menu in cfg_path only when it is first used
+        (e.g. by get_menu() or to_dict()), so that a job reading one Menu only
+        pays for that Menu. Errors in a Menu, including missing paths under
+        "eager" validation, are then raised on its first use. [Default: False]
         '''
         self._name = ""
+        self.validation = validation
+        self.cache = cache
+        self.lazy = lazy
         if name is not None:
             self.name = name
 
-        self._menus = []
+        # Menus, or _PendingMenus not yet built from cfg_path (see lazy)
+        self._menu_slots = []
+        self._dict_cache = {}
+        # menus changed since the last to_dict(), per metadata flag, and
+        # since the last snapshot(), in the order they changed: True for
+        # menus (re-)added to the App
+        self._dirty = {False:{},True:{},'snapshot':{}}
+        self._snapshot = None
         if menu is not None:
             self.add_menu(menu)
 
@@ -55,6 +94,20 @@ class App:
             if not(x.isalnum()) and not(x in "._- "):
                 raise ValueError(f'"name" contains invalid character "{x}". Name must be comprised of alphanumeric characters or "._- " only.')
 
+    @property
+    def validation(self):
+        '''
+        (str) path validation policy used when loading from cfg_path: "eager",
+        "lazy" or "trusted"
+        '''
+        return self._validation
+
+    @validation.setter
+    def validation(self,validation):
+        if validation not in PathWildcard._VALIDATION_POLICIES:
+            raise ValueError(f'"validation" must be one of {PathWildcard._VALIDATION_POLICIES}.')
+        self._validation = validation
+
     @property
     def cfg_path(self,cfg_path):
         '''
@@ -113,41 +166,89 @@ class App:
 
     def _load_from_config(self):
         '''
-        load a neuromake App instance from config file
-        '''
-        with open(self._cfg_path,'r') as cfg_file:
-            data = json.load(cfg_file)
-
-        if len(data.keys()) != 1:
-            raise err.AppConfigError(f'app config should have 1 key (app name)')
-        self.name = next(iter(data.keys()))
-
-        menus = []
-
-        for menu_name,menu_data in data[self.name].items():
-            metadata = menu_data.pop('__metadata__',{})
-            menu_metadata = metadata.pop(menu_name)
-            wildcards = []
-            for wc_label,wc_value in menu_data.items():
-                # make sure menu wildcard type matches wildcard type, if not
-                # generic wildcards
-                menu_wc_type = menu_metadata['wildcard_type']
-                wc_type = metadata[wc_label].pop('wildcard_type')
-                if menu_wc_type != 'Wildcard':
-                    if menu_wc_type != wc_type:
-                        raise err.AppConfigError(f'Menu {menu_name} expects {menu_wc_type}s, not {wc_type}s.')
-                # now  generate wildcard objects
-                if wc_type == 'Wildcard':
-                    w = Wildcard(wc_label,wc_value,metadata[wc_label])
-                elif wc_type == 'PathWildcard':
-                    w = PathWildcard(wc_label,wc_value,metadata[wc_label])
-                elif wc_type == 'TemplateWildcard':
-                    w = TemplateWildcard(wc_label,wc_value,metadata[wc_label])
-                else:
-                    raise err.AppConfigError(f'Unknown wildcard_type provided ({wc_type}).')
-                wildcards.append(w)
-            menus.append(Menu(menu_name,wildcard=wildcards,metadata=menu_metadata))
-        self.add_menu(menus)
+        load a neuromake App instance from config file, or from its binary
+        cache if the cache is up to date
+        '''
+        with open(self._cfg_path,'rb') as cfg_file:
+            content = cfg_file.read()
+
+        validation = self._validation
+        if validation == 'trusted' and not(_is_validated(self._cfg_path,content)):
+            validation = 'eager'
+
+        cached = _read_cache(self._cfg_path,content) if self.cache else None
+        if cached is not None:
+            name,menus = cached
+            self.name = name
+            pending = [ _PendingMenu(menu_name,partial(_unpickle_menu,menu_data,self,validation)) for menu_name,menu_data in menus ]
+        else:
+            data = json.loads(content)
+            if len(data.keys()) != 1:
+                raise err.AppConfigError(f'app config should have 1 key (app name)')
+            self.name = next(iter(data.keys()))
+            pending = [ _PendingMenu(menu_name,partial(_menu_from_dict,menu_name,menu_data,validation)) for menu_name,menu_data in data[self.name].items() ]
+
+        for p in pending:
+            self._validate_menu(p)
+            self._menu_slots.append(p)
+            self._menu_changed(p,added=True)
+        if not(self.lazy):
+            menus = [ self._build_menu(p.name) for p in pending ]
+            if cached is None and self.cache:
+                _write_cache(self._cfg_path,content,self,menus)
+
+    @property
+    def _menus(self):
+        '''(list) Menus in App, building any that are still pending (see lazy)'''
+        return [ self._build_slot(i) for i in range(len(self._menu_slots)) ]
+
+    def _build_menu(self,menu_name):
+        '''
+        (internal use) return the Menu named menu_name, building it first if
+        it is still pending
+        '''
+        for i,slot in enumerate(self._menu_slots):
+            if slot.name == menu_name:
+                return self._build_slot(i)
+        raise ValueError(f'"{menu_name}" is not a valid menu_label.')
+
+    def _build_slot(self,i):
+        '''(internal use) return the i-th Menu, building it if it is pending'''
+        slot = self._menu_slots[i]
+        if isinstance(slot,_PendingMenu):
+            slot = slot.load()
+            if self not in slot._owners:
+                slot._owners += (self,)
+            self._menu_slots[i] = slot
+        return slot
+
+    def save(self,cfg_path=None):
+        '''
+        save App config (including metadata) as json.
+
+        cfg_path: (str) path to save to [DEFAULT: App.cfg_path]
+
+        Every PathWildcard is checked before saving, and the content hash of
+        the saved config is recorded alongside it, so that it can later be
+        loaded with validation="trusted". If App.cache is set, the binary
+        cache is written too.
+        '''
+        if cfg_path is None:
+            cfg_path = self._cfg_path
+        if cfg_path is None:
+            raise err.AppConfigError('no cfg_path specified to save App config.')
+        self._validate_cfg_path(cfg_path)
+        for menu in self._menus:
+            for w in menu._wildcards:
+                if isinstance(w,PathWildcard):
+                    w.check_paths()
+        content = json.dumps(self.to_dict(metadata=True),indent=2).encode()
+        with open(cfg_path,'wb') as cfg_file:
+            cfg_file.write(content)
+        with open(_validated_path(cfg_path),'w') as hash_file:
+            hash_file.write(hashlib.sha256(content).hexdigest())
+        if self.cache:
+            _write_cache(cfg_path,content,self,self._menus)
 
     def add_menu(self,menu):
         '''
@@ -155,36 +256,41 @@ class App:
         '''
         if isinstance(menu,list):
             for m in menu:
-                self._validate_menu(m)
-                self._menus.append(m)
+                self.add_menu(m)
         else:
             self._validate_menu(menu)
-            self._menus.append(menu)
+            self._menu_slots.append(menu)
+            menu._owners += (self,)
+            self._menu_changed(menu,added=True)
 
     def get_menu(self,menu_name):
         '''
         get menu from neuromake app instance.
         '''
-        for menu in self._menus:
-            if menu.name == menu_name:
-                return menu
-        raise ValueError(f'"{menu_name}" is not a valid menu_label.')
+        return self._build_menu(menu_name)
 
     def remove_menu(self,menu_label):
         '''
         permanently remove menu_label from neuromake app instance.
         '''
-        self._menus.remove(self.get_menu(menu_label))
+        for i,menu in enumerate(self._menu_slots):
+            if menu.name == menu_label:
+                del self._menu_slots[i]
+                if isinstance(menu,Menu):
+                    menu._owners = tuple( o for o in menu._owners if o is not self )
+                self._menu_changed(menu)
+                return
+        raise ValueError(f'"{menu_label}" is not a valid menu_label.')
 
     def _validate_menu(self,menu):
         '''
         1. must be of type Menu
         2. name must not already exist in menus
         '''
-        if not(isinstance(menu,Menu)):
+        if not(isinstance(menu,(Menu,_PendingMenu))):
             raise TypeError(f'menu must be type Menu, not {type(menu).__name__}.')
-        if menu.name in [ x.name for x in self._menus ]:
-            raise ValueError(f'duplicate menu name "{m.name}".')
+        if menu.name in [ x.name for x in self._menu_slots ]:
+            raise ValueError(f'duplicate menu name "{menu.name}".')
 
     def to_dict(self,metadata=False,header=True):
         '''
@@ -195,8 +301,355 @@ class App:
 
         Both should be true for saving an App config, and both should be false
         when saving the config file for snakemake's reference.
+
+        Menus unchanged since the last call are not re-serialised. As with
+        Menu.to_dict(), nested dicts are shared with the cache and should not
+        be modified.
+        '''
+        cached = self._dict_cache.get(metadata)
+        dirty = self._dirty[metadata]
+        if cached is None or None in dirty:
+            cached = {}
+            for menu in self._menus:
+                cached.update(menu.to_dict(metadata=metadata))
+            self._dict_cache[metadata] = cached
+        else:
+            menus = { menu.name:menu for menu in self._menus if menu.name in dirty }
+            for menu_name in dirty:
+                if menu_name in menus:
+                    cached.update(menus[menu_name].to_dict(metadata=metadata))
+                else:
+                    cached.pop(menu_name,None)
+            if any(dirty.values()):
+                cached = { m.name:cached[m.name] for m in self._menu_slots }
+                self._dict_cache[metadata] = cached
+        dirty.clear()
+        return {self.name:dict(cached)}
+
+    def diff(self,other):
+        '''
+        return a patch (a json-serialisable dict) that turns this App into
+        other when passed to apply_patch(), e.g. to sync a config to compute
+        nodes without re-sending it whole. Added Menus are included in full,
+        and changed Menus as a patch from Menu.diff(). An empty dict means the
+        Apps are equal.
+
+        other: (App or AppSnapshot) target App
         '''
-        d = {}
+        mine = self._menus_by_name()
+        theirs = other._menus_by_name()
+        patch = {}
+        if other.name != self.name:
+            patch['name'] = other.name
+        removed = [ name for name in mine if name not in theirs ]
+        added = { name:menu.to_dict(metadata=True)[name] for name,menu in theirs.items() if name not in mine }
+        changed = {}
+        for name,menu in theirs.items():
+            if name in mine:
+                menu_patch = mine[name].diff(menu)
+                if menu_patch:
+                    changed[name] = menu_patch
+        if removed:
+            patch['removed'] = removed
+        if added:
+            patch['added'] = added
+        if changed:
+            patch['changed'] = changed
+        return patch
+
+    def apply_patch(self,patch):
+        '''
+        apply a patch from diff(). Every change is validated before any is
+        made, so either the whole patch is applied or the App is left
+        unchanged. Raises PatchError if the patch was made from a different
+        state of this App (see Menu.apply_patch()), including when a Menu it
+        removes or changes is missing. PathWildcards in added Menus are
+        checked according to App.validation.
+        '''
+        commits = []
+        if 'name' in patch:
+            self._validate_name(patch['name'])
+            commits.append(lambda: setattr(self,'name',patch['name']))
+        removed = [ self._patched_menu(name) for name in patch.get('removed',[]) ]
+        for name,menu_patch in patch.get('changed',{}).items():
+            commits.append(self._patched_menu(name)._stage_patch(menu_patch))
+        names = { menu.name for menu in self._menu_slots if menu not in removed }
+        added = []
+        for name,menu_data in patch.get('added',{}).items():
+            if name in names:
+                raise ValueError(f'duplicate menu name "{name}".')
+            added.append(_menu_from_dict(name,menu_data,self._validation))
+        for menu in removed:
+            self.remove_menu(menu.name)
+        for c in commits:
+            c()
+        self.add_menu(added)
+
+    def _patched_menu(self,menu_name):
+        '''(internal use) Menu named menu_name, which a patch expects to exist'''
+        if not(any( slot.name == menu_name for slot in self._menu_slots )):
+            raise err.PatchError(f'Menu "{menu_name}" does not exist in App {self.name}: patch was made from a different state.')
+        return self._build_menu(menu_name)
+
+    def snapshot(self):
+        '''
+        return a read-only AppSnapshot of the App's current state, e.g. to
+        undo edits with restore() or to hand to reader threads while the App
+        keeps being edited. Unchanged Menus (and unchanged wildcards within
+        changed Menus) are shared with the previous snapshot, so taking a
+        snapshot after no edits is O(1), and otherwise costs re-serialising
+        only what was edited.
+        '''
+        previous = self._snapshot
+        dirty = self._dirty['snapshot']
+        if previous is not None and not(dirty) and previous.name == self.name:
+            return previous
+        menus = {}
         for menu in self._menus:
-            d.update(menu.to_dict(metadata=metadata))
-        return {self.name:d}
+            if previous is not None and None not in dirty and menu.name not in dirty and menu.name in previous._menus:
+                menus[menu.name] = previous._menus[menu.name]
+            else:
+                menus[menu.name] = menu.snapshot()
+        dirty.clear()
+        self._snapshot = AppSnapshot(self.name,menus)
+        return self._snapshot
+
+    def restore(self,snapshot):
+        '''
+        return the App to the state recorded in snapshot (an AppSnapshot from
+        snapshot()). Existing Menus and wildcards are updated in place, and
+        restored values are copies, so later edits never change the snapshot.
+        '''
+        self.apply_patch(self.diff(snapshot))
+
+    def _menus_by_name(self):
+        '''(internal use) dict of Menus by name, in App order'''
+        return { menu.name:menu for menu in self._menus }
+
+    def plan_jobs(self,bids='bids',templates='templates',jobs_per_target=1):
+        '''
+        size the job space of the App without expanding it, e.g. to request a
+        cluster allocation. Every count is computed in closed form from the
+        number of values of each wildcard, and no Menu is changed. Returns a
+        dict with:
+
+        n_subjects: number of subjects
+        per_filetype: combinations per subject for each bids file type
+        per_template: paths each template expands to (only over the bids
+        wildcards it uses)
+        per_subject: paths each template expands to for one subject
+        n_targets: total paths over all templates
+        n_jobs: estimated snakemake jobs, jobs_per_target jobs for each target
+        plus one for the "all" rule
+
+        bids: (str) name of the bids Menu [DEFAULT: "bids"]
+        templates: (str) name of the templates Menu; templates are skipped
+        if the App has no such Menu [DEFAULT: "templates"]
+        jobs_per_target: (int) rules run to produce each target [DEFAULT: 1]
+        '''
+        wildcards = self.get_menu(bids)._values()
+        per_template = {}
+        per_subject = {}
+        if templates in [ x.name for x in self._menu_slots ]:
+            for label,template in self.get_menu(templates)._values().items():
+                if template is not None:
+                    per_template[label] = sizing.count_template(template,wildcards)
+                    per_subject[label] = sizing.count_template(template,wildcards,exclude=('subject',))
+        n_targets = sum(per_template.values())
+        return {
+            'n_subjects':sizing.n_values(wildcards.get('subject')),
+            'per_filetype':sizing.combinations_per_filetype(wildcards,exclude=('subject',)),
+            'per_template':per_template,
+            'per_subject':per_subject,
+            'n_targets':n_targets,
+            'n_jobs':n_targets * jobs_per_target + 1,
+        }
+
+    def write_manifest(self,path,bids='bids',templates='templates',force=False):
+        '''
+        write every target path rendered from the templates Menu over the
+        bids Menu to a manifest (see neuromake.manifest.write_manifest), so a
+        snakefile can read its targets with neuromake.manifest.read_manifest()
+        instead of expanding them at every DAG build. The manifest is only
+        rewritten when the bids or templates Menus have changed since it was
+        written.
+
+        path: (str) manifest path
+        bids: (str) name of the bids Menu [DEFAULT: "bids"]
+        templates: (str) name of the templates Menu [DEFAULT: "templates"]
+        force: (bool) rewrite the manifest even if it is up to date [DEFAULT: False]
+
+        Returns True if the manifest was written, False if it was up to date.
+        '''
+        template_values = [ t for t in self.get_menu(templates)._values().values() if t is not None ]
+        return manifest.write_manifest(path,template_values,self.get_menu(bids)._values(),force=force)
+
+    def _menu_changed(self,menu,added=False):
+        '''
+        (internal use) called by a Menu in this App when it changes, so that
+        only changed Menus are re-serialised by to_dict(). added is True if
+        the Menu was added to the App, which may change the order of its Menus.
+        '''
+        for dirty in self._dirty.values():
+            dirty[menu.name] = dirty.get(menu.name,False) or added
+
+    def _validate_rename(self,menu,name):
+        '''(internal use) called by a Menu in this App before it is renamed'''
+        if name != menu.name and name in [ x.name for x in self._menu_slots ]:
+            raise ValueError(f'duplicate menu name "{name}".')
+
+    def _menu_renamed(self,menu,old_name):
+        '''(internal use) re-serialise every Menu after one is renamed, keeping order'''
+        for dirty in self._dirty.values():
+            dirty[None] = False
+
+def _menu_from_dict(menu_name,menu_data,validation='eager'):
+    '''
+    (internal use) create a Menu from its to_dict(metadata=True) form,
+    without modifying menu_data
+    '''
+    metadata = menu_data.get('__metadata__',{})
+    menu_metadata = metadata[menu_name]
+    wildcards = []
+    for wc_label,wc_value in menu_data.items():
+        if wc_label == '__metadata__':
+            continue
+        # make sure menu wildcard type matches wildcard type, if not
+        # generic wildcards
+        menu_wc_type = menu_metadata['wildcard_type']
+        wc_type = metadata[wc_label]['wildcard_type']
+        if menu_wc_type != 'Wildcard':
+            if menu_wc_type != wc_type:
+                raise err.AppConfigError(f'Menu {menu_name} expects {menu_wc_type}s, not {wc_type}s.')
+        if wc_type not in Menu._WILDCARD_TYPES:
+            raise err.AppConfigError(f'Unknown wildcard_type provided ({wc_type}).')
+        wildcards.append(_wildcard_from_dict(wc_label,wc_value,metadata[wc_label],validation))
+    return Menu(menu_name,wildcard=wildcards,metadata=menu_metadata)
+
+def _validated_path(cfg_path):
+    '''(internal use) path of the file recording a validated config's hash'''
+    return f'{cfg_path}.validated'
+
+def _is_validated(cfg_path,content):
+    '''
+    (internal use) True if content matches the hash recorded when cfg_path
+    was last written by App.save()
+    '''
+    try:
+        with open(_validated_path(cfg_path),'r') as hash_file:
+            recorded = hash_file.read().strip()
+    except OSError:
+        return False
+    return recorded == hashlib.sha256(content).hexdigest()
+
+def _cache_path(cfg_path):
+    '''(internal use) path of the binary cache for cfg_path'''
+    return f'{cfg_path}.cache'
+
+def _cache_key(cfg_path,content):
+    '''(internal use) identifies the exact config file a cache was made from'''
+    st = os.stat(cfg_path)
+    return (_CACHE_FORMAT,os.path.abspath(cfg_path),st.st_mtime_ns,st.st_size,hashlib.sha256(content).hexdigest())
+
+class _AppPickler(pickle.Pickler):
+    '''
+    (internal use) pickles an App's Menus without the App itself, which the
+    Menus reference as their owner; it is swapped in again by _AppUnpickler
+    '''
+    def __init__(self,file,app):
+        super().__init__(file,protocol=pickle.HIGHEST_PROTOCOL)
+        self._app = app
+
+    def persistent_id(self,obj):
+        return 'app' if obj is self._app else None
+
+class _AppUnpickler(pickle.Unpickler):
+    '''(internal use) unpickles Menus pickled by _AppPickler into app'''
+    def __init__(self,file,app):
+        super().__init__(file)
+        self._app = app
+
+    def persistent_load(self,pid):
+        if pid != 'app':
+            raise pickle.UnpicklingError(f'unknown persistent id {pid!r}.')
+        return self._app
+
+def _write_cache(cfg_path,content,app,menus):
+    '''
+    (internal use) write app's name and menus (the Menus in cfg_path) to the
+    binary cache for cfg_path, whose content is content. Each Menu is
+    pickled separately, so that lazy Apps can unpickle one Menu at a time.
+    The cache is written to a temporary file and moved into place, so
+    concurrent readers never see a partial cache. Failing to write the cache
+    (e.g. a read-only directory) is not an error.
+    '''
+    path = _cache_path(cfg_path)
+    pickled = []
+    for menu in menus:
+        buffer = io.BytesIO()
+        _AppPickler(buffer,app).dump(menu)
+        pickled.append((menu.name,buffer.getvalue()))
+    tmp_path = None
+    try:
+        # a unique name in the cache's directory, as jobs on different nodes
+        # of a shared filesystem may have the same pid
+        fd,tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',prefix=os.path.basename(path) + '.',suffix='.tmp')
+        with os.fdopen(fd,'wb') as cache_file:
+            pickle.dump(_cache_key(cfg_path,content),cache_file,protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump((app.name,pickled),cache_file,protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path,path)
+    except OSError:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+def _read_cache(cfg_path,content):
+    '''
+    (internal use) return (name, [(menu name, pickled Menu)]) from the binary
+    cache for cfg_path, or None if there is no cache or it was made from a
+    different config
+    '''
+    try:
+        with open(_cache_path(cfg_path),'rb') as cache_file:
+            if pickle.load(cache_file) != _cache_key(cfg_path,content):
+                return None
+            return pickle.load(cache_file)
+    except Exception:
+        # missing, partial or incompatible caches fall back to the json config
+        return None
+
+def _unpickle_menu(data,app,validation):
+    '''
+    (internal use) unpickle a Menu from the binary cache into app, applying
+    the path validation policy it is loaded with
+    '''
+    menu = _AppUnpickler(io.BytesIO(data),app).load()
+    _set_path_validation([menu],validation)
+    return menu
+
+class _PendingMenu:
+    '''(internal use) a Menu from cfg_path that lazy Apps have not built yet'''
+    __slots__ = ('name','load')
+
+    def __init__(self,name,load):
+        '''
+        name: (str) Menu name
+        load: function returning the built Menu
+        '''
+        self.name = name
+        self.load = load
+
+def _set_path_validation(menus,validation):
+    '''
+    (internal use) apply a path validation policy to the PathWildcards of
+    Menus loaded from a cache, as if they had been loaded with it
+    '''
+    for menu in menus:
+        for w in menu._index.values():
+            if isinstance(w,PathWildcard):
+                w._validation = validation
+                w._unchecked = validation == 'lazy' and w._value is not None
+                if validation == 'eager':
+                    w.check_paths()
@@ -0,0 +1,330 @@
+"""bids entity lookup tables, filename grammars, and batch parsing of BIDS filenames"""
+import os
+import re
+import json
+import importlib.resources
+from array import array
+from types import MappingProxyType
+from functools import lru_cache
+
+with importlib.resources.open_text('neuromake.resources','keynames.json') as x:
+    # filename key of each entity whose key differs from its name, e.g. "sub"
+    # for "subject"
+    _ENTITY_KEYS = MappingProxyType(json.load(x))
+_KEY_ENTITIES = MappingProxyType({ v:k for k,v in _ENTITY_KEYS.items() })
+
+with importlib.resources.open_text('neuromake.resources','bids_info.json') as x:
+    _BIDS_INFO = json.load(x)
+
+# bids file types whose wildcards are prefixed, e.g. "func" for "func_task"
+_FILETYPES = tuple( k for k in _BIDS_INFO.keys() if k != 'base' )
+
+# entities shared by every file type, which are never prefixed
+_BASE_ENTITIES = frozenset(_BIDS_INFO['base']['labels']['all'])
+
+# prefixed wildcard label of each (filetype,entity), e.g. ("func","task"):
+# "func_task", and the reverse
+_PREFIXED = MappingProxyType({ (ft,entity):f'{ft}_{entity}' for ft in _FILETYPES for entity in _BIDS_INFO[ft]['labels']['all'] })
+_UNPREFIXED = MappingProxyType({ label:key for key,label in _PREFIXED.items() })
+
+# every valid bids wildcard label, shared entities first
+_WILDCARD_LABELS = tuple(_BIDS_INFO['base']['labels']['all']) + tuple(_PREFIXED.values())
+
+# entities each file type may have, and those its filenames require
+_FILETYPE_ENTITIES = MappingProxyType({ ft:frozenset(_BIDS_INFO[ft]['labels']['all']) for ft in _FILETYPES })
+_FILETYPE_REQUIRED = MappingProxyType({ ft:frozenset(_BIDS_INFO[ft]['labels']['minimal']) - {'suffix'} for ft in _FILETYPES })
+
+# file types whose filenames extend another file type's (<matches>)
+_MATCHING_FILETYPES = tuple( ft for ft in _FILETYPES if any(t.startswith('<matches>') for t in _BIDS_INFO[ft]['templates']) )
+
+def _suffix_filetypes():
+    '''(internal use) dict of file types per filename suffix in the templates'''
+    suffixes = {}
+    for ft in _FILETYPES:
+        for template in _BIDS_INFO[ft]['templates']:
+            suffix = re.search(r'_([^_<>\[\].]+|<suffix>)\.',template).group(1)
+            if ft not in suffixes.setdefault(suffix,[]):
+                suffixes[suffix].append(ft)
+    return MappingProxyType({ k:tuple(v) for k,v in suffixes.items() })
+
+# file types of each filename suffix, e.g. "bold": ("func",), "physio":
+# ("func","dwi","physio"). Suffixes not listed have the file types whose
+# templates take any suffix ("<suffix>", e.g. anat's "T1w")
+_SUFFIX_FILETYPES = _suffix_filetypes()
+
+def add_prefix(entity,filetype):
+    '''
+    return the wildcard label of a bids entity, e.g. "func_task" for "task"
+    in "func" files. Entities not specific to filetype (e.g. "subject") are
+    returned unchanged.
+
+    entity: (str) bids entity, e.g. "task"
+    filetype: (None, str, or list of str) file type(s) of the file, as
+    returned by bids_filetype(). With a list, the last file type having the
+    entity is used.
+    '''
+    if isinstance(filetype,str):
+        return _PREFIXED.get((filetype,entity),entity)
+    if isinstance(filetype,(list,tuple)):
+        for ft in reversed(filetype):
+            label = _PREFIXED.get((ft,entity))
+            if label is not None:
+                return label
+    return entity
+
+def remove_prefix(label):
+    '''
+    return the bids entity of a wildcard label, e.g. "task" for "func_task".
+    Labels without a file type prefix are returned unchanged.
+    '''
+    key = _UNPREFIXED.get(label)
+    return label if key is None else key[1]
+
+def bids_filetype(entities):
+    '''
+    return the bids file type of a file from its parsed entities (e.g. a
+    BidsTable.row()): a str, a list of str for files extending another file
+    type's filenames (e.g. ["func","physio"]), or None if unknown.
+
+    entities: (dict) bids entities, including "suffix"
+    '''
+    suffix = entities.get('suffix')
+    filetypes = _SUFFIX_FILETYPES.get(suffix,_SUFFIX_FILETYPES.get('<suffix>',()))
+    present = entities.keys() - _BASE_ENTITIES - {'suffix','extension'}
+    matching = [ ft for ft in filetypes if ft in _MATCHING_FILETYPES ]
+    if matching:
+        present = present - _FILETYPE_ENTITIES[matching[-1]]
+    base = [ ft for ft in filetypes if ft not in _MATCHING_FILETYPES and _FILETYPE_REQUIRED[ft] <= present <= _FILETYPE_ENTITIES[ft] ]
+    if matching:
+        return base[:1] + matching[-1:]
+    if len(base) == 0:
+        return None
+    return base[0]
+
+# one token of a bids filename: a key-value pair (e.g. "task-rest_"), or the
+# final suffix and extension (e.g. "bold.nii.gz")
+_TOKEN = re.compile(r'([^_\-.]+)-([^_.]+)_?|([^_\-.]+)(?:\.(.*))?$')
+
+class BidsTable:
+    '''
+    columnar table of entities parsed from BIDS filenames by
+    parse_bids_filenames(). Each entity column is categorical: an array of
+    integer codes, one per file, indexing into a list of the column's
+    distinct values. Files without the entity have code -1.
+    '''
+    __slots__ = ('_n','_columns')
+
+    def __init__(self,n,columns):
+        '''
+        n: (int) number of files
+        columns: (dict) entity: (codes,categories) pairs, with codes an
+        array of n ints
+        '''
+        self._n = n
+        self._columns = columns
+
+    def __len__(self):
+        return self._n
+
+    def __contains__(self,entity):
+        return entity in self._columns
+
+    @property
+    def entities(self):
+        '''list of entities found in any file, in order of first appearance'''
+        return list(self._columns.keys())
+
+    def codes(self,entity):
+        '''array of integer codes of entity, -1 for files without it'''
+        return self._columns[entity][0]
+
+    def categories(self,entity):
+        '''list of distinct values of entity, indexed by its codes'''
+        return self._columns[entity][1]
+
+    def column(self,entity):
+        '''list of values of entity, one per file, None for files without it'''
+        codes,categories = self._columns[entity]
+        lookup = categories + [None]
+        return [ lookup[c] for c in codes ]
+
+    def row(self,i):
+        '''dict of entities and values of the i-th file'''
+        return { entity:categories[codes[i]] for entity,(codes,categories) in self._columns.items() if codes[i] >= 0 }
+
+def parse_bids_filenames(paths):
+    '''
+    parse the entities of many BIDS filenames in a single pass, returning a
+    BidsTable. Keys are mapped to entity names as in get_bids_vars_dict()
+    (e.g. "sub" to "subject"), and the final suffix and extension are stored
+    as "suffix" and "extension". Directories in paths are ignored.
+
+    >>> table = parse_bids_filenames(['sub-01_task-rest_bold.nii.gz','sub-02_T1w.nii'])
+    >>> table.column('task')
+    ['rest', None]
+
+    paths: (iterable of str) file paths, e.g. from os.walk
+    '''
+    columns = {}
+    findall = _TOKEN.findall
+    basename = os.path.basename
+    n = 0
+    for path in paths:
+        row = {}
+        for key,value,suffix,extension in findall(basename(path)):
+            if key:
+                row[_KEY_ENTITIES.get(key,key)] = value
+            else:
+                row['suffix'] = suffix
+                if extension:
+                    row['extension'] = extension
+        for entity,value in row.items():
+            column = columns.get(entity)
+            if column is None:
+                column = columns[entity] = (array('l'),{})
+            codes,index = column
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(index)
+            if len(codes) < n:
+                codes.extend([-1] * (n - len(codes)))
+            codes.append(code)
+        n += 1
+    table = {}
+    for entity,(codes,index) in columns.items():
+        if len(codes) < n:
+            codes.extend([-1] * (n - len(codes)))
+        table[entity] = (codes,list(index.keys()))
+    return BidsTable(n,table)
+
+# regex of each value placeholder in bids_info.json filename grammars
+_GRAMMAR_VALUES = {'label':'[a-zA-Z0-9]+','index':'[0-9]+','suffix':'[a-zA-Z0-9]+'}
+
+# grammar tokens: a key-value pair (e.g. "task-<label>"), optional brackets,
+# or a literal character
+_GRAMMAR_TOKEN = re.compile(r'([a-zA-Z]+)-<([^>]+)>|\[|\]|.')
+
+# entities whose values are indices (e.g. "run-01"), which PyBIDS compares
+# as ints, so that "1" and "01" are the same run
+_INDEX_ENTITIES = frozenset( _KEY_ENTITIES.get(k,k) for ft in _FILETYPES for t in _BIDS_INFO[ft]['templates'] for k,v in _GRAMMAR_TOKEN.findall(t) if v == 'index' )
+
+# a grammar's stem, suffix and extension, e.g. "sub-<label>", "bold", ".nii[.gz]"
+_GRAMMAR_PARTS = re.compile(r'(.*)_(<suffix>|[a-zA-Z0-9]+)(\..*)')
+
+def _expand_grammars():
+    '''
+    (internal use) list of (filetype,stem,suffix,extension) for every
+    filename grammar, with "<matches>" replaced by the stem of each grammar
+    of the other file types (e.g. a physio grammar for every func stem)
+    '''
+    grammars = [ (ft,) + _GRAMMAR_PARTS.fullmatch(t).groups() for ft in _FILETYPES for t in _BIDS_INFO[ft]['templates'] ]
+    matching_suffixes = { g[2] for g in grammars if g[0] in _MATCHING_FILETYPES }
+    stems = list(dict.fromkeys( g[1] for g in grammars if g[0] not in _MATCHING_FILETYPES and g[2] not in matching_suffixes ))
+    expanded = []
+    for ft,stem,suffix,extension in grammars:
+        if '<matches>' in stem:
+            expanded.extend( (ft,stem.replace('<matches>',s),suffix,extension) for s in stems )
+        else:
+            expanded.append((ft,stem,suffix,extension))
+    return expanded
+
+_GRAMMARS = _expand_grammars()
+
+# suffixes named literally by some grammar; other suffixes can only match
+# grammars with a "<suffix>" placeholder
+_GRAMMAR_SUFFIXES = frozenset( g[2] for g in _GRAMMARS if g[2] != '<suffix>' )
+
+def _grammar_regex(alt,stem,suffix,extension):
+    '''
+    (internal use) regex of one filename grammar, with a group per entity
+    named "<alt>_<entity>"
+    '''
+    def token(m):
+        if m.group(1) is not None:
+            values = m.group(2)
+            value = _GRAMMAR_VALUES.get(values) or '(?:' + '|'.join(map(re.escape,values.split('|'))) + ')'
+            return f'{m.group(1)}-(?P<{alt}_{_KEY_ENTITIES.get(m.group(1),m.group(1))}>{value})'
+        return {'[':'(?:',']':')?'}.get(m.group(0)) or re.escape(m.group(0))
+    regex = _GRAMMAR_TOKEN.sub(token,stem)
+    regex += f'_(?P<{alt}_suffix>{_GRAMMAR_VALUES["suffix"] if suffix == "<suffix>" else re.escape(suffix)})'
+    regex += f'\\.(?P<{alt}_extension>' + _GRAMMAR_TOKEN.sub(token,extension[1:]) + ')'
+    return regex
+
+@lru_cache(maxsize=None)
+def _grammar(filetype,suffix):
+    '''
+    (internal use) compiled alternation of the filename grammars of filetype
+    (None for every file type) that can match a filename with suffix (None
+    for any suffix, "<suffix>" for a suffix no grammar names), and a dict of (filetype,((group,entity),...)) per
+    alternative
+    '''
+    alternatives = {}
+    regexes = []
+    for ft,stem,s,extension in _GRAMMARS:
+        if filetype is not None and ft != filetype:
+            continue
+        if suffix is not None and s != suffix:
+            continue
+        alt = f'g{len(regexes)}'
+        regex = _grammar_regex(alt,stem,s,extension)
+        regexes.append(f'(?P<{alt}>{regex})')
+        groups = re.compile(regex).groupindex
+        alternatives[alt] = (ft,tuple( (g,g[len(alt)+1:]) for g in groups ))
+    return re.compile('(?:' + '|'.join(regexes) + ')$'),alternatives
+
+def compile_grammar(filetype):
+    '''
+    return the filename grammars of a bids file type in bids_info.json (e.g.
+    "sub-<label>[_ses-<label>]_task-<label>..._bold.nii[.gz]") compiled into
+    a single regex, with one alternative per grammar. Each alternative's
+    groups are named "<alternative>_<entity>", e.g. "g0_subject".
+
+    filetype: (str) bids file type, e.g. "func"
+    '''
+    if filetype not in _FILETYPES:
+        raise ValueError(f'"{filetype}" is not a recognized file type. Must be one of {list(_FILETYPES)}.')
+    return _grammar(filetype,None)[0]
+
+def match_bids_filename(path,filetype=None):
+    '''
+    match the filename of path against the bids filename grammars in
+    bids_info.json. Returns (filetype,entities) for the first file type whose
+    grammar matches, with entities named as in parse_bids_filenames(), or
+    None if the filename is not valid.
+
+    path: (str) file path
+    filetype: (str) only match grammars of this file type [DEFAULT: None, any]
+    '''
+    name = os.path.basename(path)
+    suffix = name.split('.',1)[0].rpartition('_')[2]
+    # suffixes no grammar names share one cache entry, so that junk filenames
+    # don't grow the cache
+    pattern,alternatives = _grammar(filetype,suffix if suffix in _GRAMMAR_SUFFIXES else '<suffix>')
+    m = pattern.match(name)
+    if m is None:
+        return None
+    ft,groups = alternatives[m.lastgroup]
+    return ft,{ entity:m.group(g) for g,entity in groups if m.group(g) is not None }
+
+def classify_bids_filenames(paths,filetype=None):
+    '''
+    yield match_bids_filename() of each of paths (any iterable, e.g. a
+    generator walking a dataset): (filetype,entities) for valid filenames,
+    and None for invalid ones.
+
+    paths: (iterable of str) file paths
+    filetype: (str) only match grammars of this file type [DEFAULT: None, any]
+    '''
+    for path in paths:
+        yield match_bids_filename(path,filetype)
+
+def invalid_bids_filenames(paths,filetype=None):
+    '''
+    yield each of paths whose filename matches no bids filename grammar
+
+    paths: (iterable of str) file paths
+    filetype: (str) only match grammars of this file type [DEFAULT: None, any]
+    '''
+    for path in paths:
+        if match_bids_filename(path,filetype) is None:
+            yield path
@@ -0,0 +1,274 @@
+"""persisted inverted index of a BIDS dataset, queried without PyBIDS"""
+import os
+import json
+import pickle
+import tempfile
+from array import array
+from neuromake.bids import parse_bids_filenames, _INDEX_ENTITIES
+
+# bump when the index layout changes, so that old indexes are rebuilt
+_INDEX_FORMAT = 3
+
+# top-level dataset directories that are not indexed, as in PyBIDS
+_IGNORED_DIRS = frozenset(['code','derivatives','models','sourcedata','stimuli'])
+
+class BidsIndex:
+    '''
+    inverted index of the files in a BIDS dataset: for each entity (e.g.
+    "subject") and value, the ids of the files with that value. An index is
+    built once from a crawl of the dataset and saved to disk, so that queries
+    don't construct a BIDSLayout. get() takes the same keyword arguments as
+    BIDSLayout.get(), so an index can be passed to utils.query_bids_layout()
+    in place of a layout. As in PyBIDS, index entities (e.g. "run") are
+    compared as numbers, so run=1 matches "run-01". Use open() to load an
+    index, building it if needed, or rebuilding it if the dataset has changed.
+    '''
+    __slots__ = ('root','_paths','_columns','_postings','_dirs')
+
+    def __init__(self,root,paths,columns,postings,dirs=None):
+        '''
+        root: (str) absolute path of the dataset
+        paths: (list of str) file paths relative to root, indexed by file id
+        columns: (dict) entity: (codes,lookup) pairs, with codes an array of
+        each file's value code (-1 without the entity), and lookup a dict of
+        value: code
+        postings: (dict) entity: list of file id arrays, indexed by code
+        dirs: (dict) directory (relative to root): modification time (ns)
+        pairs of every crawled directory, or None if the index was not built
+        from a crawl
+        '''
+        self.root = root
+        self._paths = paths
+        self._columns = columns
+        self._postings = postings
+        self._dirs = dirs
+
+    @classmethod
+    def from_paths(cls,root,paths,dirs=None):
+        '''
+        index the files paths (relative to root), e.g. from a manifest,
+        without crawling the dataset. Such an index is always considered
+        current.
+        '''
+        paths = sorted(paths)
+        table = parse_bids_filenames(paths)
+        columns = {}
+        postings = {}
+        for entity in table.entities:
+            codes = table.codes(entity)
+            categories = table.categories(entity)
+            if entity in _INDEX_ENTITIES:
+                codes,categories = _merge_index_values(codes,categories)
+            ids = [ array('l') for _ in categories ]
+            for i,code in enumerate(codes):
+                if code >= 0:
+                    ids[code].append(i)
+            columns[entity] = (codes,{ v:c for c,v in enumerate(categories) })
+            postings[entity] = ids
+        return cls(os.path.abspath(root),paths,columns,postings,dirs)
+
+    @classmethod
+    def build(cls,root):
+        '''
+        index every file in the dataset at root. Hidden files and directories,
+        and top-level code, derivatives, models, sourcedata and stimuli
+        directories, are skipped. The modification time of every crawled
+        directory is recorded, so that is_current() can tell when files are
+        added, removed or renamed.
+        '''
+        root = os.path.abspath(root)
+        paths = []
+        mtimes = {}
+        for d,dirs,files in os.walk(root):
+            dirs[:] = [ x for x in dirs if not(x.startswith('.')) and not(d == root and x in _IGNORED_DIRS) ]
+            rel = os.path.relpath(d,root)
+            mtimes[rel] = os.stat(d).st_mtime_ns
+            for f in files:
+                if not(f.startswith('.')):
+                    paths.append(f if rel == '.' else os.path.join(rel,f))
+        return cls.from_paths(root,paths,mtimes)
+
+    @classmethod
+    def load(cls,path):
+        '''
+        load an index saved with save(). Raises ValueError if path holds an
+        index in an older format.
+        '''
+        with open(path,'rb') as index_file:
+            state = pickle.load(index_file)
+        if not(isinstance(state,dict)) or state.get('format') != _INDEX_FORMAT:
+            raise ValueError(f'"{path}" is not a neuromake BIDS index in the current format.')
+        return cls(state['root'],state['paths'],state['columns'],state['postings'],state['dirs'])
+
+    @classmethod
+    def open(cls,root,path,reindex=False,check=True):
+        '''
+        load the index of the dataset at root saved at path, or build and save
+        it if path doesn't hold one, or if files were added to or removed
+        from the dataset since it was built (see is_current()).
+
+        root: (str) path of the dataset
+        path: (str) index path
+        reindex: (bool) rebuild the index even if it is saved [DEFAULT: False]
+        check: (bool) check that a saved index is current, which stats every
+        directory of the dataset. Pass False in jobs when the check was
+        already made, e.g. once before running the workflow [DEFAULT: True]
+        '''
+        if not(reindex):
+            try:
+                index = cls.load(path)
+                if index.root == os.path.abspath(root) and (not(check) or index.is_current()):
+                    return index
+            except (OSError,ValueError,pickle.UnpicklingError,EOFError):
+                pass
+        index = cls.build(root)
+        index.save(path)
+        return index
+
+    def save(self,path):
+        '''
+        save the index to path. It is written to a temporary file and moved
+        into place, so concurrent readers never see a partial index.
+        '''
+        state = {'format':_INDEX_FORMAT,'root':self.root,'paths':self._paths,'columns':self._columns,'postings':self._postings,'dirs':self._dirs}
+        # a unique name rather than one from the pid, which jobs on different
+        # nodes of a shared filesystem may share
+        fd,tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',prefix=os.path.basename(path) + '.',suffix='.tmp')
+        with os.fdopen(fd,'wb') as index_file:
+            pickle.dump(state,index_file,protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path,path)
+
+    def is_current(self):
+        '''
+        return True if no file was added to, removed from, or renamed in the
+        dataset since the index was built, judged by the modification times
+        of the crawled directories (a new directory changes its parent's).
+        This costs one stat per directory, not a crawl.
+        '''
+        if self._dirs is None:
+            return True
+        for rel,mtime in self._dirs.items():
+            try:
+                if os.stat(os.path.join(self.root,rel)).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def __len__(self):
+        return len(self._paths)
+
+    @property
+    def entities(self):
+        '''list of entities found in any indexed file'''
+        return list(self._columns.keys())
+
+    def get_values(self,entity):
+        '''
+        sorted list of the values of entity, e.g. every subject. Values of
+        index entities have no leading zeros, and are sorted as numbers.
+        '''
+        if entity not in self._columns:
+            return []
+        key = _index_sort_key if entity in _INDEX_ENTITIES else None
+        return sorted(self._columns[entity][1].keys(),key=key)
+
+    def get(self,**entities):
+        '''
+        return the sorted absolute paths of the files matching every entity,
+        as BIDSLayout.get(return_type="filename") would. Each value may be a
+        single value, a list of values (any of which matches), or None (files
+        without the entity). Values are matched as strings, and extensions
+        with or without a leading ".".
+
+        >>> index.get(subject='01',task='rest',extension=['nii.gz','nii'])
+        '''
+        return [ os.path.join(self.root,self._paths[i]) for i in self._ids(entities) ]
+
+    def get_metadata(self,path):
+        '''
+        return the json sidecar metadata of path, merged with the sidecars it
+        inherits from higher directories (those with the same suffix and a
+        subset of its entities), as BIDSLayout.get_metadata() does.
+        '''
+        rel = os.path.relpath(os.path.abspath(path),self.root)
+        entities = parse_bids_filenames([rel]).row(0)
+        sidecars = []
+        for i in self._ids({'suffix':entities.get('suffix'),'extension':'json'}):
+            candidate = self._paths[i]
+            d = os.path.dirname(candidate)
+            if d and not(rel.startswith(d + os.sep)):
+                continue
+            c = parse_bids_filenames([candidate]).row(0)
+            if all( k in entities and _value_key(k,entities[k]) == _value_key(k,v) for k,v in c.items() if k != 'extension' ):
+                sidecars.append((candidate.count(os.sep),candidate))
+        metadata = {}
+        for _,candidate in sorted(sidecars):
+            with open(os.path.join(self.root,candidate),'r') as sidecar:
+                metadata.update(json.load(sidecar))
+        return metadata
+
+    def _ids(self,entities):
+        '''
+        (internal use) sorted ids of the files matching every entity. The
+        entity matching the fewest files selects candidates from its postings,
+        which the other entities filter by their codes.
+        '''
+        n = len(self._paths)
+        filters = []
+        for entity,value in entities.items():
+            codes,lookup = self._columns.get(entity,(None,{}))
+            if value is None:
+                wanted = frozenset([-1])
+            else:
+                if not(isinstance(value,(list,tuple,set))):
+                    value = [value]
+                wanted = frozenset( lookup[v] for v in (_value_key(entity,x) for x in value) if v in lookup )
+                if not(wanted):
+                    return []
+            if codes is not None:
+                filters.append((entity,codes,wanted))
+        if not(filters):
+            return range(n)
+        size = lambda f: n if -1 in f[2] else sum( len(self._postings[f[0]][c]) for c in f[2] )
+        filters.sort(key=size)
+        entity,codes,wanted = filters[0]
+        if -1 in wanted:
+            ids = [ i for i,c in enumerate(codes) if c in wanted ]
+        elif len(wanted) == 1:
+            ids = self._postings[entity][next(iter(wanted))]
+        else:
+            ids = sorted( i for c in wanted for i in self._postings[entity][c] )
+        for entity,codes,wanted in filters[1:]:
+            ids = [ i for i in ids if codes[i] in wanted ]
+        return ids
+
+def _value_key(entity,value):
+    '''
+    (internal use) indexed form of a query value: a str, extensions without
+    a leading ".", and index values without leading zeros
+    '''
+    value = str(value)
+    if entity == 'extension':
+        return value.lstrip('.')
+    return _index_value(value) if entity in _INDEX_ENTITIES else value
+
+def _index_value(value):
+    '''(internal use) index value without leading zeros, e.g. "1" for "01"'''
+    return str(int(value)) if value.isascii() and value.isdigit() else value
+
+def _index_sort_key(value):
+    '''(internal use) sort index values as numbers, after any that are not'''
+    return (True,int(value),'') if value.isascii() and value.isdigit() else (False,0,value)
+
+def _merge_index_values(codes,categories):
+    '''
+    (internal use) codes and categories of an index entity, with values that
+    are the same number (e.g. "1" and "01") merged into one without leading
+    zeros
+    '''
+    lookup = {}
+    remap = [ lookup.setdefault(_index_value(v),len(lookup)) for v in categories ]
+    if len(lookup) < len(categories):
+        codes = array('l',( remap[c] if c >= 0 else -1 for c in codes ))
+    return codes,list(lookup.keys())
@@ -12,6 +12,9 @@ class WildcardNotIterableError(Exception):
 
 class AppConfigError(Exception):
     '''errors related to app config file'''
+
+class PatchError(Exception):
+    '''errors applying a Menu or App patch'''
     
 class PathNotExistError(Exception):
     '''Exception raised for errors in filepaths'''
@@ -0,0 +1,93 @@
+"""streaming cartesian expansion of templates over wildcard values"""
+import itertools as it
+from neuromake.template import compile_template
+from neuromake.wildcard import TemplateWildcard, _is_array
+
+class Expansion:
+    '''
+    lazy equivalent of snakemake's expand(): every path rendered from one or
+    more templates over the cartesian product of wildcard values. Paths are
+    yielded one at a time, so the full product is never held in memory, and
+    len() is computed without rendering anything.
+
+    Unlike expand(), each template is only expanded over the wildcards it
+    uses, so wildcards missing from a template don't produce duplicate paths.
+    Paths are ordered by the wildcards' order (e.g. the bids Menu order, with
+    subject first), so all paths for one subject are yielded together.
+    '''
+    def __init__(self,templates,wildcards,allow_missing=False):
+        '''
+        templates: (str, TemplateWildcard, or list of these) template(s) to
+        expand
+        wildcards: (dict) wildcard labels and values, e.g. config['bids'] or
+        Menu.to_dict(). Lists, ranges and arrays are expanded over; single
+        values are used as-is; None values are treated as missing.
+        allow_missing: (bool) leave fields that have no wildcard value as
+        "{field}" instead of raising KeyError, like snakemake's
+        expand(..., allow_missing=True) [DEFAULT: False]
+        '''
+        self._plans = []
+        for template in _flatten_templates(templates):
+            plan = compile_template(template)
+            labels = [ k for k in wildcards.keys() if k in plan.field_names and wildcards[k] is not None ]
+            values = [ _as_values(wildcards[k]) for k in labels ]
+            for field_name in plan.field_names:
+                if field_name not in labels:
+                    if not(allow_missing):
+                        raise KeyError(f'no wildcard value for field "{field_name}" in template "{template}".')
+                    labels.append(field_name)
+                    values.append([_MissingField(field_name)])
+            self._plans.append((plan.positional_renderer(labels),values))
+
+    def __iter__(self):
+        '''yield every expanded path'''
+        for render,values in self._plans:
+            yield from map(render,it.product(*values))
+
+    def __len__(self):
+        '''number of expanded paths, computed without expanding'''
+        n = 0
+        for _,values in self._plans:
+            combos = 1
+            for v in values:
+                combos *= len(v)
+            n += combos
+        return n
+
+    def chunks(self,size):
+        '''yield expanded paths in lists of at most size paths'''
+        paths = iter(self)
+        while True:
+            chunk = list(it.islice(paths,size))
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+class _MissingField(str):
+    '''(internal use) renders as its own "{field}" placeholder'''
+    def __format__(self,format_spec):
+        return '{' + str(self) + (f':{format_spec}' if format_spec else '') + '}'
+
+def _flatten_templates(templates):
+    '''(internal use) list of template strings from templates'''
+    if not(isinstance(templates,list)):
+        templates = [templates]
+    out = []
+    for t in templates:
+        if isinstance(t,TemplateWildcard):
+            t = t.value
+        if isinstance(t,list):
+            out.extend(_flatten_templates(t))
+        elif isinstance(t,str):
+            out.append(t)
+        else:
+            raise TypeError(f'templates must be str or TemplateWildcard, not {type(t).__name__}.')
+    return out
+
+def _as_values(value):
+    '''(internal use) a wildcard value as a sequence of values to expand over'''
+    if isinstance(value,(list,tuple,range)):
+        return value
+    if _is_array(value):
+        return value.tolist()
+    return [value]
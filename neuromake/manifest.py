@@ -0,0 +1,165 @@
+"""precompiled target manifests: every path rendered from templates, by subject"""
+import os
+import json
+import hashlib
+import tempfile
+import time
+import itertools as it
+from neuromake.template import compile_template
+from neuromake.expand import _flatten_templates, _as_values
+
+# bump when the manifest layout changes, so that old manifests are rewritten
+_MANIFEST_FORMAT = 2
+
+# first line of a manifest, naming the fingerprint of the paths it holds
+_HEADER = '# neuromake manifest {}\n'
+
+# times read_manifest() re-reads the index of a manifest being rewritten
+_READ_ATTEMPTS = 20
+
+def write_manifest(path,templates,wildcards,force=False):
+    '''
+    render every path from templates over wildcards (as Expansion does) into
+    path, one per line, grouped by subject: first the paths from templates
+    without a "subject" field, then each subject's paths in turn. The byte
+    range of each group is recorded in an index next to path
+    (<path>.index.json), with a fingerprint of templates and wildcards; if
+    the fingerprint is unchanged the manifest is not rewritten. The
+    fingerprint is also written as the manifest's first line, so that
+    readers can tell a manifest from its index while both are replaced.
+
+    path: (str) manifest path
+    templates: (str, TemplateWildcard, or list of these) template(s)
+    wildcards: (dict) wildcard labels and values, e.g. config['bids']
+    force: (bool) rewrite the manifest even if it is up to date [DEFAULT: False]
+
+    Returns True if the manifest was written, False if it was up to date.
+    '''
+    templates = _flatten_templates(templates)
+    fingerprint = _fingerprint(templates,wildcards)
+    if not(force):
+        index = _read_index(path)
+        if index is not None and index['fingerprint'] == fingerprint and _read_header(path) == fingerprint:
+            return False
+
+    plans = []
+    for template in templates:
+        plan = compile_template(template)
+        labels = [ k for k in wildcards.keys() if k in plan.field_names and wildcards[k] is not None ]
+        for field_name in plan.field_names:
+            if field_name not in labels:
+                raise KeyError(f'no wildcard value for field "{field_name}" in template "{template}".')
+        values = [ _as_values(wildcards[k]) for k in labels ]
+        subject = labels.index('subject') if 'subject' in labels else None
+        plans.append((plan.positional_renderer(labels),values,subject))
+    subjects = _as_values(wildcards['subject']) if wildcards.get('subject') is not None else []
+
+    index = {'format':_MANIFEST_FORMAT,'fingerprint':fingerprint,'shared':None,'subjects':{}}
+    fd,tmp_path = _mkstemp(path)
+    with os.fdopen(fd,'wb') as manifest:
+        header = _HEADER.format(fingerprint).encode()
+        manifest.write(header)
+        offset = len(header)
+        def write(combos):
+            nonlocal offset
+            start = offset
+            for render,values in combos:
+                lines = '\n'.join(map(render,it.product(*values)))
+                if lines:
+                    data = (lines + '\n').encode()
+                    manifest.write(data)
+                    offset += len(data)
+            return [start,offset]
+        index['shared'] = write( (render,values) for render,values,i in plans if i is None )
+        for s in subjects:
+            index['subjects'][str(s)] = write( (render,values[:i] + [[s]] + values[i+1:]) for render,values,i in plans if i is not None )
+    os.replace(tmp_path,path)
+    fd,tmp_path = _mkstemp(_index_path(path))
+    with os.fdopen(fd,'w') as index_file:
+        json.dump(index,index_file)
+    os.replace(tmp_path,_index_path(path))
+    return True
+
+def read_manifest(path,subject=None):
+    '''
+    return the list of paths in a manifest written by write_manifest(). If
+    subject is given, only that subject's paths are read, e.g. for a
+    snakefile processing one subject. If the manifest is being rewritten,
+    the index is re-read until it matches the manifest.
+
+    path: (str) manifest path
+    subject: (str) subject to read paths for [DEFAULT: None, all paths]
+    '''
+    if subject is None:
+        with open(path,'r') as manifest:
+            lines = manifest.read().splitlines()
+        if lines and lines[0].startswith(_HEADER.format('')[:-1]):
+            del lines[0]
+        return lines
+    for _ in range(_READ_ATTEMPTS):
+        index = _read_index(path)
+        if index is None:
+            raise FileNotFoundError(f'no manifest index for "{path}".')
+        if str(subject) not in index['subjects']:
+            raise ValueError(f'subject "{subject}" not found in manifest "{path}".')
+        with open(path,'rb') as manifest:
+            # the open file keeps this version even if the manifest is replaced
+            if manifest.readline() == _HEADER.format(index['fingerprint']).encode():
+                start,end = index['subjects'][str(subject)]
+                manifest.seek(start)
+                return manifest.read(end - start).decode().splitlines()
+        time.sleep(0.05)
+    raise ValueError(f'manifest "{path}" does not match its index (<path>.index.json); rewrite it with write_manifest().')
+
+def manifest_subjects(path):
+    '''list of subjects in a manifest written by write_manifest()'''
+    index = _read_index(path)
+    if index is None:
+        raise FileNotFoundError(f'no manifest index for "{path}".')
+    return list(index['subjects'].keys())
+
+def _mkstemp(path):
+    '''
+    (internal use) open a uniquely named temporary file next to path, to be
+    moved into place once written. Names aren't derived from the pid, as jobs
+    on different nodes of a shared filesystem may have the same pid.
+    '''
+    return tempfile.mkstemp(dir=os.path.dirname(path) or '.',prefix=os.path.basename(path) + '.',suffix='.tmp')
+
+def _read_header(path):
+    '''(internal use) the fingerprint in the first line of manifest path, or None'''
+    try:
+        with open(path,'rb') as manifest:
+            line = manifest.readline().decode()
+    except (OSError,UnicodeDecodeError):
+        return None
+    prefix = _HEADER.format('')[:-1]
+    return line[len(prefix):-1] if line.startswith(prefix) and line.endswith('\n') else None
+
+def _index_path(path):
+    '''(internal use) path of the index for manifest path'''
+    return f'{path}.index.json'
+
+def _read_index(path):
+    '''(internal use) the index of manifest path, or None if it has none'''
+    try:
+        with open(_index_path(path),'r') as index_file:
+            index = json.load(index_file)
+    except (OSError,ValueError):
+        return None
+    if index.get('format') != _MANIFEST_FORMAT or not(os.path.isfile(path)):
+        return None
+    return index
+
+def _fingerprint(templates,wildcards):
+    '''(internal use) hash of everything a manifest's paths depend on'''
+    content = json.dumps([_MANIFEST_FORMAT,templates,wildcards],default=_jsonable)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def _jsonable(value):
+    '''(internal use) json form of ranges and arrays, for _fingerprint()'''
+    if isinstance(value,range):
+        return ['range',value.start,value.stop,value.step]
+    if hasattr(value,'tolist'):
+        return value.tolist()
+    raise TypeError(f'{type(value).__name__} is not serialisable.')
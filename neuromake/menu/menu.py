@@ -1,12 +1,32 @@
 """menu object, hosting a collection of associated metadata files"""
 import re
-from neuromake.wildcard import Wildcard, PathWildcard, TemplateWildcard
+import json
+import hashlib
+from neuromake.wildcard import Wildcard, PathWildcard, TemplateWildcard, _is_array, _copy_list
+from neuromake.expand import Expansion
+from neuromake.snapshot import MenuSnapshot
+import neuromake.sizing as sizing
 import neuromake.exceptions as err
 
 class Menu:
     """Menu with associated Wildcards"""
+    __slots__ = ('_name','_metadata','_index','_owners','_dict_cache','_dirty','_frozen')
+
+    _WILDCARD_TYPES = ['Wildcard','PathWildcard','TemplateWildcard']
+    _METADATA_DEFAULTS = {
+        'help':None,
+        'required':False,
+        'valid_labels':None,
+        'wildcard_type':'Wildcard',
+    }
+
     def __init__(self,name,wildcard=None,metadata=None):
-        self._WILDCARD_TYPES = ['Wildcard','PathWildcard','TemplateWildcard']
+        self._owners = ()
+        self._dict_cache = {}
+        # labels changed since the last to_dict(), per metadata flag, in the
+        # order they changed: True for labels (re-)added to the Menu
+        self._dirty = {False:{},True:{}}
+        self._frozen = False
         self._name = name
         self._set_metadata_defaults()
         if metadata is not None:
@@ -15,10 +35,30 @@ class Menu:
             else:
                 raise TypeError(f'"metadata" must be type dict, not {type(metadata).__name__}.')
 
-        self._wildcards = []
+        self._index = {}
         if wildcard is not None:
             self.add_wildcard(wildcard)
 
+    def __getstate__(self):
+        '''pickle (and copy) without the cached dicts, which are rebuilt on demand'''
+        return { k:getattr(self,k) for k in ('_name','_metadata','_index','_owners') }
+
+    def __setstate__(self,state):
+        for k,v in state.items():
+            setattr(self,k,v)
+        self._dict_cache = {}
+        self._dirty = {False:{None:False},True:{None:False}}
+        self._frozen = False
+
+    @property
+    def _wildcards(self):
+        '''
+        (list) wildcards within Menu, in insertion order. Wildcards are stored
+        in _index, an insertion-ordered dict from label to Wildcard, so lookups
+        by label take constant time.
+        '''
+        return list(self._index.values())
+
     @property
     def name(self):
         return self._name
@@ -26,7 +66,13 @@ class Menu:
     @name.setter
     def name(self,name):
         self._validate_name(name)
+        for owner in self._owners:
+            owner._validate_rename(self,name)
+        old_name = self._name
         self._name = name
+        self._mark_dirty(None)
+        for owner in self._owners:
+            owner._menu_renamed(self,old_name)
 
     def _validate_name(self,name):
         '''
@@ -42,12 +88,6 @@ class Menu:
 
     def _set_metadata_defaults(self):
         '''set metadata defaults for Menu instance'''
-        self._METADATA_DEFAULTS = {
-            'help':None,
-            'required':False,
-            'valid_labels':None,
-            'wildcard_type':'Wildcard',
-        }
         self._metadata = self._METADATA_DEFAULTS
 
     def set_metadata(self,**kwargs):
@@ -85,6 +125,7 @@ class Menu:
             raise ValueError(f'"valid_wildcard_type" must be one of {self._WILDCARD_TYPES}.')
 
         self._metadata = metadata
+        self._mark_dirty(None)
 
     def add_wildcard(self,wildcard):
         '''add Wildcard (or list of Wildcards) to Menu'''
@@ -93,7 +134,9 @@ class Menu:
                 self.add_wildcard(w)
         else:
             self._validate_wildcard(wildcard)
-            self._wildcards.append(wildcard)
+            self._index[wildcard.label] = wildcard
+            wildcard._owners += (self,)
+            self._mark_dirty(wildcard.label,added=True)
 
     def _validate_wildcard(self,wildcard):
         '''
@@ -111,38 +154,82 @@ class Menu:
             if not(isinstance(wildcard,TemplateWildcard)):
                 raise err.WildcardTypeError(f'wildcard must be type "TemplateWildcard".')
 
-        if wildcard.label in [ w.label for w in self._wildcards ]:
+        if wildcard.label in self._index:
             raise err.WildcardValueError(f'Wildcard "{wildcard.label}" already exists in Menu {self.name}.')
 
     def _validate_wildcard_label(self,wildcard_label):
         '''
         perform validation checks prior to referencing wildcard_label
         1. wildcard_label must be a str instance
-        2. wildcard_label must exist for a wildcard in _wildcards
+        2. wildcard_label must exist for a wildcard in Menu
         '''
         if not(isinstance(wildcard_label,str)):
             raise TypeError(f'wildcard_label must be str, not {type(wildcard_label).__name__}.')
-        if not(wildcard_label in [ w.label for w in self._wildcards ]):
+        if not(wildcard_label in self._index):
             raise ValueError(f'"{wildcard_label}" not found in wildcards.')
 
     def get_wildcard(self,wildcard_label):
         '''retreive wildcard from menu'''
         self._validate_wildcard_label(wildcard_label)
-        return [ w for w in self._wildcards if w.label == wildcard_label ][0]
+        return self._index[wildcard_label]
+
+    def set_values(self,values):
+        '''
+        bulk-assign values to wildcards within Menu.
+
+        values: (dict) wildcard labels and their new values. Values for iterable
+        wildcards may be any iterable (e.g., a generator). Every value is
+        validated before any wildcard is changed, so either all values are
+        assigned or, if any is invalid, none are.
+        '''
+        staged = []
+        for wildcard_label,value in values.items():
+            w = self.get_wildcard(wildcard_label)
+            value = w._prepare_value(value)
+            w._value_validation(value)
+            staged.append((w,value))
+        for w,value in staged:
+            w._assign_value(value)
 
     def remove_wildcard(self,wildcard_label):
         '''remove Wildcard (or list of Wildcards) to Menu'''
+        if isinstance(wildcard_label,list):
+            self.remove_wildcards(wildcard_label)
+            return
         w = self.get_wildcard(wildcard_label)
         if w._metadata['required']:
             raise err.WildcardRequiredError(f'"{w.label}" is required and cannot be removed.')
-        self._wildcards.remove(w)
+        del self._index[wildcard_label]
+        self._release(w)
+        self._mark_dirty(wildcard_label)
+
+    def remove_wildcards(self,wildcard_labels):
+        '''
+        remove several wildcards from Menu in a single pass.
+
+        wildcard_labels: (iterable of str) labels of wildcards to remove. Every
+        label is checked before any wildcard is removed, so if one is missing
+        or required, the Menu is left unchanged.
+        '''
+        removed = {}
+        for wildcard_label in wildcard_labels:
+            w = self.get_wildcard(wildcard_label)
+            if w._metadata['required']:
+                raise err.WildcardRequiredError(f'"{w.label}" is required and cannot be removed.')
+            removed[wildcard_label] = w
+        if len(removed) == 0:
+            return
+        self._index = { k:w for k,w in self._index.items() if k not in removed }
+        for w in removed.values():
+            self._release(w)
+        self._mark_dirty(None)
 
     def reset(self):
         '''
         clear values for all wildcard variables, set values to defaults if present.
         '''
-        for w in self._wildcards:
-            w.value = w._metadata['default']
+        # defaults are copied, as the metadata holding them is shared
+        self.set_values({ label:_copy_list(w._metadata['default']) for label,w in self._index.items() })
 
     def factory_reset(self,force=False):
         '''
@@ -152,30 +239,379 @@ class Menu:
         force: (bool) remove required wildcards too. [DEFAULT: False]
         '''
         if force:
-            self._wildcards = []
+            for w in self._index.values():
+                self._release(w)
+            self._index = {}
             self._metadata = {}
         else:
-            n_required = len([w for w in self._wildcards if w._metadata['required']])
-            i = 0
-            while len(self._wildcards) > n_required:
-                if self._wildcards[i]._metadata['required']:
-                    self._wildcards[i].value = self._wildcards[i]._metadata['default']
-                    i += 1
+            kept = {}
+            for label,w in self._index.items():
+                if w._metadata['required']:
+                    kept[label] = w
                 else:
-                    self._wildcards.remove(self._wildcards[i])
+                    self._release(w)
+            self._index = kept
+            self.reset()
+        self._mark_dirty(None)
+
+    def expand(self,templates,allow_missing=False):
+        '''
+        lazily expand template(s) over the values of wildcards in this Menu
+        (e.g. the bids Menu). Returns an Expansion, which yields paths one at
+        a time, supports len() without expanding, and can be read in chunks.
+
+        templates: (str, TemplateWildcard, or list of these) template(s)
+        allow_missing: (bool) leave fields with no wildcard in this Menu as
+        "{field}" instead of raising KeyError [DEFAULT: False]
+        '''
+        return Expansion(templates,{ label:w.value for label,w in self._index.items() },allow_missing=allow_missing)
+
+    def n_combinations(self,labels=None,per_subject=False):
+        '''
+        number of combinations of wildcard values in Menu (e.g. the bids
+        Menu), computed in closed form and without changing the Menu.
+
+        labels: (list of str) labels of wildcards to combine [DEFAULT: all]
+        per_subject: (bool) leave out "subject", giving the number of
+        combinations for each subject [DEFAULT: False]
+        '''
+        return sizing.count_combinations(self._values(),labels,exclude=_per_subject_exclude(per_subject))
+
+    def n_combinations_per_filetype(self,per_subject=False):
+        '''
+        dict of the number of combinations for each bids file type in Menu,
+        combining the file type's wildcards (e.g. "func_task") with those
+        shared by all file types (e.g. "subject").
+
+        per_subject: (bool) leave out "subject" [DEFAULT: False]
+        '''
+        return sizing.combinations_per_filetype(self._values(),exclude=_per_subject_exclude(per_subject))
+
+    def _values(self):
+        '''(internal use) dict of wildcard labels and values'''
+        return { label:w._value for label,w in self._index.items() }
+
+    def diff(self,other):
+        '''
+        return a patch (a json-serialisable dict) that turns this Menu into
+        other when passed to apply_patch(). The patch only lists wildcards
+        that were added, removed or changed, and lists that only grew are
+        recorded as the appended values. Each changed wildcard also records a
+        digest of its value and metadata in this Menu ("base"), so that
+        apply_patch() can tell when the patch was made from another state. An
+        empty dict means the Menus are equal. Added wildcards are appended, so
+        the order of wildcards common to both Menus is kept.
+
+        other: (Menu or MenuSnapshot) target Menu
+        '''
+        old = self._current_dict(True)
+        new = other._current_dict(True)
+        old_meta = old['__metadata__']
+        new_meta = new['__metadata__']
+        patch = {}
+        if other.name != self.name:
+            patch['name'] = other.name
+        if old_meta[self.name] != new_meta[other.name]:
+            patch['metadata'] = new_meta[other.name]
+        removed = [ label for label in old if label not in new ]
+        added = {}
+        changed = {}
+        for label,value in new.items():
+            if label == '__metadata__':
+                continue
+            if label not in old or old_meta[label]['wildcard_type'] != new_meta[label]['wildcard_type']:
+                if label in old:
+                    removed.append(label)
+                added[label] = {'value':value,'metadata':new_meta[label]}
+                continue
+            change = {}
+            if old_meta[label] != new_meta[label]:
+                change['metadata'] = new_meta[label]
+            if not(_same_value(old[label],value)):
+                change.update(_value_patch(old[label],value))
+            if change:
+                change['base'] = _wildcard_digest(old[label],old_meta[label],change)
+                changed[label] = change
+        if removed:
+            patch['removed'] = removed
+        if added:
+            patch['added'] = added
+        if changed:
+            patch['changed'] = changed
+        return patch
+
+    def apply_patch(self,patch):
+        '''
+        apply a patch from diff(). Every change is validated before any is
+        made, so either the whole patch is applied or, if any part is invalid,
+        the Menu is left unchanged. Raises PatchError if the patch was made
+        from a different state of this Menu: a wildcard it removes or changes
+        is missing, or a changed wildcard's value or metadata differs from the
+        one the patch was made from. Wildcards changed by the patch are
+        updated in place, and never share values with the patch.
+        '''
+        self._stage_patch(patch)()
+
+    def _stage_patch(self,patch):
+        '''
+        (internal use) validate a patch and return a function that applies it
+        '''
+        commits = []
+        if 'name' in patch:
+            self._validate_name(patch['name'])
+            for owner in self._owners:
+                owner._validate_rename(self,patch['name'])
+            commits.append(lambda: setattr(self,'name',patch['name']))
+
+        metadata = self._metadata
+        if 'metadata' in patch:
+            metadata = Menu(self.name,metadata=patch['metadata'])._metadata
+            commits.append(lambda: self._replace_metadata(metadata))
+        target = Menu(self.name,metadata=metadata)
+
+        removed = set()
+        for label in patch.get('removed',[]):
+            removed.add(self._patched_wildcard(label).label)
+        if removed:
+            commits.append(lambda: self._drop_wildcards(removed))
+
+        current = self._current_dict(True) if patch.get('changed') else None
+        for label,change in patch.get('changed',{}).items():
+            w = self._patched_wildcard(label)
+            if 'base' in change and _wildcard_digest(current[label],current['__metadata__'][label],change) != change['base']:
+                raise err.PatchError(f'cannot change "{label}": patch was made from a different value.')
+            commits.append(self._stage_change(w,change))
+
+        added = []
+        for label,wildcard_dict in patch.get('added',{}).items():
+            if label in self._index and label not in removed:
+                raise err.WildcardValueError(f'Wildcard "{label}" already exists in Menu {self.name}.')
+            w = _wildcard_from_dict(label,wildcard_dict['value'],wildcard_dict['metadata'])
+            target._validate_wildcard(w)
+            added.append(w)
+        if added:
+            commits.append(lambda: self.add_wildcard(added))
+
+        def commit():
+            for c in commits:
+                c()
+        return commit
+
+    def _patched_wildcard(self,label):
+        '''(internal use) wildcard with label, which a patch expects to exist'''
+        if label not in self._index:
+            raise err.PatchError(f'Wildcard "{label}" does not exist in Menu {self.name}: patch was made from a different state.')
+        return self._index[label]
+
+    def _stage_change(self,w,change):
+        '''
+        (internal use) validate a changed-wildcard entry of a patch and return
+        a function that applies it
+        '''
+        value = w._value
+        if 'extend' in change:
+            if not(isinstance(value,(list,range)) or _is_array(value)) or len(value) != change['length']:
+                raise err.PatchError(f'cannot extend "{w.label}": patch was made from a different value.')
+        if 'metadata' in change:
+            if 'value' in change:
+                value = _copy_list(change['value'])
+            elif 'extend' in change:
+                value = list(value) + change['extend']
+            kwargs = {'validation':w.validation} if isinstance(w,PathWildcard) else {}
+            staged = type(w)(w.label,value,{ k:v for k,v in change['metadata'].items() if k != 'wildcard_type' },**kwargs)
+            def commit():
+                w._metadata = staged._metadata
+                if isinstance(w,PathWildcard):
+                    w._unchecked = staged._unchecked
+                w._assign_value(staged._value)
+        elif 'extend' in change:
+            values = w._to_array(change['extend']) if w._metadata['array'] else w._collect_values(change['extend'])
+            w._value_validation(values)
+            commit = lambda: w.extend(values)
+        else:
+            value = w._prepare_value(_copy_list(change['value']))
+            w._value_validation(value)
+            commit = lambda: w._assign_value(value)
+        return commit
+
+    def _replace_metadata(self,metadata):
+        '''(internal use) set already validated Menu metadata'''
+        self._metadata = metadata
+        self._mark_dirty(None)
+
+    def _drop_wildcards(self,labels):
+        '''(internal use) remove wildcards by label, including required ones'''
+        for label in labels:
+            self._release(self._index[label])
+        self._index = { k:w for k,w in self._index.items() if k not in labels }
+        self._mark_dirty(None)
 
     def to_dict(self,metadata=False):
         '''
         get all wildcards labels and values within Menu as dict.
 
         metadata: (bool) return metadata [DEFAULT: False]
+
+        The result is cached, and only wildcards changed since the last call
+        are re-serialised (changes are tracked through the Wildcard and Menu
+        methods, so modify values with w.value = ..., append() or extend()
+        rather than in place). The returned dict (and its "__metadata__" dict) are
+        new on every call, but the values and metadata nested within them are
+        shared with the cache and should not be modified.
         '''
+        cached = self._current_dict(metadata)
+        d = dict(cached)
+        if metadata:
+            d['__metadata__'] = dict(cached['__metadata__'])
+        return {self.name:d}
+
+    def snapshot(self):
+        '''
+        return a read-only MenuSnapshot of the Menu's current state. The
+        snapshot shares the Menu's serialised wildcards, which are copied
+        (once) the next time the Menu changes, so taking a snapshot only costs
+        re-serialising the wildcards changed since the last one.
+        '''
+        d = self._current_dict(True)
+        self._frozen = True
+        return MenuSnapshot(self.name,d)
+
+    def _current_dict(self,metadata):
+        '''
+        (internal use) the cached serialised Menu, brought up to date. The
+        metadata cache is shared with snapshots once frozen, so it is copied
+        before being updated.
+        '''
+        cached = self._dict_cache.get(metadata)
+        dirty = self._dirty[metadata]
+        if cached is None or None in dirty:
+            cached = self._build_dict(metadata)
+            self._dict_cache[metadata] = cached
+            if metadata:
+                self._frozen = False
+        elif dirty:
+            if metadata and self._frozen:
+                cached = dict(cached)
+                cached['__metadata__'] = dict(cached['__metadata__'])
+                self._dict_cache[metadata] = cached
+                self._frozen = False
+            for label in dirty:
+                self._update_dict(cached,label,metadata)
+            if any(dirty.values()):
+                cached = self._reorder_dict(cached,metadata)
+                self._dict_cache[metadata] = cached
+        dirty.clear()
+        return cached
+
+    def _build_dict(self,metadata):
+        '''(internal use) serialise every wildcard, for to_dict()'''
         d = {}
         if metadata:
             d['__metadata__'] = {self.name:{ k:v for k,v in self._metadata.items() if v is not None }}
-        for w in self._wildcards:
-            wildcard_dict = w.to_dict(metadata=metadata)
+        for label in self._index:
+            self._update_dict(d,label,metadata)
+        return d
+
+    def _update_dict(self,d,label,metadata):
+        '''
+        (internal use) re-serialise the wildcard with label into d, or drop it
+        from d if it has been removed from the Menu
+        '''
+        w = self._index.get(label)
+        if w is None:
+            d.pop(label,None)
             if metadata:
-                d['__metadata__'] = {**d['__metadata__'],**wildcard_dict.pop('__metadata__')}
-            d.update(wildcard_dict)
-        return {self.name:d}
+                d['__metadata__'].pop(label,None)
+            return
+        wildcard_dict = w.to_dict(metadata=metadata)
+        d[label] = wildcard_dict[label]
+        if metadata:
+            d['__metadata__'][label] = wildcard_dict['__metadata__'][label]
+
+    def _reorder_dict(self,d,metadata):
+        '''
+        (internal use) copy of d with wildcards in Menu order, after wildcards
+        were added (or removed and re-added) since it was serialised
+        '''
+        out = {}
+        if metadata:
+            meta = d['__metadata__']
+            out['__metadata__'] = {self.name:meta[self.name]}
+            out['__metadata__'].update( (label,meta[label]) for label in self._index )
+        out.update( (label,d[label]) for label in self._index )
+        return out
+
+    def _mark_dirty(self,label,added=False):
+        '''
+        (internal use) record that the wildcard with label changed (or, if
+        label is None, that the whole Menu must be re-serialised), and tell
+        the Apps holding this Menu. added is True if the wildcard was added to
+        the Menu, which may change the order of its wildcards.
+        '''
+        for dirty in self._dirty.values():
+            dirty[label] = dirty.get(label,False) or added
+        for owner in self._owners:
+            owner._menu_changed(self)
+
+    def _release(self,wildcard):
+        '''(internal use) stop tracking changes to a wildcard removed from Menu'''
+        wildcard._owners = tuple( o for o in wildcard._owners if o is not self )
+
+    def _wildcard_changed(self,wildcard):
+        '''(internal use) called by a wildcard in this Menu when it changes'''
+        self._mark_dirty(wildcard.label)
+
+    def _validate_relabel(self,wildcard,label):
+        '''(internal use) called by a wildcard in this Menu before it is relabelled'''
+        if label != wildcard.label and label in self._index:
+            raise err.WildcardValueError(f'Wildcard "{label}" already exists in Menu {self.name}.')
+
+    def _wildcard_relabelled(self,wildcard,old_label):
+        '''(internal use) re-key a relabelled wildcard, keeping its position'''
+        self._index = { (wildcard.label if w is wildcard else k):w for k,w in self._index.items() }
+        self._mark_dirty(None)
+
+def _wildcard_from_dict(label,value,metadata,validation='eager'):
+    '''
+    (internal use) create a wildcard from its serialised value and metadata,
+    where metadata["wildcard_type"] selects the class. A list value is copied,
+    so the wildcard never shares it with e.g. a snapshot or a patch.
+    '''
+    value = _copy_list(value)
+    metadata = dict(metadata)
+    wc_type = metadata.pop('wildcard_type','Wildcard')
+    if wc_type == 'Wildcard':
+        return Wildcard(label,value,metadata)
+    elif wc_type == 'PathWildcard':
+        return PathWildcard(label,value,metadata,validation=validation)
+    elif wc_type == 'TemplateWildcard':
+        return TemplateWildcard(label,value,metadata)
+    raise err.WildcardTypeError(f'Unknown wildcard_type provided ({wc_type}).')
+
+def _per_subject_exclude(per_subject):
+    '''(internal use) labels left out when counting per subject'''
+    return ('subject',) if per_subject else ()
+
+def _same_value(a,b):
+    '''(internal use) True if two serialised wildcard values are equal'''
+    return type(a) is type(b) and a == b
+
+def _wildcard_digest(value,metadata,change):
+    '''
+    (internal use) digest of a serialised wildcard value and its metadata,
+    the base state of a patch entry. Lists that the entry extends, whose
+    length is checked separately, only contribute their last value, so that
+    appending to a long list doesn't cost hashing all of it.
+    '''
+    if 'extend' in change and isinstance(value,list):
+        value = value[-1:]
+    return hashlib.sha1(json.dumps([value,metadata],sort_keys=True).encode()).hexdigest()
+
+def _value_patch(old,new):
+    '''
+    (internal use) patch entry turning serialised value old into new: the
+    appended values if new only extends old, otherwise the whole new value
+    '''
+    if isinstance(old,list) and isinstance(new,list) and len(new) > len(old) and new[:len(old)] == old:
+        return {'extend':new[len(old):],'length':len(old)}
+    return {'value':new}
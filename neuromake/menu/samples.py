@@ -2,14 +2,10 @@
 
 from .menu import Menu
 from ..wildcard import Wildcard, PathWildcard, TemplateWildcard
-import importlib.resources
-import json
+from ..bids import _BIDS_INFO, _WILDCARD_LABELS, add_prefix
 
 __ALL__ = ['create_bids_menu']
 
-with importlib.resources.open_text('neuromake.resources','bids_info.json') as x:
-    _BIDS_INFO = json.load(x)
-
 def create_bids_menu(filetype,level='minimal'):
     '''
     make a sample bids menu.
@@ -17,8 +13,6 @@ def create_bids_menu(filetype,level='minimal'):
     - filetype (str or list of str): "bids file type(s) to include"
     - level (str): "minimal" or "all" [default: "minimal"]
     '''
-    global _BIDS_INFO
-
     DEFAULT_METADATA = {
         'var_type':'str',
         'iterable':True,
@@ -32,14 +26,6 @@ def create_bids_menu(filetype,level='minimal'):
         "(e.g., acquisition) are given a prefix to make them unique."
     )
 
-    valid_menu_labels = []
-    for k,v in _BIDS_INFO.items():
-        prefix = ''
-        if k != 'base':
-            prefix = f'{k}_'
-        x = [ f'{prefix}{label}' for label in v['labels']['all']]
-        valid_menu_labels.extend(x)
-
     if isinstance(filetype,str):
         filetype = [filetype]
     if not(isinstance(filetype,list)):
@@ -50,10 +36,6 @@ def create_bids_menu(filetype,level='minimal'):
 
     wildcards = []
     for x in filetype:
-        if x == 'base':
-            prefix=''
-        else:
-            prefix=f'{x}_'
         if x not in _BIDS_INFO.keys():
             msg = (
             f'"{x}" is not a recognized file type. Must be one of '
@@ -70,13 +52,13 @@ def create_bids_menu(filetype,level='minimal'):
             metadata = DEFAULT_METADATA.copy()
             if label in _BIDS_INFO[x]['labels']['minimal']:
                 metadata['required'] = True
-            w = Wildcard(f'{prefix}{label}',None,metadata=metadata)
+            w = Wildcard(add_prefix(label,x),None,metadata=metadata)
             wildcards.append(w)
 
     menu_metadata = {
         'help': MENU_HELP_TXT,
         'required':True,
-        'valid_labels':valid_menu_labels
+        'valid_labels':list(_WILDCARD_LABELS)
     }
     menu = Menu('bids',wildcard=wildcards,metadata=menu_metadata)
     return menu
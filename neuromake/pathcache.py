@@ -0,0 +1,102 @@
+"""cached, batched filesystem existence checks for PathWildcards"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class PathCache:
+    '''
+    answers "does this path exist?" from cached directory listings. Each
+    directory is read once with os.scandir, so sibling paths are resolved
+    together. With a ttl, listings are reused across calls until they are
+    older than ttl seconds. Paths missing from a listing are confirmed with a
+    direct stat, so a stale or case-insensitive listing never reports a false
+    negative; a stale listing may however report a path deleted since it was
+    read, so reuse is opt-in.
+    '''
+    def __init__(self,ttl=0,max_workers=8):
+        '''
+        ttl: (numeric) seconds a directory listing stays valid. With the
+        default of 0, directories are listed afresh on every call, which
+        still batches the paths passed to one exists_many() call [DEFAULT: 0]
+        max_workers: (int) maximum threads listing directories concurrently
+        in exists_many() [DEFAULT: 8]
+        '''
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self._listings = {}
+
+    def clear(self):
+        '''drop all cached directory listings'''
+        self._listings = {}
+
+    def exists(self,path):
+        '''return True if path exists (following symlinks)'''
+        return self.exists_many([path])[0]
+
+    def exists_many(self,paths,refresh=False):
+        '''
+        return a list of bools, True for each path in paths that exists. Every
+        uncached parent directory is listed once, concurrently across up to
+        max_workers threads.
+
+        refresh: (bool) re-list every parent directory, ignoring cached
+        listings within ttl [DEFAULT: False]
+        '''
+        paths = [ os.fspath(p) or '.' for p in paths ]
+        keys = [ self._split(p) for p in paths ]
+        now = time.monotonic()
+        stale = { d for d,_ in keys if d is not None and (refresh or not(self._is_fresh(d,now))) }
+        if len(stale) == 1 or self.max_workers <= 1:
+            for d in stale:
+                self._listings[d] = (now,_list_dir(d))
+        elif len(stale) > 1:
+            stale = list(stale)
+            with ThreadPoolExecutor(max_workers=min(self.max_workers,len(stale))) as pool:
+                for d,listing in zip(stale,pool.map(_list_dir,stale)):
+                    self._listings[d] = (now,listing)
+        out = []
+        for p,(d,name) in zip(paths,keys):
+            if d is None:
+                out.append(os.path.exists(p))
+                continue
+            listing = self._listings[d][1]
+            if listing is None:
+                out.append(os.path.exists(p))
+            else:
+                out.append(name in listing or os.path.exists(p))
+        return out
+
+    def _is_fresh(self,d,now):
+        '''(internal use) True if a listing of d is cached and within ttl'''
+        cached = self._listings.get(d)
+        return cached is not None and now - cached[0] < self.ttl
+
+    def _split(self,path):
+        '''
+        (internal use) split path into (absolute parent directory, name). Paths
+        that can't be resolved from a parent listing (e.g. ".", "..", "/") are
+        returned as (None, None) and are stat'ed directly.
+        '''
+        head,tail = os.path.split(path.rstrip(os.sep) or path)
+        if tail in ('','.','..'):
+            return None,None
+        if not(os.path.isabs(head)):
+            head = os.path.join(os.getcwd(),head)
+        return head,tail
+
+def _list_dir(d):
+    '''
+    (internal use) frozenset of existing entry names in directory d. Broken
+    symlinks are left out, matching os.path.exists. Returns an empty set if d
+    does not exist, or None if d can't be listed (paths are then stat'ed).
+    '''
+    try:
+        with os.scandir(d) as it:
+            return frozenset(
+                e.name for e in it
+                if not(e.is_symlink()) or os.path.exists(e.path)
+            )
+    except (FileNotFoundError,NotADirectoryError):
+        return frozenset()
+    except OSError:
+        return None
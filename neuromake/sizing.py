@@ -0,0 +1,73 @@
+"""closed-form sizing of the job space defined by wildcard values"""
+from neuromake.template import compile_template
+from neuromake.bids import _FILETYPES
+
+def n_values(value):
+    '''
+    number of values a wildcard value expands to: its length for lists,
+    tuples, ranges and arrays, and 1 for single values and None (unset)
+    '''
+    if isinstance(value,(list,tuple,range)) or hasattr(value,'__array__'):
+        return len(value)
+    return 1
+
+def count_combinations(wildcards,labels=None,exclude=()):
+    '''
+    number of combinations of wildcard values, computed without building
+    them. wildcards is not modified.
+
+    wildcards: (dict) wildcard labels and values, e.g. config['bids']
+    labels: (list of str) labels to combine [DEFAULT: every label]
+    exclude: (list of str) labels to leave out, e.g. ['subject'] to count
+    combinations per subject [DEFAULT: ()]
+    '''
+    if labels is None:
+        labels = wildcards.keys()
+    n = 1
+    for label in labels:
+        if label in wildcards and label not in exclude:
+            n *= n_values(wildcards[label])
+    return n
+
+def filetype_of(label):
+    '''
+    bids file type of a wildcard label (e.g. "func" for "func_task"), or None
+    for labels shared by every file type (e.g. "subject")
+    '''
+    prefix = label.split('_',1)[0]
+    return prefix if prefix != label and prefix in _FILETYPES else None
+
+def combinations_per_filetype(wildcards,exclude=()):
+    '''
+    dict of the number of combinations for each bids file type with
+    wildcards, combining its prefixed wildcards with the shared ones (e.g.
+    "subject" and "session")
+
+    wildcards: (dict) wildcard labels and values, e.g. config['bids']
+    exclude: (list of str) labels to leave out [DEFAULT: ()]
+    '''
+    shared = 1
+    per_filetype = {}
+    for label,value in wildcards.items():
+        if label in exclude:
+            continue
+        filetype = filetype_of(label)
+        if filetype is None:
+            shared *= n_values(value)
+        else:
+            per_filetype[filetype] = per_filetype.get(filetype,1) * n_values(value)
+    return { filetype:n * shared for filetype,n in per_filetype.items() }
+
+def count_template(template,wildcards,exclude=()):
+    '''
+    number of paths a template (or list of templates) expands to over
+    wildcards, as Expansion would render them. Only the wildcards used in
+    each template are combined; fields without a wildcard count once.
+
+    template: (str or list of str) template(s)
+    wildcards: (dict) wildcard labels and values, e.g. config['bids']
+    exclude: (list of str) labels to leave out [DEFAULT: ()]
+    '''
+    if isinstance(template,list):
+        return sum( count_template(t,wildcards,exclude) for t in template )
+    return count_combinations(wildcards,compile_template(template).field_names,exclude)
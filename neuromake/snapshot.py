@@ -0,0 +1,101 @@
+"""read-only, copy-on-write snapshots of Menus and Apps"""
+from neuromake.wildcard import _range_from_spec
+
+class MenuSnapshot:
+    '''
+    read-only state of a Menu, taken with Menu.snapshot(). Snapshots share
+    their serialised wildcards with the Menu (and with other snapshots) until
+    the Menu changes, so they are cheap to take and never change afterwards;
+    they can be handed to other threads while the Menu is edited.
+    '''
+    __slots__ = ('_name','_dict')
+
+    def __init__(self,name,menu_dict):
+        '''
+        name: (str) Menu name
+        menu_dict: (dict) frozen Menu.to_dict(metadata=True) contents, which
+        must not be modified afterwards
+        '''
+        self._name = name
+        self._dict = menu_dict
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def labels(self):
+        '''(list) wildcard labels, in Menu order'''
+        return [ label for label in self._dict if label != '__metadata__' ]
+
+    def get_value(self,wildcard_label):
+        '''retrieve the value of a wildcard, as serialised by Menu.to_dict()'''
+        if wildcard_label == '__metadata__' or wildcard_label not in self._dict:
+            raise ValueError(f'"{wildcard_label}" not found in wildcards.')
+        return self._dict[wildcard_label]
+
+    def to_dict(self,metadata=False):
+        '''
+        get all wildcards labels and values as dict, as returned by
+        Menu.to_dict() when the snapshot was taken.
+
+        metadata: (bool) return metadata [DEFAULT: False]
+        '''
+        if metadata:
+            d = dict(self._dict)
+            d['__metadata__'] = dict(self._dict['__metadata__'])
+        else:
+            d = { k:(list(_range_from_spec(v)) if isinstance(v,dict) else v) for k,v in self._dict.items() if k != '__metadata__' }
+        return {self._name:d}
+
+    def _current_dict(self,metadata):
+        '''(internal use) serialised Menu, for Menu.diff()'''
+        return self._dict
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self._name!r})'
+
+class AppSnapshot:
+    '''
+    read-only state of an App, taken with App.snapshot(), e.g. to undo edits
+    with App.restore() or to preview a config before saving. Menus that did
+    not change between snapshots are shared.
+    '''
+    __slots__ = ('_name','_menus')
+
+    def __init__(self,name,menus):
+        '''
+        name: (str) App name
+        menus: (dict) Menu name to MenuSnapshot, in App order
+        '''
+        self._name = name
+        self._menus = menus
+
+    @property
+    def name(self):
+        return self._name
+
+    def get_menu(self,menu_name):
+        '''get MenuSnapshot by name'''
+        if menu_name not in self._menus:
+            raise ValueError(f'"{menu_name}" is not a valid menu_label.')
+        return self._menus[menu_name]
+
+    def _menus_by_name(self):
+        '''(internal use) dict of MenuSnapshots by name, for App.diff()'''
+        return self._menus
+
+    def to_dict(self,metadata=False):
+        '''
+        return dictionary with all app data, as returned by App.to_dict()
+        when the snapshot was taken.
+
+        metadata: (bool) include metadata [DEFAULT: False]
+        '''
+        d = {}
+        for menu in self._menus.values():
+            d.update(menu.to_dict(metadata=metadata))
+        return {self._name:d}
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self._name!r})'
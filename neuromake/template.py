@@ -0,0 +1,162 @@
+"""compiled render plans and matchers for neuromake template strings"""
+import re
+from functools import lru_cache
+from string import Formatter
+
+# format specs containing any of these characters are rendered with
+# str.format_map rather than a generated f-string
+_UNSAFE_SPEC_CHARS = set('\'"\\{}\n\r')
+
+# conversions allowed after "!" in a field, as in str.format
+_CONVERSIONS = (None,'r','s','a')
+
+# regex matched by each field when parsing paths back into wildcards: one or
+# more characters within a single path component
+_FIELD_REGEX = r'[^/]+?'
+
+class TemplatePlan:
+    '''
+    a template string parsed once into literal segments and field slots, with
+    a generated render function and an anchored regex to parse rendered paths
+    back into wildcards. Use compile_template() rather than creating
+    TemplatePlans directly, so that plans are shared.
+    '''
+    __slots__ = ('template','literals','fields','field_names','_render','_regex')
+
+    def __init__(self,template):
+        '''
+        template: (str) python format string, e.g. "sub-{subject}_task-{func_task}"
+        '''
+        literals = []
+        fields = []
+        for literal,field_name,format_spec,conversion in Formatter().parse(template):
+            # checked here, as str.format would, rather than left to the
+            # generated render function
+            if conversion not in _CONVERSIONS:
+                raise ValueError(f'Unknown conversion specifier {conversion}')
+            if len(literals) > len(fields):
+                literals[-1] += literal
+            else:
+                literals.append(literal)
+            if field_name is not None:
+                fields.append((field_name,conversion,format_spec))
+        if len(literals) == len(fields):
+            literals.append('')
+        self.template = template
+        self.literals = tuple(literals)
+        self.fields = tuple(fields)
+        self.field_names = tuple(dict.fromkeys(f[0] for f in fields))
+        self._render = self._compile_render()
+        self._regex = None
+
+    def render(self,wildcards):
+        '''
+        return the template formatted with the dict wildcards. Equivalent to
+        template.format(**wildcards): extra keys are ignored and a missing key
+        raises KeyError.
+        '''
+        return self._render(wildcards)
+
+    @property
+    def regex(self):
+        '''
+        compiled regex matching paths rendered from the template, with a named
+        group per field. Repeated fields must match the same value. Compiled on
+        first use.
+        '''
+        if self._regex is None:
+            self._regex = self._compile_regex()
+        return self._regex
+
+    def match(self,path):
+        '''
+        return a dict of wildcard values parsed from path, or None if path
+        does not match the template.
+        '''
+        m = self.regex.match(path)
+        return None if m is None else m.groupdict()
+
+    def match_many(self,paths):
+        '''
+        yield a dict of wildcard values for each path in paths (any iterable,
+        e.g. a generator walking a derivatives tree) that matches the template.
+        Paths that don't match are skipped.
+        '''
+        for m in map(self.regex.match,paths):
+            if m is not None:
+                yield m.groupdict()
+
+    def _compile_regex(self):
+        '''
+        (internal use) build the anchored regex for match(). Fields must be
+        valid python variable names to be used as named groups.
+        '''
+        seen = set()
+        parts = [r'\A']
+        for i,literal in enumerate(self.literals):
+            parts.append(re.escape(literal))
+            if i < len(self.fields):
+                field_name = self.fields[i][0]
+                if not(field_name.isidentifier()):
+                    raise ValueError(f'cannot match template field "{field_name}" (fields must be valid python variable names).')
+                if field_name in seen:
+                    parts.append(f'(?P={field_name})')
+                else:
+                    parts.append(f'(?P<{field_name}>{_FIELD_REGEX})')
+                    seen.add(field_name)
+        parts.append(r'\Z')
+        return re.compile(''.join(parts))
+
+    def positional_renderer(self,labels):
+        '''
+        return a render function taking a tuple of values ordered as labels
+        (which must include every field), instead of a dict. This avoids
+        building a dict per path when rendering from itertools.product.
+        '''
+        labels = list(labels)
+        for field_name in self.field_names:
+            if field_name not in labels:
+                raise KeyError(field_name)
+        return self._compile_render(labels)
+
+    def _compile_render(self,labels=None):
+        '''
+        (internal use) generate a render function that builds the string with
+        a single f-string. Templates using positional, attribute or index fields,
+        or nested format specs, fall back to str.format_map.
+
+        labels: if None, the function takes a dict; otherwise it takes a tuple
+        of values ordered as labels.
+        '''
+        for field_name,conversion,format_spec in self.fields:
+            if not(field_name.isidentifier()) or _UNSAFE_SPEC_CHARS.intersection(format_spec):
+                if labels is None:
+                    return self.template.format_map
+                format_map = self.template.format_map
+                return lambda values: format_map(dict(zip(labels,values)))
+        namespace = {}
+        parts = []
+        for i,literal in enumerate(self.literals):
+            if literal:
+                namespace[f'_l{i}'] = literal
+                parts.append(f'{{_l{i}}}')
+            if i < len(self.fields):
+                field_name,conversion,format_spec = self.fields[i]
+                conversion = f'!{conversion}' if conversion else ''
+                format_spec = f':{format_spec}' if format_spec else ''
+                key = f'"{field_name}"' if labels is None else labels.index(field_name)
+                parts.append(f'{{_d[{key}]{conversion}{format_spec}}}')
+        src = "def render(_d):\n    return f'" + ''.join(parts) + "'\n"
+        exec(src,namespace)
+        return namespace['render']
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.template!r})'
+
+@lru_cache(maxsize=1024)
+def compile_template(template):
+    '''
+    return the (cached) TemplatePlan for a template string. Raises ValueError
+    if template is not a valid format string.
+    '''
+    return TemplatePlan(template)
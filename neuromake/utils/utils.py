@@ -3,10 +3,12 @@
 import os
 import re
 import json
+from functools import lru_cache
 import nibabel as nib
-import itertools as it
 import neuromake as nm
 import neuromake.exceptions as err
+from neuromake.sizing import count_combinations
+import neuromake.bids as bids
 
 def multireplace(s,rep,match_end=False):
     '''
@@ -18,14 +20,38 @@ def multireplace(s,rep,match_end=False):
     :param match_end: only replace substrings that match the end of string s
     :return: replaced string
     '''
-    new = {}
-    kesc = [ re.escape(k) for k in rep.keys() ]
-    if match_end:
-        pattern = re.compile('$|'.join(kesc)+'$')
-    else:
-        pattern = re.compile('|'.join(kesc))
+    pattern = _multireplace_pattern(tuple(rep.keys()),match_end)
     return pattern.sub(lambda m: rep[m.group(0)],s)
 
+def multireplace_many(strings,rep,match_end=False):
+    '''
+    return list of strings after simultaneous replacement of all possible rep
+    keys() with rep values() in each string. Equivalent to calling
+    multireplace on each string, but the pattern is only looked up once.
+
+    :param strings: iterable of original strings
+    :param rep: dictionary where keys are substrings, and values are replacements
+    :param match_end: only replace substrings that match the end of each string
+    :return: list of replaced strings
+    '''
+    sub = _multireplace_pattern(tuple(rep.keys()),match_end).sub
+    repl = lambda m: rep[m.group(0)]
+    return [ sub(repl,s) for s in strings ]
+
+@lru_cache(maxsize=256)
+def _multireplace_pattern(keys,match_end):
+    '''
+    (internal use) compiled pattern matching any of keys, cached so that
+    repeated replacements with the same mapping don't recompile it
+
+    :param keys: tuple of substrings to match, in order of precedence
+    :param match_end: only match substrings at the end of a string
+    '''
+    kesc = [ re.escape(k) for k in keys ]
+    if match_end:
+        return re.compile('$|'.join(kesc)+'$')
+    return re.compile('|'.join(kesc))
+
 def multireplace_dict_keys(d,rep,match_end=False):
     '''
     return dict 'd' after simultaneous replacement of all possible 'rep' keys()
@@ -36,25 +62,15 @@ def multireplace_dict_keys(d,rep,match_end=False):
     :param match_end: only replace substrings that match the end of any key in 'd'
     :return: replaced dict
     '''
-    new = {}
-    for k in d.keys():
-        new[multireplace(k,rep,match_end=match_end)] = d[k]
-    return new
+    return dict(zip(multireplace_many(d.keys(),rep,match_end=match_end),d.values()))
 
 def get_n_combos_per_subject(d):
     '''
     calculates combinations of bids vars per subject in the specified dictionary
-    this is used to calculate number of expected files when validating subjects
-    '''
-    d.pop('subject',None)
-    vals = []
-    for k,v in d.items():
-        if isinstance(v,list):
-            vals.append(v)
-        else:
-            vals.append([v])
-    combinations = it.product(*vals)
-    return len(list(combinations))
+    this is used to calculate number of expected files when validating subjects.
+    The count is computed in closed form, and d is not modified.
+    '''
+    return count_combinations(d,exclude=('subject',))
 
 def get_bids_vars_dict(bidsfile,add_prefix=True):
     '''
@@ -66,75 +82,39 @@ def get_bids_vars_dict(bidsfile,add_prefix=True):
     :add_prefix: boolean to specify if keys should be prefixed with <filetype>_
     :return: dictionary with bids key-value pairs
     '''
-    config = nm.Config()
-    b = re.split('-|_',os.path.basename(bidsfile))
-    # add suffix/extension
-    b.insert(-1,'suffix')
-    b[-1],ext = b[-1].split('.',1)
-    d = { b[i]:b[i+1] for i in range(0,len(b),2) }
-    d['extension'] = ext
-    # replace labels with variable names
-    label2key = { v:k for k,v in config._bidsKeyNames.items() }
-    d = multireplace_dict_keys(d,label2key,match_end=True)
-
+    d = bids.parse_bids_filenames([bidsfile]).row(0)
     if add_prefix:
-        # get the filetype based on bids suffix
-        filetype = config.get_bids_filetype(bidsfile)
-
-        dout = {}
-        for k,v in d.items():
-            dout[_add_neuromake_prefix(config,k,filetype)] = v
-        return dout
+        filetype = bids.bids_filetype(d)
+        return { bids.add_prefix(k,filetype):v for k,v in d.items() }
     else:
         return d
 
-def _add_neuromake_prefix(config,bidsvar,filetype):
-    '''
-    (internal use) add the neuromake filetype prefix to a bidsvar
-
-    config = dummy config object
-    bidsvar = bids variable (must match one of config._bidsFileTypes)
-    filetype = None, a list of matching filetypes (in case of <matches>), or a
-    string with single matching filetype
-    return [<neuromakeprefix>_]<bidsvar>
-    '''
-    if isinstance(filetype,str):
-        if bidsvar in config._bidsFileTypes[filetype]['labels']:
-            return f'{filetype}_{bidsvar}'
-        else:
-            return bidsvar
-    elif isinstance(filetype,list):
-        for x in reversed(filetype):
-            if bidsvar in config._bidsFileTypes[x]['labels']:
-                return f'{x}_{bidsvar}'
-        return bidsvar
-    else:
-        return bidsvar
-
 def query_bids_layout(layout,d):
     '''
     queries the bids layout given available wildcards dictionary
     returns output from layout.get()
+
+    layout may be a PyBIDS BIDSLayout, or a neuromake.bidsindex.BidsIndex,
+    which is loaded from disk rather than constructed for every job. A
+    BidsIndex returns file paths rather than BIDSFile objects.
     '''
-    rep = {'func_':'','anat_':'','physio_':'','fmap_':''}
-    d = multireplace_dict_keys(d,rep)
+    d = { bids.remove_prefix(k):v for k,v in d.items() }
     return layout.get(**d)
 
 def copy_bids_files(wildcards,layout,output,ext=['nii.gz','nii']):
     '''
-    format snakemake wildcards as dictionary, search through BIDSLayout to
-    find appropriate mri file + associated json.
+    format snakemake wildcards as dictionary, search through BIDSLayout (or
+    BidsIndex) to find appropriate mri file + associated json.
     The associated snakemake rule must have a "nii" and "json" object
     '''
     # create dictionary from wildcards, get extension from output
-    d = vars(wildcards)
-    d.pop('_names',None)
+    d = dict(wildcards.items())
     d['extension'] = ext
-    files = query_bids_layout(d,layout)
+    files = query_bids_layout(layout,d)
     if not(len(files) == 1):
         raise Exception(f'{len(files)} files found when 1 expected. This usually means your bids variables in Config do not match those expected in the dataset')
     else:
-        nib.save(files[0].get_image(),output.nii)
+        path = files[0] if isinstance(files[0],str) else files[0].path
+        nib.save(nib.load(path),output.nii)
         with open(output.json,'w+') as fp:
-            json.dump(d, fp)
-        save_dict_to_json(files[0].get_metadata(),output.json)
+            json.dump(layout.get_metadata(path),fp)
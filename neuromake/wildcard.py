@@ -1,12 +1,231 @@
 """Wildcard class to manage individual wildcard variables"""
-from pathlib import Path
 import re
-from string import Formatter
+import weakref
+from neuromake.pathcache import PathCache
+from neuromake.template import compile_template
 import neuromake.exceptions as err
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_VAR_TYPES = {'int':int,'float':float,'bool':bool,'str':str}
+
+# interned metadata shared between wildcards, see _intern_metadata. Entries
+# are dropped once no wildcard uses them
+_SHARED_METADATA = weakref.WeakValueDictionary()
+
+class _SharedMetadata(dict):
+    '''
+    (internal use) immutable metadata dict. Wildcards with identical metadata
+    share one instance, along with its compiled validation plan.
+    '''
+    __slots__ = ('validation_plan','__weakref__')
+
+    def _immutable(self,*args,**kwargs):
+        raise TypeError('wildcard metadata is shared and immutable, use Wildcard.set_metadata().')
+
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):
+        return (_intern_metadata,(dict(self),))
+
+def _freeze(x):
+    '''
+    (internal use) hashable key for a metadata value. Types are kept in the key
+    so that e.g. 1, 1.0 and True are not interned as the same metadata.
+    '''
+    if isinstance(x,list):
+        return (list,tuple(_freeze(v) for v in x))
+    if isinstance(x,dict):
+        return (dict,tuple(sorted((k,_freeze(v)) for k,v in x.items())))
+    return (type(x),x)
+
+def _intern_metadata(metadata):
+    '''
+    (internal use) return the shared, immutable copy of a validated metadata
+    dict, compiling its validation plan the first time it is seen. Metadata
+    that can't be hashed (e.g. arbitrary unhashable kwargs) is not shared.
+    '''
+    try:
+        key = _freeze(metadata)
+        shared = _SHARED_METADATA.get(key)
+    except TypeError:
+        key = shared = None
+    if shared is None:
+        shared = _SharedMetadata({ k:(list(v) if isinstance(v,list) else v) for k,v in metadata.items() })
+        shared.validation_plan = _compile_validation_plan(shared)
+        if key is not None:
+            _SHARED_METADATA[key] = shared
+    return shared
+
+def _compile_validation_plan(metadata):
+    '''
+    (internal use) compile metadata into a validation plan: a tuple of checks,
+    each of which validates a full list of values against one metadata
+    constraint. Only constraints that are actually set are included, so an
+    unconstrained wildcard runs no per-element checks at all.
+    '''
+    if metadata['array']:
+        return _compile_array_validation_plan(metadata)
+    plan = []
+    if metadata['var_type'] is not None:
+        plan.append(_make_var_type_check(metadata['var_type']))
+    if metadata['min_val'] is not None:
+        plan.append(_make_min_val_check(metadata['min_val']))
+    if metadata['max_val'] is not None:
+        plan.append(_make_max_val_check(metadata['max_val']))
+    if metadata['valid'] is not None:
+        plan.append(_make_valid_check(metadata['valid']))
+    return tuple(plan)
+
+def _compile_array_validation_plan(metadata):
+    '''
+    (internal use) compile metadata into a validation plan for array-backed
+    wildcards. Each check runs as a single vectorized numpy operation.
+    '''
+    plan = [_make_array_var_type_check(metadata['var_type'])]
+    if metadata['min_val'] is not None:
+        plan.append(_make_array_min_val_check(metadata['min_val']))
+    if metadata['max_val'] is not None:
+        plan.append(_make_array_max_val_check(metadata['max_val']))
+    if metadata['valid'] is not None:
+        plan.append(_make_array_valid_check(metadata['valid']))
+    return tuple(plan)
+
+def _copy_list(x):
+    '''
+    (internal use) shallow copy of x if it is a list, so that lists shared
+    with interned metadata or serialised data are never stored or handed out
+    '''
+    return list(x) if isinstance(x,list) else x
+
+def _is_array(x):
+    '''(internal use) True if x is a numpy array'''
+    return np is not None and isinstance(x,np.ndarray)
+
+def _range_from_spec(spec):
+    '''
+    (internal use) build a lazy range value from its serialised spec, a dict
+    with int "start" and "stop" keys and an optional int "step" key.
+    '''
+    keys = set(spec.keys())
+    if not({'start','stop'} <= keys <= {'start','stop','step'}):
+        raise err.WildcardTypeError(f'Invalid data type for {spec} {type(spec)}.')
+    args = [spec['start'],spec['stop'],spec.get('step',1)]
+    for x in args:
+        if type(x) is not int:
+            raise err.WildcardTypeError(f'range {spec} must only contain int values.')
+    if args[2] == 0:
+        raise err.WildcardValueError(f'range {spec} cannot have a step of 0.')
+    return range(*args)
+
+def _range_to_spec(r):
+    '''(internal use) serialise a lazy range value as a dict'''
+    return {'start':r.start,'stop':r.stop,'step':r.step}
+
+def _endpoints(values):
+    '''
+    (internal use) the values that need checking for type and min/max. A
+    range only holds ints between its first and last element, so only those
+    two are checked.
+    '''
+    if isinstance(values,range):
+        return (values[0],values[-1]) if len(values) > 0 else ()
+    return values
+
+def _make_var_type_check(var_type):
+    '''(internal use) build a check that all values are exactly type var_type'''
+    t = _VAR_TYPES[var_type]
+    def check(values):
+        for v in _endpoints(values):
+            if type(v) is not t:
+                raise err.WildcardTypeError(f'{v} is type {type(v).__name__} but should be {var_type}.')
+    return check
+
+def _make_min_val_check(min_val):
+    '''(internal use) build a check that no value is lower than min_val'''
+    def check(values):
+        for v in _endpoints(values):
+            if v < min_val:
+                raise err.WildcardValueError(f'{v} is lower than minimum ({min_val}).')
+    return check
+
+def _make_max_val_check(max_val):
+    '''(internal use) build a check that no value is higher than max_val'''
+    def check(values):
+        for v in _endpoints(values):
+            if v > max_val:
+                raise err.WildcardValueError(f'{v} is higher than maximum ({max_val}).')
+    return check
+
+def _make_valid_check(valid):
+    '''
+    (internal use) build a check that every value is one of valid. Membership
+    is tested against a frozenset, so validating N values costs O(N) no matter
+    how long the valid list is. The list itself is kept for error messages.
+    '''
+    valid_set = frozenset(valid)
+    def check(values):
+        if not(valid_set.issuperset(values)):
+            for v in values:
+                if v not in valid_set:
+                    raise err.WildcardValueError(f'{v} is invalid, must be one of {valid}.')
+    return check
+
+def _make_array_var_type_check(var_type):
+    '''(internal use) build a check that an array holds var_type values'''
+    kinds = {'int':'iu','float':'f'}[var_type]
+    def check(values):
+        if values.dtype.kind not in kinds:
+            raise err.WildcardTypeError(f'array of {values.dtype} values but should be {var_type}.')
+    return check
+
+def _make_array_min_val_check(min_val):
+    '''(internal use) build a check that no array value is lower than min_val'''
+    def check(values):
+        if values.size > 0 and values.min() < min_val:
+            raise err.WildcardValueError(f'{values.min()} is lower than minimum ({min_val}).')
+    return check
+
+def _make_array_max_val_check(max_val):
+    '''(internal use) build a check that no array value is higher than max_val'''
+    def check(values):
+        if values.size > 0 and values.max() > max_val:
+            raise err.WildcardValueError(f'{values.max()} is higher than maximum ({max_val}).')
+    return check
+
+def _make_array_valid_check(valid):
+    '''(internal use) build a check that every array value is one of valid'''
+    valid_array = np.asarray(valid)
+    def check(values):
+        invalid = values[~np.isin(values,valid_array)]
+        if invalid.size > 0:
+            raise err.WildcardValueError(f'{invalid[0]} is invalid, must be one of {valid}.')
+    return check
+
 class Wildcard():
     '''a single variable within a neuromake menu'''
+    __slots__ = ('_label','_value','_metadata','_owners')
+
+    _METADATA_VALID_VARTYPE = ['int','float','bool','str']
+    _VALID_SCALAR_TYPES = (int,float,bool,str)
+    _METADATA_DEFAULTS = _intern_metadata({
+        'help':None,
+        'required':False,
+        'default':None,
+        'var_type':None,
+        'min_val':None,
+        'max_val':None,
+        'valid':None,
+        'iterable':False,
+        'array':None
+    })
+
     def __init__(self,label,value,metadata={}):
+        self._owners = ()
         self._set_metadata_defaults()
         self.set_metadata(**metadata)
         self.label = label
@@ -19,26 +238,22 @@ class Wildcard():
         metadata (bool): If True, include metadata in dictionary under key
         "__metadata__" (default: False)
         '''
-        d = {self.label:self.value}
+        value = self.value
+        if isinstance(value,range):
+            value = _range_to_spec(value) if metadata else list(value)
+        elif _is_array(value):
+            value = value.tolist()
+        elif isinstance(value,list):
+            value = list(value)
+        d = {self.label:value}
         if metadata:
-            m = { k:v for k,v in self._metadata.items() if v is not None }
+            m = { k:_copy_list(v) for k,v in self._metadata.items() if v is not None }
             d['__metadata__'] = {self.label:m}
             d['__metadata__'][self.label]['wildcard_type'] = type(self).__name__
         return d
 
     def _set_metadata_defaults(self):
         '''set metadata defaults for Wildcard'''
-        self._METADATA_VALID_VARTYPE = ['int','float','bool','str']
-        self._METADATA_DEFAULTS = {
-            'help':None,
-            'required':False,
-            'default':None,
-            'var_type':None,
-            'min_val':None,
-            'max_val':None,
-            'valid':None,
-            'iterable':False
-        }
         self._metadata = self._METADATA_DEFAULTS
 
     def set_metadata(self,**kwargs):
@@ -62,12 +277,15 @@ class Wildcard():
             DEFAULT: {self._METADATA_DEFAULTS["valid"]}
         iterable: (bool) specify if value should be singular or multiple.
             DEFAULT: {self._METADATA_DEFAULTS["iterable"]}
+        array: (bool) store an iterable int or float value as a numpy array,
+        so that type and min/max checks are vectorized. Requires numpy.
+            DEFAULT: {self._METADATA_DEFAULTS["array"]}
 
         In addition, one can specify any arbitrary **kwargs to define other
         metadata, though these will not be used for any internal validation
         logic.
         '''
-        metadata = self._METADATA_DEFAULTS
+        metadata = dict(self._METADATA_DEFAULTS)
         metadata.update(self._metadata)
         metadata.update(kwargs)
 
@@ -109,17 +327,34 @@ class Wildcard():
                     if type(v).__name__ != metadata['var_type']:
                         raise TypeError(f'{v} does not match required type {metadata["var_type"]}')
 
+        if metadata['array'] is not None:
+            if not(isinstance(metadata['array'],bool)):
+                raise TypeError('"array" metadata must be type bool.')
+            if metadata['array']:
+                if np is None:
+                    raise ImportError('"array" metadata requires numpy to be installed.')
+                if metadata['var_type'] not in ['int','float']:
+                    raise TypeError('"var_type" metadata must be int or float if "array" is set.')
+                if not(metadata['iterable']):
+                    raise ValueError('"iterable" metadata must be True if "array" is set.')
+
         if metadata['default'] is not None:
             if metadata['min_val'] is not None and metadata['default'] <= metadata['min_val']:
                 raise ValueError('default must be larger than min_val.')
             if metadata['max_val'] is not None and metadata['default'] >= metadata['max_val']:
                 raise ValueError('default must be smaller than max_val')
-            if metadata['valid'] is not None and metadata['default'] not in ['valid']:
+            if metadata['valid'] is not None and metadata['default'] not in frozenset(metadata['valid']):
                 raise ValueError('default must be in valid.')
             if metadata['var_type'] is not None and not(type(metadata['default']).__name__ == metadata['var_type']):
                 raise TypeError(f'default must be type {metadata["var_type"]}.')
 
-        self._metadata = metadata
+        self._metadata = _intern_metadata(metadata)
+        self._changed()
+
+    @property
+    def _validation_plan(self):
+        '''compiled validation plan, shared with the interned metadata'''
+        return self._metadata.validation_plan
 
     @property
     def label(self):
@@ -132,7 +367,20 @@ class Wildcard():
     @label.setter
     def label(self,label):
         self._label_validation(label)
+        for owner in self._owners:
+            owner._validate_relabel(self,label)
+        old_label = getattr(self,'_label',None)
         self._label = label
+        for owner in self._owners:
+            owner._wildcard_relabelled(self,old_label)
+
+    def _changed(self):
+        '''
+        (internal use) tell the Menus holding this wildcard that its value or
+        metadata changed, so they re-serialise it on their next to_dict()
+        '''
+        for owner in self._owners:
+            owner._wildcard_changed(self)
 
     def _label_validation(self,label):
         '''
@@ -147,110 +395,304 @@ class Wildcard():
 
     @property
     def value(self):
-        '''wildcard variable value. Can be a '''
+        '''
+        wildcard variable value. Can be a single value, a list of values, or
+        (for iterable int wildcards) a lazy range of values, which is only
+        expanded when iterated. A range may also be set from its serialised
+        form, {"start":<int>,"stop":<int>,"step":<int>}.
+        '''
         return self._value
 
     @value.setter
     def value(self,value):
         '''set wildcard variable value'''
+        value = self._prepare_value(value)
         self._value_validation(value)
-        if isinstance(value,list):
+        self._assign_value(value)
+
+    def _prepare_value(self,value):
+        '''
+        (internal use) convert a value to the form it is validated and stored
+        in: serialised ranges become range objects, iterators are collected
+        into lists, and values of array-backed wildcards become numpy arrays.
+        '''
+        if isinstance(value,dict):
+            value = _range_from_spec(value)
+        elif self._metadata['iterable'] and hasattr(value,'__next__'):
+            value = self._collect_values(value)
+        if self._metadata['array']:
+            value = self._to_array(value)
+        return value
+
+    def _to_array(self,value):
+        '''(internal use) convert a value to a 1-d numpy array'''
+        if value is None or _is_array(value):
+            arr = value
+        else:
+            if type(value) in self._VALID_SCALAR_TYPES:
+                value = [value]
+            elif not(isinstance(value,(list,range))):
+                value = self._collect_values(value)
+            try:
+                arr = np.asarray(value)
+            except ValueError:
+                raise err.WildcardTypeError(f'Invalid data type for {value} {type(value)}.')
+            if arr.size == 0:
+                arr = np.empty(0,dtype=_VAR_TYPES[self._metadata['var_type']])
+        if arr is not None and arr.ndim != 1:
+            raise err.WildcardValueError(f'array values must be 1-dimensional, not {arr.ndim}-dimensional.')
+        return arr
+
+    def _assign_value(self,value):
+        '''(internal use) set wildcard value that has already been validated'''
+        if isinstance(value,(list,range)) or _is_array(value):
             self._value = value
         elif 'iterable' in self._metadata.keys() and self._metadata['iterable']:
             self._value = [value]
         else:
             self._value = value
+        self._changed()
 
     def append(self,value):
         '''
         if wildcard is iterable, append target value to value list
         '''
         if self._metadata['iterable']:
+            if self._metadata['array']:
+                self.extend([value])
+                return
             self._value_validation(value)
+            if isinstance(self._value,range):
+                self._value = list(self._value)
             self._value.append(value)
+            self._changed()
         else:
             raise err.WildcardNotIterableError(f'wildcard {self.label} is not iterable and cannot be appended to.')
 
+    def extend(self,values):
+        '''
+        if wildcard is iterable, extend value list with every value in an
+        iterable (e.g., a list or generator). All values are validated in one
+        pass before any are added, so if one value is invalid the wildcard is
+        left unchanged.
+        '''
+        if not(self._metadata['iterable']):
+            raise err.WildcardNotIterableError(f'wildcard {self.label} is not iterable and cannot be extended.')
+        if self._metadata['array']:
+            values = self._to_array(values)
+        else:
+            values = self._collect_values(values)
+        self._value_validation(values)
+        if self._value is None:
+            self._value = values
+        elif self._metadata['array']:
+            self._value = np.concatenate([np.asarray(self._value),values])
+        else:
+            self._value = list(self._value) + values
+        self._changed()
+
+    def _collect_values(self,values):
+        '''
+        (internal use) materialise an iterable of values into a list, checking
+        that each element is a valid scalar type
+        '''
+        if isinstance(values,(str,dict)) or not(hasattr(values,'__iter__')):
+            raise err.WildcardTypeError(f'values must be an iterable of values, not {type(values).__name__}.')
+        values = list(values)
+        if not(set(map(type,values)).issubset(self._VALID_SCALAR_TYPES)):
+            for v in values:
+                if type(v) not in self._VALID_SCALAR_TYPES:
+                    raise err.WildcardTypeError(f'Invalid data type for {v} {type(v)}.')
+        return values
+
     def _value_validation(self,value):
         '''validate wildcard values prior to setting. Values must conform with
         any specific metadata fields.'''
         if value is not None:
-            if not(isinstance(value,list)):
-                if type(value).__name__ in self._METADATA_VALID_VARTYPE:
+            if isinstance(value,range):
+                if not(self._metadata['iterable']):
+                    raise err.WildcardValueError(f'{value} cannot be iterable.')
+                if self._metadata['var_type'] not in [None,'int']:
+                    raise err.WildcardTypeError(f'{value} is a range of int but should be {self._metadata["var_type"]}.')
+            elif _is_array(value):
+                if not(self._metadata['array']):
+                    raise err.WildcardTypeError(f'numpy arrays require "array" metadata to be set.')
+            elif not(isinstance(value,list)):
+                if type(value) in self._VALID_SCALAR_TYPES:
                     value = [value]
                 else:
                     raise err.WildcardTypeError(f'Invalid data type for {value} {type(value)}.')
-            for v in value:
-                if self._metadata['var_type'] is not None:
-                    valtype = type(v).__name__
-                    if valtype != self._metadata['var_type']:
-                        raise err.WildcardTypeError(f'{v} is type {valtype} but should be {self._metadata["var_type"]}.')
-                if self._metadata['min_val'] is not None:
-                    if v < self._metadata['min_val']:
-                        raise err.WildcardValueError(f'{v} is lower than minimum ({self._metadata["min_val"]}).')
-                if self._metadata['max_val'] is not None:
-                    if v > self._metadata['max_val']:
-                        raise err.WildcardValueError(f'{v} is higher than maximum ({self._metadata["max_val"]}).')
-                if self._metadata['valid'] is not None:
-                    if v not in self._metadata['valid']:
-                        raise err.WildcardValueError(f'{v} is invalid, must be one of {self._metadata["valid"]}.')
+            for check in self._validation_plan:
+                check(value)
             if not(self._metadata['iterable']) and len(value) > 1:
                 raise err.WildcardValueError(f'{value} cannot be iterable.')
 
 class PathWildcard(Wildcard):
     '''
-    wildcard object for paths. Adds filepath validation to value setter
+    wildcard object for paths. Adds filepath validation to value setter.
+    Existence checks are answered from a PathCache shared by all PathWildcards
+    (PathWildcard.path_cache), which can be cleared or re-configured, e.g.
+    given a ttl to reuse directory listings across assignments.
     '''
-    def _set_metadata_defaults(self):
-        '''set metadata defaults for Wildcard'''
-        self._METADATA_VALID_VARTYPE = ['str']
-        self._METADATA_DEFAULTS = {
-            'help':None,
-            'required':False,
-            'default':None,
-            'var_type':'str',
-            'min_val':None,
-            'max_val':None,
-            'valid':None,
-            'iterable':False
-        }
-        self._metadata = self._METADATA_DEFAULTS
+    __slots__ = ('_validation','_unchecked')
+
+    _VALIDATION_POLICIES = ['eager','lazy','trusted']
+    path_cache = PathCache()
+
+    _METADATA_VALID_VARTYPE = ['str']
+    _VALID_SCALAR_TYPES = (str,)
+    _METADATA_DEFAULTS = _intern_metadata({
+        'help':None,
+        'required':False,
+        'default':None,
+        'var_type':'str',
+        'min_val':None,
+        'max_val':None,
+        'valid':None,
+        'iterable':False,
+        'array':None
+    })
+
+    def __init__(self,label,value,metadata={},validation='eager'):
+        '''
+        validation: (str) when to check that paths exist. "eager" checks on
+        every assignment, "lazy" defers the check until the value is first
+        read, and "trusted" skips it (e.g., for an already validated config)
+        [DEFAULT: "eager"]
+        '''
+        self._unchecked = False
+        self.validation = validation
+        super().__init__(label,value,metadata)
+
+    @property
+    def validation(self):
+        '''(str) path validation policy: "eager", "lazy" or "trusted"'''
+        return self._validation
+
+    @validation.setter
+    def validation(self,validation):
+        if validation not in self._VALIDATION_POLICIES:
+            raise ValueError(f'"validation" must be one of {self._VALIDATION_POLICIES}.')
+        self._validation = validation
+        if validation == 'eager' and self._unchecked:
+            self.check_paths()
+
+    @property
+    def value(self):
+        '''
+        wildcard path value. Under "lazy" validation, paths are checked the
+        first time the value is read.
+        '''
+        if self._unchecked:
+            self.check_paths()
+        return self._value
+
+    @value.setter
+    def value(self,value):
+        Wildcard.value.fset(self,value)
+
+    def check_paths(self):
+        '''
+        check that all paths in value exist now, regardless of validation
+        policy. Directories are re-listed even if path_cache holds listings
+        within its ttl.
+        '''
+        self._check_exists(self._value,refresh=True)
+        self._unchecked = False
+
+    def _check_exists(self,value,refresh=False):
+        '''(internal use) raise PathNotExistError for the first missing path'''
+        if value is not None:
+            paths = value if isinstance(value,list) else [value]
+            for p,exists in zip(paths,self.path_cache.exists_many(paths,refresh=refresh)):
+                if not(exists):
+                    raise err.PathNotExistError(p)
 
     def _value_validation(self,value):
         '''
         beyond standard validation, directory wildcard value must:
 
-        1. be a valid path/file
+        1. be a valid path/file (checked now if validation is "eager", on first
+        read if "lazy", and not at all if "trusted")
         '''
         super()._value_validation(value)
-        if value is not None:
-            if isinstance(value,list):
-                for v in value:
-                    self._value_validation(v)
-            else:
-                if not(Path(value).exists()):
-                    raise err.PathNotExistError(value)
+        if self._validation == 'eager':
+            self._check_exists(value)
+        elif self._validation == 'lazy':
+            self._unchecked = value is not None
 
 
 class TemplateWildcard(Wildcard):
     '''
     wildcard object for templates. Adds filepath validation to value setter
     '''
-    def _set_metadata_defaults(self):
-        '''set metadata defaults for Wildcard'''
-        self._METADATA_VALID_VARTYPE = ['str']
-        self._METADATA_DEFAULTS = {
-            'help':None,
-            'required':False,
-            'default':None,
-            'var_type':'str',
-            'min_val':None,
-            'max_val':None,
-            'valid':None,
-            'iterable':False
-        }
-        self._metadata = self._METADATA_DEFAULTS
+    __slots__ = ()
+
+    _METADATA_VALID_VARTYPE = ['str']
+    _VALID_SCALAR_TYPES = (str,)
+    _METADATA_DEFAULTS = _intern_metadata({
+        'help':None,
+        'required':False,
+        'default':None,
+        'var_type':'str',
+        'min_val':None,
+        'max_val':None,
+        'valid':None,
+        'iterable':False,
+        'array':None
+    })
+
+    @property
+    def plan(self):
+        '''
+        compiled TemplatePlan for the template value (a list of TemplatePlans
+        if value is a list of templates). For bulk rendering, plan.render(d)
+        avoids the keyword argument overhead of render().
+        '''
+        if isinstance(self._value,list):
+            return [ compile_template(v) for v in self._value ]
+        return compile_template(self._value)
+
+    def render(self,**wildcards):
+        '''
+        format the template value with wildcards, e.g.
+        w.render(subject='01',func_task='rest'). Each template is parsed once
+        into a cached render plan (see neuromake.template.compile_template).
+        Returns a str, or a list of str if value is a list of templates.
+        '''
+        if isinstance(self._value,list):
+            return [ compile_template(v).render(wildcards) for v in self._value ]
+        return compile_template(self._value).render(wildcards)
 
+    def match(self,path):
+        '''
+        parse a path rendered from the template value back into wildcards.
+        Returns a dict of wildcard values, or None if path does not match. If
+        value is a list of templates, the first matching template is used.
+        '''
+        plans = self.plan if isinstance(self._value,list) else [self.plan]
+        for plan in plans:
+            d = plan.match(path)
+            if d is not None:
+                return d
+        return None
+
+    def match_many(self,paths):
+        '''
+        yield a dict of wildcard values for each path in paths (any iterable)
+        that matches the template value, skipping paths that don't match. If
+        value is a list of templates, the first matching template is used.
+        '''
+        if not(isinstance(self._value,list)):
+            yield from self.plan.match_many(paths)
+            return
+        matchers = [ plan.regex.match for plan in self.plan ]
+        for path in paths:
+            for match in matchers:
+                m = match(path)
+                if m is not None:
+                    yield m.groupdict()
+                    break
 
     def _value_validation(self,value):
         '''
@@ -268,7 +710,7 @@ class TemplateWildcard(Wildcard):
                 for v in value:
                     self._value_validation(v)
             else:
-                fields = [fname for _,fname,_,_ in Formatter().parse(value) if fname ]
+                fields = [ fname for fname in compile_template(value).field_names if fname ]
                 if len(fields) == 0:
                     raise err.WildcardValueError(f'template wildcards must have at least one format field.')
                 valid_str = "".join(i for i in value if i not in r"\:*?<>| ")
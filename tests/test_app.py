@@ -68,6 +68,147 @@ def test_app_init_with_menu():
     app = App(name='my_pipeline',menu=menu)
     assert app._menus[0]._wildcards == w
 
+#
+# App validation policy tests
+#
+def _save_paths_app(tmp_path):
+    '''save an App with a single PathWildcard pointing to tmp_path/data'''
+    os.makedirs(tmp_path / 'data')
+    menu = Menu('paths',PathWildcard('data',str(tmp_path / 'data')),{'wildcard_type':'PathWildcard'})
+    cfg_path = str(tmp_path / 'neuromake.json')
+    App(name='my_pipeline',menu=menu).save(cfg_path)
+    os.rmdir(tmp_path / 'data')
+    PathWildcard.path_cache.clear()
+    return cfg_path
+
+def test_app_load_eager_validation_error(tmp_path):
+    cfg_path = _save_paths_app(tmp_path)
+    try:
+        app = App(cfg_path=cfg_path)
+    except Exception as exception:
+        assert type(exception).__name__ == 'PathNotExistError'
+    else:
+        assert False
+
+def test_app_load_lazy_validation(tmp_path):
+    '''lazy apps load, but raise once the missing path is read'''
+    cfg_path = _save_paths_app(tmp_path)
+    app = App(cfg_path=cfg_path,validation='lazy')
+    try:
+        app.get_menu('paths').get_wildcard('data').value
+    except Exception as exception:
+        assert type(exception).__name__ == 'PathNotExistError'
+    else:
+        assert False
+
+def test_app_load_trusted_validation(tmp_path):
+    '''trusted apps skip path checks for an unchanged, saved config'''
+    cfg_path = _save_paths_app(tmp_path)
+    app = App(cfg_path=cfg_path,validation='trusted')
+    assert app.get_menu('paths').get_wildcard('data').value == str(tmp_path / 'data')
+
+def test_app_load_trusted_modified_config_error(tmp_path):
+    '''trusted apps fall back to eager validation if the config changed'''
+    cfg_path = _save_paths_app(tmp_path)
+    with open(cfg_path,'a') as cfg_file:
+        cfg_file.write('\n')
+    try:
+        app = App(cfg_path=cfg_path,validation='trusted')
+    except Exception as exception:
+        assert type(exception).__name__ == 'PathNotExistError'
+    else:
+        assert False
+
+#
+# App config cache tests
+#
+def _save_app(tmp_path,cache=True):
+    '''save a two-menu App to tmp_path/neuromake.json'''
+    app = App(name='my_pipeline',cache=cache,menu=[
+        Menu('bids',Wildcard('subject',['01','02'],{'iterable':True})),
+        Menu('settings',Wildcard('threads',4,{'var_type':'int','min_val':0}))
+    ])
+    cfg_path = str(tmp_path / 'neuromake.json')
+    app.save(cfg_path)
+    return app,cfg_path
+
+def test_app_load_from_cache(tmp_path,monkeypatch):
+    '''an unchanged config is loaded from its cache, without parsing json'''
+    saved,cfg_path = _save_app(tmp_path)
+    assert os.path.isfile(cfg_path + '.cache')
+    assert not([ f for f in os.listdir(tmp_path) if f.endswith('.tmp') ])
+    def fail(*args,**kwargs):
+        raise AssertionError('json config parsed')
+    monkeypatch.setattr(json,'loads',fail)
+    app = App(cfg_path=cfg_path,cache=True)
+    assert app.to_dict(metadata=True) == saved.to_dict(metadata=True)
+    app.get_menu('bids').get_wildcard('subject').append('03')
+    assert app.to_dict()['my_pipeline']['bids']['subject'] == ['01','02','03']
+
+def test_app_load_stale_cache(tmp_path):
+    '''a cache for a different config is ignored and rewritten'''
+    _,cfg_path = _save_app(tmp_path)
+    with open(cfg_path,'r') as cfg_file:
+        data = json.load(cfg_file)
+    data['my_pipeline']['settings']['threads'] = 8
+    with open(cfg_path,'w') as cfg_file:
+        json.dump(data,cfg_file)
+    app = App(cfg_path=cfg_path,cache=True)
+    assert app.get_menu('settings').get_wildcard('threads').value == 8
+    assert App(cfg_path=cfg_path,cache=True).to_dict() == app.to_dict()
+
+def test_app_no_cache(tmp_path):
+    '''cache=False neither writes nor reads a cache'''
+    _,cfg_path = _save_app(tmp_path,cache=False)
+    App(cfg_path=cfg_path,cache=False)
+    assert not(os.path.exists(cfg_path + '.cache'))
+
+def test_app_cache_off_by_default(tmp_path,monkeypatch):
+    '''Apps neither write nor read a cache unless cache=True'''
+    saved,cfg_path = _save_app(tmp_path,cache=False)
+    App(cfg_path=cfg_path)
+    assert not(os.path.exists(cfg_path + '.cache'))
+    _save_app(tmp_path)
+    monkeypatch.setattr('neuromake.app.app._read_cache',lambda *args: 1/0)
+    assert App(cfg_path=cfg_path).to_dict() == saved.to_dict()
+
+#
+# lazy App tests
+#
+def _save_lazy_app(tmp_path):
+    '''save an App whose PathWildcard menu points to a removed directory'''
+    os.makedirs(tmp_path / 'data')
+    saved = App(name='my_pipeline',menu=[
+        Menu('bids',Wildcard('subject',['01','02'],{'iterable':True})),
+        Menu('paths',PathWildcard('data',str(tmp_path / 'data')),{'wildcard_type':'PathWildcard'})
+    ])
+    cfg_path = str(tmp_path / 'neuromake.json')
+    saved.save(cfg_path)
+    os.rmdir(tmp_path / 'data')
+    PathWildcard.path_cache.clear()
+    return saved,cfg_path
+
+@pytest.mark.parametrize('cache',[False,True])
+def test_app_lazy_builds_used_menus(tmp_path,cache):
+    '''lazy apps only build (and validate) the menus that are used'''
+    saved,cfg_path = _save_lazy_app(tmp_path)
+    app = App(cfg_path=cfg_path,lazy=True,cache=cache)
+    assert app.get_menu('bids').to_dict() == {'bids':{'subject':['01','02']}}
+    assert [ type(x).__name__ for x in app._menu_slots ] == ['Menu','_PendingMenu']
+    try:
+        app.get_menu('paths')
+    except Exception as exception:
+        assert type(exception).__name__ == 'PathNotExistError'
+    else:
+        assert False
+
+def test_app_lazy_to_dict(tmp_path):
+    '''removing a pending menu doesn't build it, and to_dict builds the rest'''
+    saved,cfg_path = _save_lazy_app(tmp_path)
+    app = App(cfg_path=cfg_path,lazy=True,validation='trusted')
+    app.remove_menu('bids')
+    assert app.to_dict(metadata=True) == {'my_pipeline':saved.get_menu('paths').to_dict(metadata=True)}
+
 #
 # App.to_dict() tests
 #
@@ -111,3 +252,59 @@ def test_app_to_dict_with_metadata():
             }
         }
     }
+
+def test_app_to_dict_tracks_changes():
+    '''repeated to_dict() reflects changes to menus and their wildcards'''
+    w = Wildcard('subject','01',{'iterable':True})
+    app = App(name='my_pipeline',menu=Menu('bids',w))
+    assert app.to_dict() == {'my_pipeline':{'bids':{'subject':['01']}}}
+    w.value = ['02']
+    app.add_menu(Menu('paths',Wildcard('root','/')))
+    assert app.to_dict() == {'my_pipeline':{'bids':{'subject':['02']},'paths':{'root':'/'}}}
+    app.get_menu('paths').name = 'dirs'
+    app.remove_menu('bids')
+    assert app.to_dict() == {'my_pipeline':{'dirs':{'root':'/'}}}
+
+def test_app_to_dict_incremental_order():
+    '''menus added after a to_dict() call are serialised in App order'''
+    app = App(name='my_pipeline',menu=Menu('bids',Wildcard('subject','01')))
+    app.to_dict()
+    names = ['beta','mid','zeta','alpha']
+    app.add_menu([ Menu(x,Wildcard('x',1)) for x in names ])
+    assert list(app.to_dict()['my_pipeline']) == ['bids'] + names
+    app.remove_menu('bids')
+    app.add_menu(Menu('bids',Wildcard('subject','02')))
+    assert list(app.to_dict()['my_pipeline']) == names + ['bids']
+
+#
+# App.diff() / App.apply_patch() tests
+#
+def test_app_diff_apply_patch():
+    '''applying an App diff adds, removes and patches menus'''
+    a = App(name='my_pipeline',menu=[
+        Menu('bids',Wildcard('subject',['01'],{'iterable':True})),
+        Menu('settings',Wildcard('threads',1))
+    ])
+    b = App(name='my_pipeline',menu=[
+        Menu('bids',Wildcard('subject',['01','02'],{'iterable':True})),
+        Menu('templates',Wildcard('anat','sub-{subject}_T1w.nii.gz'))
+    ])
+    patch = a.diff(b)
+    assert patch['removed'] == ['settings']
+    assert patch['changed'] == {'bids':{'changed':{'subject':{'extend':['02'],'length':1,'base':patch['changed']['bids']['changed']['subject']['base']}}}}
+    a.apply_patch(json.loads(json.dumps(patch)))
+    assert a.to_dict(metadata=True) == b.to_dict(metadata=True)
+    assert a.diff(b) == {}
+
+def test_app_apply_patch_missing_menu_error():
+    '''a patch changing a missing menu is rejected'''
+    a = App(name='my_pipeline',menu=Menu('bids',Wildcard('subject',['01'],{'iterable':True})))
+    b = App(name='my_pipeline',menu=Menu('bids',Wildcard('subject',['01','02'],{'iterable':True})))
+    patch = a.diff(b)
+    a.remove_menu('bids')
+    try:
+        a.apply_patch(patch)
+    except Exception as exception:
+        assert type(exception).__name__ == 'PatchError'
+    else:
+        assert False
@@ -0,0 +1,120 @@
+import pytest
+import neuromake.bids as bids
+from neuromake.bids import parse_bids_filenames, add_prefix, remove_prefix, bids_filetype
+from neuromake.bids import compile_grammar, match_bids_filename, classify_bids_filenames, invalid_bids_filenames
+
+def test_parse_bids_filenames_main():
+    table = parse_bids_filenames([
+        'sub-01/func/sub-01_ses-2_task-mid_acq-multiband_run-1_bold.nii.gz',
+        'sub-02_T1w.nii',
+    ])
+    assert len(table) == 2
+    assert table.row(0) == {'subject':'01','session':'2','task':'mid','acquisition':'multiband','run':'1','suffix':'bold','extension':'nii.gz'}
+    assert table.row(1) == {'subject':'02','suffix':'T1w','extension':'nii'}
+
+def test_parse_bids_filenames_categorical():
+    table = parse_bids_filenames([
+        'sub-01_task-rest_bold.nii.gz',
+        'sub-01_T1w.nii.gz',
+        'sub-02_task-rest_bold.nii.gz',
+        'sub-02_task-mid_bold.nii.gz',
+    ])
+    assert list(table.codes('task')) == [0,-1,0,1]
+    assert table.categories('task') == ['rest','mid']
+    assert table.column('task') == ['rest',None,'rest','mid']
+    assert table.column('subject') == ['01','01','02','02']
+
+def test_parse_bids_filenames_key_names():
+    table = parse_bids_filenames(['sub-1_task-mid_rec-x_recording-cardiac_physio.tsv.gz'])
+    assert table.entities == ['subject','task','reconstruction','recording','suffix','extension']
+
+def test_parse_bids_filenames_empty():
+    table = parse_bids_filenames(iter([]))
+    assert len(table) == 0
+    assert table.entities == []
+
+#lookup tables
+def test_add_prefix_main():
+    assert add_prefix('task','func') == 'func_task'
+    assert add_prefix('subject','func') == 'subject'
+    assert add_prefix('extension','anat') == 'extension'
+
+def test_add_prefix_last_filetype_first():
+    assert add_prefix('suffix',['func','physio']) == 'physio_suffix'
+    assert add_prefix('run',['func','physio']) == 'func_run'
+
+def test_remove_prefix_main():
+    assert remove_prefix('dwi_direction') == 'direction'
+    assert remove_prefix('subject') == 'subject'
+    assert remove_prefix('func_unknown') == 'func_unknown'
+
+def test_lookup_tables_immutable():
+    try:
+        bids._PREFIXED[('func','custom')] = 'func_custom'
+    except Exception as exception:
+        assert type(exception).__name__ == 'TypeError'
+    else:
+        assert False
+
+def test_bids_filetype_main():
+    row = lambda f: parse_bids_filenames([f]).row(0)
+    assert bids_filetype(row('sub-1_task-rest_bold.nii.gz')) == 'func'
+    assert bids_filetype(row('sub-1_T1w.nii.gz')) == 'anat'
+    assert bids_filetype(row('sub-1_task-rest_sbref.nii.gz')) == 'func'
+    assert bids_filetype(row('sub-1_acq-x_sbref.nii.gz')) == 'dwi'
+    assert bids_filetype(row('sub-1_task-rest_recording-cardiac_physio.tsv.gz')) == ['func','physio']
+
+#grammars
+def test_compile_grammar_main():
+    pattern = compile_grammar('func')
+    m = pattern.match('sub-01_ses-2_task-rest_run-1_bold.nii.gz')
+    assert m is not None
+    assert m.group(f'{m.lastgroup}_task') == 'rest'
+    assert pattern.match('sub-01_T1w.nii.gz') is None
+
+def test_compile_grammar_invalid_filetype():
+    try:
+        compile_grammar('pet')
+    except Exception as exception:
+        assert type(exception).__name__ == 'ValueError'
+    else:
+        assert False
+
+def test_match_bids_filename_main():
+    assert match_bids_filename('sub-01/func/sub-01_task-rest_acq-mb_bold.nii.gz') == ('func',{'subject':'01','task':'rest','acquisition':'mb','suffix':'bold','extension':'nii.gz'})
+    assert match_bids_filename('sub-01_echo-1_part-mag_MEGRE.nii') == ('anat',{'subject':'01','echo':'1','part':'mag','suffix':'MEGRE','extension':'nii'})
+    assert match_bids_filename('sub-01_T1w.nii.gz') == ('anat',{'subject':'01','suffix':'T1w','extension':'nii.gz'})
+
+def test_match_bids_filename_invalid():
+    assert match_bids_filename('sub-01_bold.nii.gz') is None
+    assert match_bids_filename('sub-01_task-rest_run-x_bold.nii.gz') is None
+    assert match_bids_filename('sub-01_part-foo_T1w.nii') is None
+    assert match_bids_filename('sub-01_task-rest_bold.nii.gz.bak') is None
+
+def test_match_bids_filename_matches():
+    '''physio grammars extend the filenames of other file types'''
+    name = 'sub-01_acq-mb_recording-cardiac_physio.tsv.gz'
+    assert match_bids_filename(name,'physio') == ('physio',{'subject':'01','acquisition':'mb','recording':'cardiac','suffix':'physio','extension':'tsv.gz'})
+    assert match_bids_filename('sub-01_recording-cardiac_physio.tsv.gz','physio') is not None
+    assert match_bids_filename('sub-01_task-rest_bold.nii.gz','physio') is None
+
+def test_match_bids_filename_unknown_suffixes():
+    '''filenames with unknown suffixes share one compiled grammar'''
+    from neuromake.bids import _grammar
+    match_bids_filename('sub-01_junk.txt')
+    size = _grammar.cache_info().currsize
+    for i in range(200):
+        assert match_bids_filename(f'sub-01_junk{i}.txt') is None
+    assert _grammar.cache_info().currsize == size
+
+def test_classify_bids_filenames_streaming():
+    names = (f'sub-{i:02d}_task-rest_{suffix}' for i in range(3) for suffix in ['bold.nii.gz','bold.txt'])
+    results = classify_bids_filenames(names)
+    assert next(results)[0] == 'func'
+    assert next(results) is None
+    assert len(list(results)) == 4
+
+def test_invalid_bids_filenames_main():
+    names = ['sub-01_T1w.nii','sub-01_bold.nii','sub-01_dir-AP_epi.json','README']
+    assert list(invalid_bids_filenames(names)) == ['sub-01_bold.nii','README']
+    assert list(invalid_bids_filenames(names,filetype='anat')) == ['sub-01_bold.nii','sub-01_dir-AP_epi.json','README']
@@ -0,0 +1,121 @@
+import pytest
+import os
+import json
+from neuromake.bidsindex import BidsIndex
+
+def _dataset(root):
+    files = [
+        'dataset_description.json',
+        'task-rest_bold.json',
+        'sub-01/anat/sub-01_T1w.nii.gz',
+        'sub-01/func/sub-01_task-rest_run-1_bold.nii.gz',
+        'sub-01/func/sub-01_task-rest_run-1_bold.json',
+        'sub-01/func/sub-01_task-rest_run-2_bold.nii.gz',
+        'sub-02/func/sub-02_task-mid_bold.nii',
+        'derivatives/sub-01/func/sub-01_task-rest_run-1_bold.nii.gz',
+        '.git/sub-01_T1w.nii.gz',
+    ]
+    for f in files:
+        path = os.path.join(root,f)
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        with open(path,'w') as fp:
+            fp.write('{}')
+    with open(os.path.join(root,'task-rest_bold.json'),'w') as fp:
+        json.dump({'RepetitionTime':2,'TaskName':'rest'},fp)
+    with open(os.path.join(root,'sub-01/func/sub-01_task-rest_run-1_bold.json'),'w') as fp:
+        json.dump({'RepetitionTime':1.5},fp)
+    return str(root)
+
+def test_bidsindex_build_skips_ignored(tmp_path):
+    index = BidsIndex.build(_dataset(tmp_path))
+    assert len(index) == 7
+    assert index.get_values('subject') == ['01','02']
+
+def test_bidsindex_get(tmp_path):
+    root = _dataset(tmp_path)
+    index = BidsIndex.build(root)
+    assert index.get(subject='01',task='rest',extension=['nii.gz','.nii']) == [
+        os.path.join(root,'sub-01/func/sub-01_task-rest_run-1_bold.nii.gz'),
+        os.path.join(root,'sub-01/func/sub-01_task-rest_run-2_bold.nii.gz'),
+    ]
+    assert index.get(subject='01',run=2,extension='.nii.gz') == [os.path.join(root,'sub-01/func/sub-01_task-rest_run-2_bold.nii.gz')]
+    assert index.get(subject='02',run=None) == [os.path.join(root,'sub-02/func/sub-02_task-mid_bold.nii')]
+    assert index.get(subject='03') == []
+    assert index.get(unknown='x') == []
+
+def test_bidsindex_get_index_entities():
+    '''index entities match as numbers, as in PyBIDS'''
+    index = BidsIndex.from_paths('/ds',[
+        'sub-01/func/sub-01_task-rest_run-01_bold.nii.gz',
+        'sub-01/func/sub-01_task-rest_run-2_bold.nii.gz',
+        'sub-01/func/sub-01_task-rest_run-10_echo-01_bold.nii.gz',
+        'sub-02/func/sub-02_task-rest_run-1_bold.nii.gz',
+    ])
+    assert index.get(subject='01',run=1) == [os.path.join(index.root,'sub-01/func/sub-01_task-rest_run-01_bold.nii.gz')]
+    assert index.get(run='01') == index.get(run=[1,'1'])
+    assert len(index.get(run='01')) == 2
+    assert len(index.get(echo=1)) == 1
+    assert index.get(task='01') == []
+    assert index.get_values('run') == ['1','2','10']
+
+def test_bidsindex_get_metadata_inherited(tmp_path):
+    root = _dataset(tmp_path)
+    index = BidsIndex.build(root)
+    assert index.get_metadata(os.path.join(root,'sub-01/func/sub-01_task-rest_run-1_bold.nii.gz')) == {'RepetitionTime':1.5,'TaskName':'rest'}
+    assert index.get_metadata(os.path.join(root,'sub-01/func/sub-01_task-rest_run-2_bold.nii.gz')) == {'RepetitionTime':2,'TaskName':'rest'}
+    assert index.get_metadata(os.path.join(root,'sub-02/func/sub-02_task-mid_bold.nii')) == {}
+    with open(os.path.join(root,'sub-01/func/sub-01_task-rest_run-01_bold.json'),'w') as fp:
+        json.dump({'RepetitionTime':1},fp)
+    os.remove(os.path.join(root,'sub-01/func/sub-01_task-rest_run-1_bold.json'))
+    index = BidsIndex.build(root)
+    assert index.get_metadata(os.path.join(root,'sub-01/func/sub-01_task-rest_run-1_bold.nii.gz')) == {'RepetitionTime':1,'TaskName':'rest'}
+
+def test_bidsindex_open_persists(tmp_path,monkeypatch):
+    root = _dataset(tmp_path / 'ds')
+    path = str(tmp_path / 'index.pkl')
+    index = BidsIndex.open(root,path)
+    assert os.path.isfile(path)
+    assert not([ f for f in os.listdir(tmp_path) if f.endswith('.tmp') ])
+    with monkeypatch.context() as m:
+        m.setattr(BidsIndex,'build',classmethod(lambda cls,root: 1/0))
+        assert BidsIndex.open(root,path).get(subject='02') == index.get(subject='02')
+
+def test_bidsindex_open_rebuilds_stale(tmp_path):
+    '''a saved index is rebuilt after files are added or removed'''
+    root = _dataset(tmp_path / 'ds')
+    path = str(tmp_path / 'index.pkl')
+    BidsIndex.open(root,path)
+    func = os.path.join(root,'sub-02/func')
+    os.remove(os.path.join(func,'sub-02_task-mid_bold.nii'))
+    # directory mtimes may be coarse; make sure the change is visible
+    os.utime(func,ns=(0,os.stat(func).st_mtime_ns + 10**9))
+    assert not(BidsIndex.load(path).is_current())
+    assert BidsIndex.open(root,path).get(subject='02') == []
+    os.makedirs(os.path.join(root,'sub-03/anat'))
+    with open(os.path.join(root,'sub-03/anat/sub-03_T1w.nii.gz'),'w') as fp:
+        fp.write('')
+    os.utime(root,ns=(0,os.stat(root).st_mtime_ns + 10**9))
+    assert BidsIndex.open(root,path).get_values('subject') == ['01','03']
+    assert BidsIndex.open(root,path,reindex=True).is_current()
+
+def test_bidsindex_open_unchecked(tmp_path):
+    '''check=False reuses a saved index without checking it is current'''
+    root = _dataset(tmp_path / 'ds')
+    path = str(tmp_path / 'index.pkl')
+    BidsIndex.open(root,path)
+    func = os.path.join(root,'sub-02/func')
+    os.remove(os.path.join(func,'sub-02_task-mid_bold.nii'))
+    os.utime(func,ns=(0,os.stat(func).st_mtime_ns + 10**9))
+    assert len(BidsIndex.open(root,path,check=False).get(subject='02')) == 1
+    assert BidsIndex.open(root,path).get(subject='02') == []
+
+def test_bidsindex_load_invalid(tmp_path):
+    path = str(tmp_path / 'index.pkl')
+    with open(path,'wb') as fp:
+        fp.write(b'\x80\x05N.')
+    try:
+        BidsIndex.load(path)
+    except Exception as exception:
+        assert type(exception).__name__ == 'ValueError'
+    else:
+        assert False
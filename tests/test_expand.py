@@ -0,0 +1,53 @@
+import pytest
+import itertools as it
+from neuromake.expand import Expansion
+from neuromake.wildcard import Wildcard, TemplateWildcard
+from neuromake.menu import Menu
+
+BIDS = {
+    'subject':['01','02','03'],
+    'session':'pre',
+    'func_task':['rest','mid'],
+    'func_run':range(1,4),
+    'anat_suffix':['T1w'],
+}
+
+def test_expansion_matches_product():
+    t = 'sub-{subject}_ses-{session}_task-{func_task}_run-{func_run}_bold.nii.gz'
+    paths = list(Expansion(t,BIDS))
+    shouldbe = [ t.format(subject=s,session='pre',func_task=k,func_run=r) for s,k,r in it.product(BIDS['subject'],BIDS['func_task'],BIDS['func_run']) ]
+    assert paths == shouldbe
+
+def test_expansion_unused_wildcards_no_duplicates():
+    paths = list(Expansion('sub-{subject}_{anat_suffix}.nii.gz',BIDS))
+    assert paths == ['sub-01_T1w.nii.gz','sub-02_T1w.nii.gz','sub-03_T1w.nii.gz']
+
+def test_expansion_len_without_expanding():
+    e = Expansion(['sub-{subject}_run-{func_run}','sub-{subject}_{anat_suffix}'],{**BIDS,'func_run':range(10**6)})
+    assert len(e) == 3 * 10**6 + 3
+
+def test_expansion_chunks():
+    e = Expansion('sub-{subject}_task-{func_task}_run-{func_run}',BIDS)
+    chunks = list(e.chunks(4))
+    assert [ len(c) for c in chunks ] == [4,4,4,4,2]
+    assert list(it.chain.from_iterable(chunks)) == list(e)
+
+def test_expansion_missing_field_error():
+    try:
+        Expansion('sub-{subject}_echo-{func_echo}',BIDS)
+    except Exception as exception:
+        assert type(exception).__name__ == 'KeyError'
+    else:
+        assert False
+
+def test_expansion_allow_missing():
+    paths = list(Expansion('sub-{subject}_echo-{func_echo}',{'subject':['01']},allow_missing=True))
+    assert paths == ['sub-01_echo-{func_echo}']
+
+def test_menu_expand_template_wildcard():
+    menu = Menu('bids',[
+        Wildcard('subject',['01','02'],{'iterable':True}),
+        Wildcard('func_task',['rest'],{'iterable':True}),
+    ])
+    w = TemplateWildcard('funcPrefix','sub-{subject}_task-{func_task}')
+    assert list(menu.expand(w)) == ['sub-01_task-rest','sub-02_task-rest']
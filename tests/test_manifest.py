@@ -0,0 +1,92 @@
+import pytest
+import os
+from neuromake.manifest import write_manifest, read_manifest, manifest_subjects
+from neuromake.expand import Expansion
+from neuromake.wildcard import Wildcard, TemplateWildcard
+from neuromake.menu import Menu
+from neuromake.app import App
+
+BIDS = {
+    'subject':['01','02','03'],
+    'session':'pre',
+    'func_task':['rest','mid'],
+    'func_run':range(1,3),
+}
+TEMPLATES = [
+    'sub-{subject}_task-{func_task}_run-{func_run}_bold.nii.gz',
+    'group_task-{func_task}.tsv',
+    'sub-{subject}_ses-{session}_T1w.nii.gz',
+]
+
+def test_manifest_contains_expansion(tmp_path):
+    path = str(tmp_path / 'targets.txt')
+    assert write_manifest(path,TEMPLATES,BIDS)
+    assert sorted(read_manifest(path)) == sorted(Expansion(TEMPLATES,BIDS))
+    assert manifest_subjects(path) == ['01','02','03']
+
+def test_manifest_subject_slice(tmp_path):
+    path = str(tmp_path / 'targets.txt')
+    write_manifest(path,TEMPLATES,BIDS)
+    assert read_manifest(path,subject='02') == [
+        'sub-02_task-rest_run-1_bold.nii.gz',
+        'sub-02_task-rest_run-2_bold.nii.gz',
+        'sub-02_task-mid_run-1_bold.nii.gz',
+        'sub-02_task-mid_run-2_bold.nii.gz',
+        'sub-02_ses-pre_T1w.nii.gz',
+    ]
+    assert read_manifest(path)[:2] == ['group_task-rest.tsv','group_task-mid.tsv']
+
+def test_manifest_missing_subject_error(tmp_path):
+    path = str(tmp_path / 'targets.txt')
+    write_manifest(path,TEMPLATES,BIDS)
+    try:
+        read_manifest(path,subject='04')
+    except Exception as exception:
+        assert type(exception).__name__ == 'ValueError'
+    else:
+        assert False
+
+def test_manifest_only_rewritten_on_change(tmp_path):
+    path = str(tmp_path / 'targets.txt')
+    assert write_manifest(path,TEMPLATES,BIDS)
+    assert not(write_manifest(path,TEMPLATES,dict(BIDS)))
+    assert write_manifest(path,TEMPLATES,dict(BIDS,subject=['01']))
+    assert manifest_subjects(path) == ['01']
+
+def test_app_write_manifest(tmp_path):
+    path = str(tmp_path / 'targets.txt')
+    bids = Menu('bids',[ Wildcard(k,v,{'iterable':isinstance(v,(list,range))}) for k,v in BIDS.items() ])
+    templates = Menu('templates',[ TemplateWildcard(f't{i}',t) for i,t in enumerate(TEMPLATES) ],{'wildcard_type':'TemplateWildcard'})
+    app = App(name='my_pipeline',menu=[bids,templates])
+    assert app.write_manifest(path)
+    assert not(app.write_manifest(path))
+    bids.get_wildcard('subject').append('04')
+    assert app.write_manifest(path)
+    assert len(read_manifest(path,subject='04')) == 5
+
+def test_manifest_read_during_rewrite(tmp_path,monkeypatch):
+    '''a manifest replaced before its index is never read with the old offsets'''
+    path = str(tmp_path / 'targets.txt')
+    write_manifest(path,TEMPLATES,BIDS)
+    with open(path + '.index.json') as f:
+        old_index = f.read()
+    write_manifest(path,TEMPLATES,dict(BIDS,subject=['02','03']))
+    with open(path + '.index.json') as f:
+        new_index = f.read()
+    def write_index(content):
+        with open(path + '.index.json','w') as f:
+            f.write(content)
+    # the writer replaced the manifest, and replaces the index while the reader waits
+    write_index(old_index)
+    monkeypatch.setattr('neuromake.manifest.time.sleep',lambda t: write_index(new_index))
+    assert read_manifest(path,subject='02')[0] == 'sub-02_task-rest_run-1_bold.nii.gz'
+    # the index is never replaced
+    write_index(old_index)
+    monkeypatch.setattr('neuromake.manifest.time.sleep',lambda t: None)
+    try:
+        read_manifest(path,subject='02')
+    except Exception as exception:
+        assert type(exception).__name__ == 'ValueError'
+    else:
+        assert False
+    assert write_manifest(path,TEMPLATES,dict(BIDS,subject=['02','03']))
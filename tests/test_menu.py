@@ -62,6 +62,13 @@ def test_menu_init_with_invalid_wildcard_type_error():
     else:
         assert False
 
+def test_menu_label_index_order():
+    '''wildcards are indexed by label and keep insertion order'''
+    w = [ Wildcard(f'var{i}',None) for i in range(100) ]
+    menu = Menu('settings',w)
+    assert menu._wildcards == w
+    assert menu.get_wildcard('var42') is w[42]
+
 #
 # Menu.remove_wildcard() tests
 #
@@ -94,6 +101,54 @@ def test_menu_remove_wildcard_required_error():
     else:
         assert False
 
+def test_menu_remove_wildcards():
+    '''remove_wildcards removes every label given, keeping the rest in order'''
+    w = [ Wildcard(f'var{i}',i) for i in range(5) ]
+    menu = Menu('settings',w)
+    menu.remove_wildcards(['var1','var3'])
+    assert [ x.label for x in menu._wildcards ] == ['var0','var2','var4']
+    assert menu.to_dict() == {'settings':{'var0':0,'var2':2,'var4':4}}
+
+def test_menu_remove_wildcards_required_error():
+    '''remove_wildcards leaves Menu unchanged if any wildcard is required'''
+    w = [ Wildcard('subject','01',{'required':True}),Wildcard('session','pre') ]
+    menu = Menu('settings',w)
+    try:
+        menu.remove_wildcards(['session','subject'])
+    except Exception as exception:
+        assert type(exception).__name__ == 'WildcardRequiredError'
+    else:
+        assert False
+    assert [ x.label for x in menu._wildcards ] == ['subject','session']
+
+#
+# Menu.set_values() tests
+#
+def test_menu_set_values():
+    '''set_values assigns all values, accepting generators for iterables'''
+    w = [
+        Wildcard('subject',None,{'iterable':True}),
+        Wildcard('session','pre')
+    ]
+    menu = Menu('bids',w)
+    menu.set_values({'subject':( f'{i:02d}' for i in range(1,4) ),'session':'post'})
+    assert menu.to_dict() == {'bids':{'subject':['01','02','03'],'session':'post'}}
+
+def test_menu_set_values_invalid_rollback():
+    '''no values are assigned if any value is invalid'''
+    w = [
+        Wildcard('subject','01',{'iterable':True}),
+        Wildcard('session','pre',{'valid':['pre','post']})
+    ]
+    menu = Menu('bids',w)
+    try:
+        menu.set_values({'subject':['02','03'],'session':'foo'})
+    except Exception as exception:
+        assert type(exception).__name__ == 'WildcardValueError'
+        assert menu.to_dict() == {'bids':{'subject':['01'],'session':'pre'}}
+    else:
+        assert False
+
 #
 # Menu.to_dict() tests
 #
@@ -127,6 +182,58 @@ def test_menu_to_dict_with_metadata():
     assert menu.to_dict(metadata=True) == d
 
 
+def test_menu_to_dict_tracks_changes():
+    '''repeated to_dict() reflects wildcard, label and membership changes'''
+    w = [
+        Wildcard('subject','01',{'iterable':True}),
+        Wildcard('session','pre')
+    ]
+    menu = Menu('bids',w)
+    assert menu.to_dict(metadata=True)['bids']['subject'] == ['01']
+    w[0].append('02')
+    w[1].set_metadata(help='session label')
+    d = menu.to_dict(metadata=True)['bids']
+    assert d['subject'] == ['01','02']
+    assert d['__metadata__']['session']['help'] == 'session label'
+    w[1].label = 'ses'
+    menu.add_wildcard(Wildcard('run',1))
+    menu.remove_wildcard('ses')
+    assert menu.to_dict() == {'bids':{'subject':['01','02'],'run':1}}
+    assert list(menu.to_dict(metadata=True)['bids']['__metadata__'].keys()) == ['bids','subject','run']
+
+def test_menu_to_dict_incremental_order():
+    '''wildcards added after a to_dict() call are serialised in Menu order'''
+    menu = Menu('bids',Wildcard('subject','01'))
+    menu.to_dict(metadata=True)
+    menu.to_dict()
+    labels = ['alpha','beta','gamma','delta','eps']
+    menu.add_wildcard([ Wildcard(x,1) for x in labels ])
+    assert list(menu.to_dict()['bids']) == ['subject'] + labels
+    assert list(menu.to_dict(metadata=True)['bids']['__metadata__']) == ['bids','subject'] + labels
+    menu.remove_wildcard('subject')
+    menu.add_wildcard(Wildcard('subject','02'))
+    assert list(menu.to_dict()['bids']) == labels + ['subject']
+    assert list(menu.to_dict(metadata=True)['bids']) == ['__metadata__'] + labels + ['subject']
+
+def test_menu_to_dict_returns_new_dict():
+    '''modifying a returned dict does not change later results'''
+    menu = Menu('bids',Wildcard('subject','01'))
+    menu.to_dict(metadata=True)['bids'].pop('__metadata__')
+    menu.to_dict()['bids']['subject'] = '02'
+    assert menu.to_dict() == {'bids':{'subject':'01'}}
+    assert '__metadata__' in menu.to_dict(metadata=True)['bids']
+
+def test_menu_relabel_duplicate_error():
+    '''relabelling a wildcard to a label already in its Menu fails'''
+    w = [Wildcard('subject','01'),Wildcard('session','pre')]
+    menu = Menu('bids',w)
+    try:
+        w[1].label = 'subject'
+        assert False
+    except Exception as e:
+        assert type(e).__name__ == 'WildcardValueError'
+    assert menu.get_wildcard('session') is w[1]
+
 #
 # Menu.reset() tests
 #
@@ -148,6 +255,19 @@ def test_menu_reset_with_defaults():
     menu.reset()
     assert menu.to_dict() == {'bids':{'subject':'foo','session':'bar'}}
 
+def test_menu_reset_copies_shared_defaults():
+    '''editing a value reset from a default leaves the shared metadata intact'''
+    metadata = {'iterable':True,'default':['a','b']}
+    w1 = Wildcard('w1','a',metadata)
+    w2 = Wildcard('w2','a',metadata)
+    menu = Menu('settings',[w1,w2,Wildcard('w4','a',{'valid':['a','b']})])
+    menu.reset()
+    w1.append('c')
+    menu.to_dict(metadata=True)['settings']['__metadata__']['w4']['valid'].append('c')
+    assert w2._metadata['default'] == ['a','b']
+    assert Wildcard('w5','b',{'valid':['a','b']})._metadata['valid'] == ['a','b']
+    assert Wildcard('w3','a',metadata)._metadata['default'] == ['a','b']
+
 #
 # Menu.factory_reset() tests
 #
@@ -168,3 +288,125 @@ def test_menu_factory_reset_force():
     menu = Menu('bids',w)
     menu.factory_reset(force=True)
     assert menu.to_dict() == {'bids':{}}
+
+def test_menu_factory_reset_all_required():
+    '''factory_reset resets every required wildcard, wherever it is in Menu'''
+    w = [
+        Wildcard('session','pre',{'default':'bar'}),
+        Wildcard('subject','01',{'required':True,'default':'foo'}),
+        Wildcard('run',1,{'required':True,'default':2})
+    ]
+    menu = Menu('bids',w)
+    menu.factory_reset()
+    assert menu.to_dict() == {'bids':{'subject':'foo','run':2}}
+    assert w[0]._owners == ()
+
+#
+# Menu.diff() / Menu.apply_patch() tests
+#
+def _diff_menus():
+    a = Menu('bids',[
+        Wildcard('subject',['01','02'],{'required':True,'iterable':True}),
+        Wildcard('session','pre'),
+        Wildcard('run',1)
+    ])
+    b = Menu('bids',[
+        Wildcard('subject',['01','02','03'],{'required':True,'iterable':True}),
+        Wildcard('session','post',{'help':'session label'}),
+        Wildcard('task','rest')
+    ])
+    return a,b
+
+def test_menu_diff():
+    '''diff lists only added, removed and changed wildcards'''
+    a,b = _diff_menus()
+    patch = a.diff(b)
+    for change in patch['changed'].values():
+        assert len(change.pop('base')) == 40
+    assert patch == {
+        'removed':['run'],
+        'added':{'task':{'value':'rest','metadata':{'required':False,'iterable':False,'wildcard_type':'Wildcard'}}},
+        'changed':{
+            'subject':{'extend':['03'],'length':2},
+            'session':{'value':'post','metadata':{'help':'session label','required':False,'iterable':False,'wildcard_type':'Wildcard'}}
+        }
+    }
+    assert a.diff(a) == {}
+
+def test_menu_apply_patch():
+    '''applying a diff makes Menus equal, updating wildcards in place'''
+    a,b = _diff_menus()
+    subject = a.get_wildcard('subject')
+    a.apply_patch(json.loads(json.dumps(a.diff(b))))
+    assert a.to_dict(metadata=True) == b.to_dict(metadata=True)
+    assert a.get_wildcard('subject') is subject
+    assert a.diff(b) == {}
+
+def test_menu_apply_patch_copies_values():
+    '''editing wildcards after applying a patch leaves the patch intact'''
+    a,b = _diff_menus()
+    b.get_wildcard('session').value = ['post']
+    b.get_wildcard('session').set_metadata(iterable=True)
+    b.add_wildcard(Wildcard('w',['a'],{'iterable':True}))
+    patch = a.diff(b)
+    before = json.loads(json.dumps(patch))
+    a.apply_patch(patch)
+    a.get_wildcard('w').append('b')
+    a.get_wildcard('session').append('pre')
+    assert patch == before
+
+def test_menu_apply_patch_stale_error():
+    '''a patch made from a different state is rejected without changes'''
+    a,b = _diff_menus()
+    patch = a.diff(b)
+    a.get_wildcard('subject').append('04')
+    before = a.to_dict(metadata=True)
+    try:
+        a.apply_patch(patch)
+    except Exception as exception:
+        assert type(exception).__name__ == 'PatchError'
+    else:
+        assert False
+    assert a.to_dict(metadata=True) == before
+
+def test_menu_apply_patch_changed_value_error():
+    '''value and metadata changes are rejected if the base state differs'''
+    a,b = _diff_menus()
+    patch = a.diff(b)
+    for edit in [lambda w: setattr(w,'value','mid'),lambda w: w.set_metadata(help='other')]:
+        a,_ = _diff_menus()
+        edit(a.get_wildcard('session'))
+        before = a.to_dict(metadata=True)
+        try:
+            a.apply_patch(patch)
+        except Exception as exception:
+            assert type(exception).__name__ == 'PatchError'
+        else:
+            assert False
+        assert a.to_dict(metadata=True) == before
+
+def test_menu_apply_patch_missing_label_error():
+    '''a patch removing or changing a missing wildcard is rejected'''
+    a,b = _diff_menus()
+    patch = a.diff(b)
+    for label in ['run','session']:
+        a,_ = _diff_menus()
+        a.remove_wildcard(label)
+        try:
+            a.apply_patch(patch)
+        except Exception as exception:
+            assert type(exception).__name__ == 'PatchError'
+        else:
+            assert False
+
+def test_menu_apply_patch_invalid_error():
+    '''an invalid value anywhere in a patch leaves the Menu unchanged'''
+    a,_ = _diff_menus()
+    before = a.to_dict(metadata=True)
+    try:
+        a.apply_patch({'removed':['run'],'changed':{'session':{'value':['a','b']}}})
+    except Exception as exception:
+        assert type(exception).__name__ == 'WildcardValueError'
+    else:
+        assert False
+    assert a.to_dict(metadata=True) == before
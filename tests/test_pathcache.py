@@ -0,0 +1,61 @@
+import pytest
+import os
+from neuromake.pathcache import PathCache
+
+def test_path_cache_exists():
+    cache = PathCache()
+    assert cache.exists('./tests/bids/ds003988')
+    assert not(cache.exists('./tests/bids/foo'))
+
+def test_path_cache_exists_many_siblings_single_listing():
+    '''sibling paths are resolved from one cached directory listing'''
+    cache = PathCache()
+    paths = ['tests/bids/ds003988/sub-36','tests/bids/ds003988/sub-38','tests/bids/ds003988/sub-99']
+    assert cache.exists_many(paths) == [True,True,False]
+    assert list(cache._listings.keys()) == [os.path.join(os.getcwd(),'tests/bids/ds003988')]
+
+def test_path_cache_exists_many_concurrent():
+    cache = PathCache(max_workers=4)
+    paths = ['tests/bids','tests/config/neuromake_test_config.json','neuromake/wildcard.py','foo/bar']
+    assert cache.exists_many(paths) == [True,True,True,False]
+
+def test_path_cache_special_paths():
+    cache = PathCache()
+    assert cache.exists_many(['.','..','/','']) == [True,True,True,True]
+
+def test_path_cache_new_file_not_false_negative(tmp_path):
+    '''a file created after its directory was listed is still found'''
+    cache = PathCache(ttl=3600)
+    assert not(cache.exists(tmp_path / 'new.txt'))
+    (tmp_path / 'new.txt').write_text('')
+    assert cache.exists(tmp_path / 'new.txt')
+
+def test_path_cache_ttl_expiry(tmp_path):
+    '''listings older than ttl are re-read'''
+    cache = PathCache(ttl=0)
+    (tmp_path / 'old.txt').write_text('')
+    assert cache.exists(tmp_path / 'old.txt')
+    os.remove(tmp_path / 'old.txt')
+    assert not(cache.exists(tmp_path / 'old.txt'))
+
+def test_path_cache_default_not_false_positive(tmp_path):
+    '''by default, a path deleted after its directory was listed is not found'''
+    cache = PathCache()
+    (tmp_path / 'old.txt').write_text('')
+    assert cache.exists(tmp_path / 'old.txt')
+    os.remove(tmp_path / 'old.txt')
+    assert not(cache.exists(tmp_path / 'old.txt'))
+
+def test_path_cache_refresh(tmp_path):
+    '''refresh re-lists directories within ttl'''
+    cache = PathCache(ttl=3600)
+    (tmp_path / 'old.txt').write_text('')
+    assert cache.exists(tmp_path / 'old.txt')
+    os.remove(tmp_path / 'old.txt')
+    assert cache.exists(tmp_path / 'old.txt')
+    assert cache.exists_many([tmp_path / 'old.txt'],refresh=True) == [False]
+
+def test_path_cache_broken_symlink(tmp_path):
+    os.symlink(tmp_path / 'missing',tmp_path / 'link')
+    cache = PathCache()
+    assert not(cache.exists(tmp_path / 'link'))
@@ -0,0 +1,56 @@
+import pytest
+import itertools as it
+from neuromake import sizing
+from neuromake.expand import Expansion
+from neuromake.wildcard import Wildcard, TemplateWildcard
+from neuromake.menu import Menu
+from neuromake.app import App
+
+BIDS = {
+    'subject':['01','02','03'],
+    'session':'pre',
+    'func_task':['rest','mid'],
+    'func_run':range(1,4),
+    'anat_suffix':['T1w','T2w'],
+    'fmap_acquisition':None,
+}
+
+def test_count_combinations_matches_product():
+    vals = [ v if isinstance(v,(list,range)) else [v] for v in BIDS.values() ]
+    assert sizing.count_combinations(BIDS) == len(list(it.product(*vals)))
+
+def test_count_combinations_exclude():
+    d = dict(BIDS)
+    assert sizing.count_combinations(d,exclude=('subject',)) == 12
+    assert d == BIDS
+
+def test_combinations_per_filetype():
+    assert sizing.combinations_per_filetype(BIDS,exclude=('subject',)) == {'func':6,'anat':2,'fmap':1}
+
+def test_count_template_matches_expansion():
+    t = ['sub-{subject}_task-{func_task}_run-{func_run}_bold.nii.gz','sub-{subject}_{anat_suffix}.nii.gz']
+    assert sizing.count_template(t,BIDS) == len(list(Expansion(t,BIDS))) == 24
+    assert sizing.count_template(t,BIDS,exclude=('subject',)) == 8
+
+def test_menu_n_combinations():
+    menu = Menu('bids',[ Wildcard(k,v,{'iterable':isinstance(v,(list,range))}) for k,v in BIDS.items() ])
+    assert menu.n_combinations() == 36
+    assert menu.n_combinations(per_subject=True) == 12
+    assert menu.n_combinations(['subject','func_task']) == 6
+    assert menu.n_combinations_per_filetype(per_subject=True) == {'func':6,'anat':2,'fmap':1}
+
+def test_app_plan_jobs():
+    bids = Menu('bids',[ Wildcard(k,v,{'iterable':isinstance(v,(list,range))}) for k,v in BIDS.items() ])
+    templates = Menu('templates',[
+        TemplateWildcard('func','sub-{subject}_task-{func_task}_run-{func_run}_bold.nii.gz'),
+        TemplateWildcard('anat','sub-{subject}_{anat_suffix}.nii.gz'),
+    ],{'wildcard_type':'TemplateWildcard'})
+    plan = App(name='my_pipeline',menu=[bids,templates]).plan_jobs(jobs_per_target=2)
+    assert plan == {
+        'n_subjects':3,
+        'per_filetype':{'func':6,'anat':2,'fmap':1},
+        'per_template':{'func':18,'anat':6},
+        'per_subject':{'func':6,'anat':2},
+        'n_targets':24,
+        'n_jobs':49,
+    }
@@ -0,0 +1,91 @@
+import pytest
+import threading
+import copy
+from neuromake.wildcard import Wildcard
+from neuromake.menu import Menu
+from neuromake.app import App
+
+def _app():
+    return App(name='my_pipeline',menu=[
+        Menu('bids',[
+            Wildcard('subject',['01','02'],{'iterable':True}),
+            Wildcard('run',range(1,4),{'iterable':True,'var_type':'int'})
+        ]),
+        Menu('settings',Wildcard('threads',1))
+    ])
+
+def test_snapshot_unchanged_by_edits():
+    '''a snapshot keeps the state it was taken in'''
+    app = _app()
+    before = app.to_dict(metadata=True)
+    snap = app.snapshot()
+    bids = app.get_menu('bids')
+    bids.get_wildcard('subject').append('03')
+    bids.remove_wildcard('run')
+    app.get_menu('settings').get_wildcard('threads').value = 8
+    app.add_menu(Menu('paths',Wildcard('root','/')))
+    assert snap.to_dict(metadata=True) == before
+    assert snap.to_dict() == {'my_pipeline':{'bids':{'subject':['01','02'],'run':[1,2,3]},'settings':{'threads':1}}}
+    assert snap.get_menu('bids').get_value('subject') == ['01','02']
+
+def test_snapshot_shares_unchanged_state():
+    '''snapshots without edits are reused, and unchanged menus are shared'''
+    app = _app()
+    snap = app.snapshot()
+    assert app.snapshot() is snap
+    app.get_menu('settings').get_wildcard('threads').value = 8
+    snap2 = app.snapshot()
+    assert snap2 is not snap
+    assert snap2.get_menu('bids') is snap.get_menu('bids')
+    assert snap2.get_menu('settings').get_value('threads') == 8
+
+def test_snapshot_restore():
+    '''restore undoes edits, keeping the existing wildcard objects'''
+    app = _app()
+    snap = app.snapshot()
+    subject = app.get_menu('bids').get_wildcard('subject')
+    subject.value = ['05']
+    app.remove_menu('settings')
+    app.restore(snap)
+    assert app.to_dict(metadata=True) == snap.to_dict(metadata=True)
+    assert app.get_menu('bids').get_wildcard('subject') is subject
+
+def test_snapshot_unchanged_by_edits_after_restore():
+    '''values restored from a snapshot are not shared with it'''
+    app = _app()
+    app.add_menu(Menu('params',Wildcard('k',[1,2],{'iterable':True})))
+    snap = app.snapshot()
+    before = copy.deepcopy((snap.to_dict(),snap.to_dict(metadata=True)))
+    app.remove_menu('params')
+    app.get_menu('bids').remove_wildcard('subject')
+    app.get_menu('settings').get_wildcard('threads').value = 8
+    app.restore(snap)
+    app.get_menu('params').get_wildcard('k').append(3)
+    app.get_menu('bids').get_wildcard('subject').append('03')
+    assert (snap.to_dict(),snap.to_dict(metadata=True)) == before
+    app.get_menu('bids').get_wildcard('subject').value = ['04']
+    app.restore(snap)
+    app.get_menu('bids').get_wildcard('subject').append('05')
+    assert (snap.to_dict(),snap.to_dict(metadata=True)) == before
+
+def test_snapshot_concurrent_readers():
+    '''readers see a fixed snapshot while a writer edits the App'''
+    app = _app()
+    snap = app.snapshot()
+    expected = snap.to_dict(metadata=True)
+    subject = app.get_menu('bids').get_wildcard('subject')
+    errors = []
+    def read():
+        for _ in range(200):
+            if snap.to_dict(metadata=True) != expected:
+                errors.append('changed')
+    readers = [ threading.Thread(target=read) for _ in range(4) ]
+    for t in readers:
+        t.start()
+    for i in range(200):
+        subject.append(f'{i:03d}')
+        app.snapshot()
+    for t in readers:
+        t.join()
+    assert errors == []
+    assert len(app.snapshot().get_menu('bids').get_value('subject')) == 202
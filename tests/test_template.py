@@ -0,0 +1,65 @@
+import pytest
+from neuromake.template import TemplatePlan, compile_template
+
+def test_compile_template_cached():
+    assert compile_template('sub-{subject}') is compile_template('sub-{subject}')
+
+def test_template_plan_segments():
+    plan = compile_template('sub-{subject}/sub-{subject}_task-{func_task}.nii.gz')
+    assert plan.literals == ('sub-','/sub-','_task-','.nii.gz')
+    assert plan.field_names == ('subject','func_task')
+
+def test_template_plan_render_matches_format():
+    templates = [
+        'sub-{subject}_task-{func_task}_bold.nii.gz',
+        '{subject}{func_run}',
+        'run-{func_run:02d}_{{literal}}_{subject!r}',
+        'sub-{subject}_task-{task.name}',
+    ]
+    class Task:
+        name = 'rest'
+    d = {'subject':'01','func_task':'rest','func_run':3,'task':Task(),'extra':'x'}
+    for t in templates:
+        assert compile_template(t).render(d) == t.format(**d)
+
+def test_template_plan_render_missing_key_error():
+    try:
+        compile_template('sub-{subject}_task-{func_task}').render({'subject':'01'})
+    except Exception as exception:
+        assert type(exception).__name__ == 'KeyError'
+    else:
+        assert False
+
+def test_template_plan_invalid_template_error():
+    try:
+        compile_template('sub-{subject')
+    except Exception as exception:
+        assert type(exception).__name__ == 'ValueError'
+    else:
+        assert False
+
+def test_template_plan_invalid_conversion_error():
+    '''an unknown conversion raises ValueError, as str.format does'''
+    try:
+        compile_template('{a!z}_x')
+    except Exception as exception:
+        assert type(exception).__name__ == 'ValueError'
+    else:
+        assert False
+    assert compile_template('{a!r}_x').render({'a':'b'}) == "'b'_x"
+
+def test_template_plan_match():
+    plan = compile_template('sub-{subject}/func/sub-{subject}_task-{func_task}_bold.nii.gz')
+    assert plan.match('sub-01/func/sub-01_task-rest_bold.nii.gz') == {'subject':'01','func_task':'rest'}
+
+def test_template_plan_match_no_match():
+    plan = compile_template('sub-{subject}/func/sub-{subject}_task-{func_task}_bold.nii.gz')
+    assert plan.match('sub-01/func/sub-01_task-rest_bold.json') is None
+    assert plan.match('sub-01/func/sub-02_task-rest_bold.nii.gz') is None
+    assert plan.match('x/sub-01/func/sub-01_task-rest_bold.nii.gz') is None
+
+def test_template_plan_match_many_round_trip():
+    plan = compile_template('sub-{subject}_task-{func_task}_run-{func_run}.nii.gz')
+    combos = [ {'subject':s,'func_task':t,'func_run':r} for s in ['01','02'] for t in ['rest','mid'] for r in ['1','2'] ]
+    paths = [ plan.render(d) for d in combos ] + ['README','sub-03_task-rest.nii.gz']
+    assert list(plan.match_many(paths)) == combos
@@ -0,0 +1,53 @@
+import pytest
+pytest.importorskip('nibabel')
+import neuromake.utils.utils as nu
+
+#multireplace
+def test_multireplace_pattern_cached():
+    nu._multireplace_pattern.cache_clear()
+    rep = {'func_':'','anat_':''}
+    assert nu.multireplace('func_task',rep) == 'task'
+    assert nu.multireplace('anat_run',dict(rep)) == 'run'
+    assert nu._multireplace_pattern.cache_info().hits == 1
+
+def test_multireplace_match_end_cached_separately():
+    rep = {'app':'zzz'}
+    assert nu.multireplace('appapp',rep) == 'zzzzzz'
+    assert nu.multireplace('appapp',rep,match_end=True) == 'appzzz'
+
+#multireplace_many
+def test_multireplace_many_main():
+    rep = {'ab':'z','bc':'y','.':' '}
+    strings = ['abcdef','bcd.e','xyz']
+    assert nu.multireplace_many(strings,rep) == [ nu.multireplace(s,rep) for s in strings ]
+
+def test_multireplace_many_match_end():
+    assert nu.multireplace_many(['recording','rec'],{'rec':'reconstruction'},match_end=True) == ['recording','reconstruction']
+
+#multireplace_dict_keys
+def test_multireplace_dict_keys_main():
+    d = {'func_task':'mid','anat_run':'1','subject':'01'}
+    assert nu.multireplace_dict_keys(d,{'func_':'','anat_':''}) == {'task':'mid','run':'1','subject':'01'}
+
+#get_bids_vars_dict
+def test_get_bids_vars_dict_main():
+    assert nu.get_bids_vars_dict('sub-1_ses-2_task-mid_acq-multiband_run-1_bold.nii.gz') == {'subject':'1','session':'2','func_task':'mid','func_acquisition':'multiband','func_run':'1','func_suffix':'bold','extension':'nii.gz'}
+
+def test_get_bids_vars_dict_add_prefix_false():
+    assert nu.get_bids_vars_dict('sub-1_ses-2_task-mid_acq-multiband_run-1_bold.nii.gz',add_prefix=False) == {'subject':'1','session':'2','task':'mid','acquisition':'multiband','run':'1','suffix':'bold','extension':'nii.gz'}
+
+def test_get_bids_vars_dict_physio():
+    assert nu.get_bids_vars_dict('sub-1_ses-2_task-mid_acq-multiband_run-1_recording-cardiac_physio.tsv.gz') == {'subject':'1','session':'2','func_task':'mid','func_acquisition':'multiband','func_run':'1','physio_suffix':'physio','extension':'tsv.gz','physio_recording':'cardiac'}
+
+#query_bids_layout
+def test_query_bids_layout_removes_prefixes():
+    class Layout:
+        def get(self,**kwargs):
+            return kwargs
+    d = {'subject':'01','func_task':'rest','dwi_direction':'AP'}
+    assert nu.query_bids_layout(Layout(),d) == {'subject':'01','task':'rest','direction':'AP'}
+
+def test_query_bids_layout_bidsindex():
+    from neuromake.bidsindex import BidsIndex
+    index = BidsIndex.from_paths('/data',['sub-01/func/sub-01_task-rest_bold.nii.gz','sub-01/dwi/sub-01_dir-AP_dwi.nii.gz'])
+    assert nu.query_bids_layout(index,{'subject':'01','dwi_direction':'AP'}) == ['/data/sub-01/dwi/sub-01_dir-AP_dwi.nii.gz']
@@ -1,5 +1,8 @@
 import pytest
+import gc
 import os
+import copy
+import pickle
 import neuromake as nm
 import neuromake.utils as nu
 import neuromake.exceptions as err
@@ -143,6 +146,10 @@ def test_wildcard_set_metadata_default_value_not_in_valid_error():
     else:
         assert False
 
+def test_wildcard_set_metadata_default_value_in_valid():
+    w = Wildcard('method',3,{'valid':[1,2,3,4],'default':2})
+    assert w._metadata['default'] == 2
+
 def test_wildcard_set_metadata_default_value_lt_min_val_error():
     '''"default value must be greater than min_val"'''
     try:
@@ -231,6 +238,15 @@ def test_wildcard_set_value_not_in_valid_list_error():
     else:
         assert False
 
+def test_wildcard_set_value_iterable_in_valid_list():
+    subjects = [ f'{i:04d}' for i in range(4000) ]
+    w = Wildcard('subject',subjects[::-1],{'iterable':True,'valid':subjects})
+    assert w.value == subjects[::-1]
+
+def test_wildcard_valid_list_order_kept_in_to_dict():
+    w = Wildcard('task','gng',{'valid':['rest','gng','mid']})
+    assert w.to_dict(metadata=True)['__metadata__']['task']['valid'] == ['rest','gng','mid']
+
 def test_wildcard_set_value_iterable():
     w = Wildcard('subject',['01','02','03','04'],{'iterable':True})
     assert w.value == ['01','02','03','04']
@@ -244,6 +260,171 @@ def test_wildcard_set_value_as_list_iterable_false_error():
     else:
         assert False
 
+"""
+TESTS FOR LAZY RANGE VALUES
+"""
+def test_wildcard_set_value_range():
+    w = Wildcard('run',range(1,5),{'iterable':True,'var_type':'int'})
+    assert isinstance(w.value,range)
+    assert list(w.value) == [1,2,3,4]
+
+def test_wildcard_set_value_range_validates_endpoints_only():
+    '''huge ranges validate against min_val/max_val without expanding'''
+    w = Wildcard('seed',range(0,10**12,7),{'iterable':True,'min_val':0,'max_val':10**12})
+    assert len(w.value) == len(range(0,10**12,7))
+
+def test_wildcard_set_value_range_higher_than_max_value_error():
+    try:
+        w = Wildcard('run',range(5,0,-1),{'iterable':True,'max_val':4})
+    except Exception as exception:
+        assert type(exception).__name__ == 'WildcardValueError'
+    else:
+        assert False
+
+def test_wildcard_set_value_range_not_int_var_type_error():
+    try:
+        w = Wildcard('run',range(1,5),{'iterable':True,'var_type':'str'})
+    except Exception as exception:
+        assert type(exception).__name__ == 'WildcardTypeError'
+    else:
+        assert False
+
+def test_wildcard_set_value_range_not_iterable_error():
+    try:
+        w = Wildcard('run',range(1,5))
+    except Exception as exception:
+        assert type(exception).__name__ == 'WildcardValueError'
+    else:
+        assert False
+
+def test_wildcard_range_to_dict():
+    '''ranges are expanded without metadata, serialised compactly with it'''
+    w = Wildcard('run',range(1,7,2),{'iterable':True})
+    assert w.to_dict() == {'run':[1,3,5]}
+    assert w.to_dict(metadata=True)['run'] == {'start':1,'stop':7,'step':2}
+
+def test_wildcard_range_from_spec():
+    w = Wildcard('run',{'start':1,'stop':7,'step':2},{'iterable':True})
+    assert w.value == range(1,7,2)
+
+def test_wildcard_range_append():
+    w = Wildcard('run',range(1,3),{'iterable':True})
+    w.append(5)
+    assert w.value == [1,2,5]
+
+"""
+TESTS FOR ARRAY-BACKED VALUES
+"""
+def test_wildcard_array_value():
+    np = pytest.importorskip('numpy')
+    w = Wildcard('fwhm',[4.0,6.0,8.0],{'iterable':True,'var_type':'float','array':True})
+    assert isinstance(w.value,np.ndarray)
+    assert w.to_dict() == {'fwhm':[4.0,6.0,8.0]}
+
+def test_wildcard_array_higher_than_max_value_error():
+    pytest.importorskip('numpy')
+    try:
+        w = Wildcard('fwhm',[4.0,16.0],{'iterable':True,'var_type':'float','array':True,'max_val':12.0})
+    except Exception as exception:
+        assert type(exception).__name__ == 'WildcardValueError'
+    else:
+        assert False
+
+def test_wildcard_array_type_mismatch_error():
+    pytest.importorskip('numpy')
+    try:
+        w = Wildcard('seed',[1.5,2.5],{'iterable':True,'var_type':'int','array':True})
+    except Exception as exception:
+        assert type(exception).__name__ == 'WildcardTypeError'
+    else:
+        assert False
+
+def test_wildcard_array_extend():
+    pytest.importorskip('numpy')
+    w = Wildcard('seed',range(3),{'iterable':True,'var_type':'int','array':True})
+    w.extend([3,4])
+    w.append(5)
+    assert w.to_dict() == {'seed':[0,1,2,3,4,5]}
+
+def test_wildcard_set_metadata_array_not_numeric_error():
+    '''"array" requires int or float var_type'''
+    try:
+        w = Wildcard('subject',['01'],{'iterable':True,'var_type':'str','array':True})
+    except Exception as exception:
+        assert type(exception).__name__ in ['TypeError','ImportError']
+    else:
+        assert False
+
+"""
+TESTS FOR COMPILED VALIDATION PLAN
+"""
+def test_wildcard_validation_plan_empty_without_constraints():
+    '''no per-element checks are compiled if no constraints are set'''
+    w = Wildcard('subject','01',{'iterable':True})
+    assert w._validation_plan == ()
+
+def test_wildcard_validation_plan_only_configured_checks():
+    '''one check is compiled per configured constraint'''
+    w = Wildcard('threshold',.5,{'var_type':'float','min_val':0,'max_val':1})
+    assert len(w._validation_plan) == 3
+
+def test_wildcard_validation_plan_recompiled_on_set_metadata():
+    '''updating metadata recompiles the validation plan'''
+    w = Wildcard('threshold',.5)
+    w.set_metadata(max_val=.6)
+    try:
+        w.value = .7
+    except Exception as exception:
+        assert type(exception).__name__ == 'WildcardValueError'
+    else:
+        assert False
+
+"""
+TESTS FOR SHARED METADATA
+"""
+def test_wildcard_identical_metadata_shared():
+    '''wildcards with identical metadata share one metadata object'''
+    w1 = Wildcard('subject','01',{'iterable':True,'var_type':'str'})
+    w2 = Wildcard('session','pre',{'iterable':True,'var_type':'str'})
+    assert w1._metadata is w2._metadata
+
+def test_wildcard_metadata_not_shared_across_types():
+    '''1, 1.0 and True are not interned as the same metadata'''
+    w1 = Wildcard('threshold',2,{'default':1})
+    w2 = Wildcard('threshold',2.0,{'default':1.0})
+    assert type(w1._metadata['default']) is int
+    assert type(w2._metadata['default']) is float
+
+def test_wildcard_metadata_immutable_error():
+    '''shared metadata cannot be changed in place'''
+    w = Wildcard('subject','01')
+    try:
+        w._metadata['required'] = True
+    except Exception as exception:
+        assert type(exception).__name__ == 'TypeError'
+    else:
+        assert False
+
+def test_wildcard_no_instance_dict():
+    w = PathWildcard('bids','./tests/bids/ds003988')
+    assert not(hasattr(w,'__dict__'))
+
+def test_wildcard_pickle_keeps_shared_metadata():
+    w1 = Wildcard('subject','01',{'iterable':True,'var_type':'str'})
+    w2 = pickle.loads(pickle.dumps(w1))
+    w3 = copy.deepcopy(w1)
+    assert w2.value == ['01'] and w3.value == ['01']
+    assert w2._metadata is w1._metadata and w3._metadata is w1._metadata
+
+def test_wildcard_shared_metadata_released():
+    '''shared metadata no longer used by any wildcard is dropped'''
+    from neuromake.wildcard import _SHARED_METADATA
+    w = Wildcard('subject','01',{'help':'released metadata test'})
+    w.set_metadata(help='edited')
+    del w
+    gc.collect()
+    assert not([ m for m in _SHARED_METADATA.values() if m['help'] in ('released metadata test','edited') ])
+
 """
 OTHER TESTS
 """
@@ -272,6 +453,32 @@ def test_wildcard_append_not_valid_error():
     else:
         assert False
 
+def test_wildcard_extend():
+    w = Wildcard('subject','01',{'iterable':True})
+    w.extend( f'{i:02d}' for i in range(2,5) )
+    assert w.to_dict() == {'subject':['01','02','03','04']}
+
+def test_wildcard_extend_not_iterable_error():
+    '''cannot extend wildcard if not specified as iterable'''
+    w = Wildcard('subject','01')
+    try:
+        w.extend(['02','03'])
+    except Exception as exception:
+        assert type(exception).__name__ == 'WildcardNotIterableError'
+    else:
+        assert False
+
+def test_wildcard_extend_not_valid_rollback():
+    '''wildcard is unchanged if any extended value is invalid'''
+    w = Wildcard('subject','01',{'iterable':True,'var_type':'str'})
+    try:
+        w.extend(['02',3,'04'])
+    except Exception as exception:
+        assert type(exception).__name__ == 'WildcardTypeError'
+        assert w.value == ['01']
+    else:
+        assert False
+
 def test_wildcard_to_dict_no_metadata():
     w = Wildcard('subject','01',{'iterable':True})
     assert w.to_dict() == {'subject':['01']}
@@ -292,10 +499,88 @@ def test_path_wildcard_invalid_filepath_error():
     else:
         assert False
 
+def test_path_wildcard_lazy_validation():
+    '''lazy path wildcards are only checked when the value is read'''
+    w = PathWildcard('bids','foo/bar/baz',validation='lazy')
+    try:
+        w.value
+    except Exception as exception:
+        assert type(exception).__name__ == 'PathNotExistError'
+    else:
+        assert False
+
+def test_path_wildcard_deleted_path_error(tmp_path):
+    '''a path deleted since it was last checked is reported missing'''
+    os.makedirs(tmp_path / 'data')
+    w = PathWildcard('a',str(tmp_path / 'data'))
+    os.rmdir(tmp_path / 'data')
+    for check in [lambda: PathWildcard('b',str(tmp_path / 'data')),w.check_paths]:
+        try:
+            check()
+        except Exception as exception:
+            assert type(exception).__name__ == 'PathNotExistError'
+        else:
+            assert False
+
+def test_path_wildcard_check_paths_refreshes(tmp_path):
+    '''check_paths() ignores directory listings cached within a ttl'''
+    os.makedirs(tmp_path / 'data')
+    ttl = PathWildcard.path_cache.ttl
+    PathWildcard.path_cache.ttl = 3600
+    try:
+        w = PathWildcard('a',str(tmp_path / 'data'))
+        os.rmdir(tmp_path / 'data')
+        try:
+            w.check_paths()
+        except Exception as exception:
+            assert type(exception).__name__ == 'PathNotExistError'
+        else:
+            assert False
+    finally:
+        PathWildcard.path_cache.ttl = ttl
+        PathWildcard.path_cache.clear()
+
+def test_path_wildcard_trusted_validation():
+    w = PathWildcard('bids','foo/bar/baz',validation='trusted')
+    assert w.value == 'foo/bar/baz'
+
+def test_path_wildcard_invalid_validation_error():
+    try:
+        w = PathWildcard('bids','./tests/bids/ds003988',validation='foo')
+    except Exception as exception:
+        assert type(exception).__name__ == 'ValueError'
+    else:
+        assert False
+
 def test_template_wildcard():
     w = TemplateWildcard('funcPrefix','sub-{sub}_task-{func_task}')
     assert w.value == 'sub-{sub}_task-{func_task}'
 
+def test_template_wildcard_invalid_conversion_error():
+    try:
+        w = TemplateWildcard('t','{a!z}_x')
+    except Exception as exception:
+        assert type(exception).__name__ == 'ValueError'
+    else:
+        assert False
+
+def test_template_wildcard_render():
+    w = TemplateWildcard('funcPrefix','sub-{sub}_task-{func_task}')
+    assert w.render(sub='01',func_task='rest') == 'sub-01_task-rest'
+
+def test_template_wildcard_plan():
+    w = TemplateWildcard('funcPrefix','sub-{sub}_task-{func_task}')
+    assert w.plan.field_names == ('sub','func_task')
+
+def test_template_wildcard_render_iterable():
+    w = TemplateWildcard('prefixes',['sub-{sub}','task-{func_task}'],{'iterable':True})
+    assert w.render(sub='01',func_task='rest') == ['sub-01','task-rest']
+
+def test_template_wildcard_match():
+    w = TemplateWildcard('prefixes',['sub-{sub}_bold','sub-{sub}_task-{func_task}'],{'iterable':True})
+    assert w.match('sub-01_task-rest') == {'sub':'01','func_task':'rest'}
+    assert list(w.match_many(['sub-01_bold','foo','sub-02_task-mid'])) == [{'sub':'01'},{'sub':'02','func_task':'mid'}]
+
 def test_template_wildcard_invalid_format_braces_error():
     try:
         w = TemplateWildcard('funcPrefix','sub-{sub}_task-{func_task}}')